@@ -0,0 +1,58 @@
+"""
+Compares ActivityFeatures.best_efforts, which finds the fastest segments of all requested distances with a vectorized
+two-pointer pass over the cumulative distance, with a brute-force reference that scans all (start, end) pairs.
+
+Usage: python -m benchmarks.best_efforts
+"""
+import timeit
+
+import numpy as np
+
+from benchmarks.generators import generate_stream
+from pysweat.features.activities import ActivityFeatures
+
+
+def _interpolated_seconds(seconds, distance, lower, upper, target_distance):
+    if distance[upper] == distance[lower]:
+        return seconds[upper]
+    return seconds[lower] + (target_distance - distance[lower]) / (distance[upper] - distance[lower]) * \
+        (seconds[upper] - seconds[lower])
+
+
+def brute_force_best_efforts(seconds, distance, segment_distances):
+    """Quadratic reference: for every observation, scans for the closest start before and end after it"""
+    best_times = []
+    for segment_distance in segment_distances:
+        best_time = np.inf
+        for i in range(len(distance)):
+            for j in range(i, -1, -1):
+                if distance[j] <= distance[i] - segment_distance:
+                    start = _interpolated_seconds(seconds, distance, j, min(j + 1, i), distance[i] - segment_distance)
+                    best_time = min(best_time, seconds[i] - start)
+                    break
+            for j in range(i, len(distance)):
+                if distance[j] >= distance[i] + segment_distance:
+                    end = _interpolated_seconds(seconds, distance, max(j - 1, i), j, distance[i] + segment_distance)
+                    best_time = min(best_time, end - seconds[i])
+                    break
+        best_times.append(best_time if np.isfinite(best_time) else np.nan)
+    return np.array(best_times)
+
+
+def main(sizes=(600, 1800, 3600), segment_distances=(400, 1000, 5000), repeat=3):
+    print('%12s %16s %15s %9s' % ('observations', 'brute force (s)', 'two-pointer (s)', 'speedup'))
+    for size in sizes:
+        stream_df = generate_stream(size)[['distance']]
+        seconds, distance = stream_df.index.values.astype(float), stream_df.distance.values
+
+        brute_force = lambda: brute_force_best_efforts(seconds, distance, segment_distances)
+        two_pointer = lambda: ActivityFeatures.best_efforts(stream_df, segment_distances).values
+        np.testing.assert_allclose(brute_force(), two_pointer(), rtol=1e-9)
+        brute_force_time = min(timeit.repeat(brute_force, number=1, repeat=1))
+        two_pointer_time = min(timeit.repeat(two_pointer, number=1, repeat=repeat))
+        print('%12d %16.5f %15.5f %8.1fx' % (size, brute_force_time, two_pointer_time,
+                                             brute_force_time / two_pointer_time))
+
+
+if __name__ == '__main__':
+    main()
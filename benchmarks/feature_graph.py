@@ -0,0 +1,32 @@
+"""
+Compares computing the GPS features of ActivityFeatures.gps_features one by one, each redoing the cleaning, projection
+and distances of the lat-long values, with computing them together, sharing those stages.
+
+Usage: python -m benchmarks.feature_graph
+"""
+import timeit
+
+import pandas as pd
+
+from benchmarks.generators import generate_stream
+from pysweat.features.activities import GPS_FEATURES, ActivityFeatures
+
+
+def main(sizes=(3600, 21600), repeat=3):
+    print('%12s %14s %14s %14s %9s' % ('observations', 'one by one (s)', 'together (s)', 'first only (s)', 'speedup'))
+    for size in sizes:
+        stream_df = generate_stream(size)[['latlng']]
+        one_by_one = lambda: pd.concat([ActivityFeatures.gps_features(stream_df, [feature_name])
+                                        for feature_name in GPS_FEATURES.features])
+        together = lambda: ActivityFeatures.gps_features(stream_df)
+        pd.testing.assert_series_equal(one_by_one(), together())
+        one_by_one_time = min(timeit.repeat(one_by_one, number=1, repeat=repeat))
+        together_time = min(timeit.repeat(together, number=1, repeat=repeat))
+        first_only = lambda: ActivityFeatures.gps_features(stream_df, GPS_FEATURES.features[:1])
+        first_only_time = min(timeit.repeat(first_only, number=1, repeat=repeat))
+        print('%12d %14.5f %14.5f %14.5f %8.1fx' % (size, one_by_one_time, together_time, first_only_time,
+                                                    one_by_one_time / together_time))
+
+
+if __name__ == '__main__':
+    main()
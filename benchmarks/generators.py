@@ -0,0 +1,79 @@
+"""
+Seeded generators of synthetic, but realistically shaped, athletes, activities and streams.
+"""
+import numpy as np
+import pandas as pd
+
+ACTIVITY_TYPES = ['Run', 'Ride', 'Swim']
+
+
+def generate_stream(duration_seconds=3600, seed=0, pause_probability=0.001, max_pause_seconds=300,
+                    smart_recording_probability=0.2, start_lat_long=(52.1, 5.3), speed=3.5):
+    """
+    Generates a 1 Hz activity stream with latlng, heartrate, watts and (cumulative) distance columns, indexed by the
+    number of seconds since the start. The route is a random walk with slowly changing heading, observations are
+    occasionally skipped (smart recording) and the stream contains pauses of up to max_pause_seconds.
+    """
+    random = np.random.RandomState(seed)
+    n = int(duration_seconds)
+
+    time_steps = np.ones(n, dtype=int)
+    time_steps[random.uniform(size=n) < smart_recording_probability] = 2
+    pauses = random.uniform(size=n) < pause_probability
+    time_steps[pauses] += random.randint(1, max_pause_seconds + 1, size=pauses.sum())
+    seconds = np.concatenate([[0], np.cumsum(time_steps[1:])])
+
+    heading = np.cumsum(random.normal(0, 0.05, size=n)) + random.uniform(0, 2 * np.pi)
+    step_meters = np.maximum(random.normal(speed, 0.3, size=n), 0) * np.minimum(time_steps, 2)
+    step_meters[0] = 0
+    meters_per_degree_lat = 111195.
+    meters_per_degree_lng = meters_per_degree_lat * np.cos(np.radians(start_lat_long[0]))
+    latitude = start_lat_long[0] + np.cumsum(step_meters * np.cos(heading)) / meters_per_degree_lat
+    longitude = start_lat_long[1] + np.cumsum(step_meters * np.sin(heading)) / meters_per_degree_lng
+
+    heartrate = np.clip(120 + 40 * (1 - np.exp(-np.arange(n) / 600.)) + np.cumsum(random.normal(0, 0.3, size=n)) +
+                        random.normal(0, 2, size=n), 60, 200).round()
+    watts = np.clip(random.normal(220, 40, size=n), 0, None).round()
+
+    return pd.DataFrame({
+        'latlng': np.column_stack([latitude, longitude]).round(6).tolist(),
+        'heartrate': heartrate,
+        'watts': watts,
+        'distance': np.cumsum(step_meters).round(1)
+    }, index=seconds)
+
+
+def generate_athletes(n_athletes=1000, seed=0):
+    random = np.random.RandomState(seed)
+    return pd.DataFrame({
+        'id': np.arange(1, n_athletes + 1),
+        'sex': random.choice(['M', 'F'], size=n_athletes)
+    })
+
+
+def generate_activities(athlete_df, years=3, activities_per_week=4, seed=0, end_date='2020-01-01'):
+    """
+    Generates activities for all athletes over the given number of years, with the columns loaded by
+    persistence.activities.load_activities that are used by the transformations and features.
+    """
+    random = np.random.RandomState(seed)
+    activity_counts = random.poisson(activities_per_week * 52 * years, size=len(athlete_df))
+    n = activity_counts.sum()
+
+    activity_types = random.choice(ACTIVITY_TYPES, size=n, p=[0.5, 0.4, 0.1])
+    base_speed = pd.Series({'Run': 3.2, 'Ride': 8.0, 'Swim': 0.9})[activity_types].values
+    average_speed = base_speed * random.lognormal(0, 0.15, size=n)
+    moving_time = random.gamma(4, 900, size=n).round()
+    start_offsets = random.uniform(0, years * 365.25 * 86400, size=n).round()
+
+    return pd.DataFrame({
+        'strava_id': np.arange(1, n + 1),
+        'athlete_id': np.repeat(athlete_df.id.values, activity_counts),
+        'type': activity_types,
+        'start_date_local': pd.Timestamp(end_date) - pd.to_timedelta(start_offsets, unit='s'),
+        'moving_time': moving_time,
+        'distance': (average_speed * moving_time).round(1),
+        'average_speed': average_speed,
+        'average_heartrate': random.normal(145, 12, size=n).round(1),
+        'flagged': False
+    })
@@ -0,0 +1,63 @@
+"""
+Compares smooth(use_index=True) and _moving_sum_filter(use_index=True), which are built on the time-indexed rolling
+window engine, with their previous implementations that converted the seconds index to an artificial DatetimeIndex.
+
+Usage: python -m benchmarks.rolling_windows
+"""
+import timeit
+
+import arrow
+import numpy as np
+import pandas as pd
+
+from pysweat.features.activities import _moving_sum_filter
+from pysweat.transformation.streams import smooth
+
+
+def _datetime_index_smooth(stream_df, window_size, smooth_colname):
+    tmp_df = stream_df.copy()
+    base_dt = arrow.get('2001-01-01')
+    tmp_df.index = [pd.Timestamp(base_dt.shift(seconds=int(s)).datetime) for s in stream_df.index]
+    return tmp_df[smooth_colname].rolling(window=str(window_size) + 's').mean().values
+
+
+def _datetime_index_moving_sum_filter(series, window_size, threshold):
+    series = series.copy()
+    base_dt = pd.Timestamp.now()
+    base_index_seconds = series.index
+    series.index = pd.DatetimeIndex(base_dt + pd.to_timedelta(base_index_seconds, unit='s'))
+    sums_ascending = series.rolling(f'{window_size}s').sum()
+    series_rev = series[::-1]
+    series_rev.index = pd.DatetimeIndex(base_dt + pd.to_timedelta(base_index_seconds[::-1], unit='s'))
+    sums_descending = series_rev.rolling(f'{window_size}s').sum()[::-1]
+    return np.where(np.maximum(sums_ascending.values, sums_descending.values) > threshold, series, 0)
+
+
+def _random_stream(n_observations, seed=42):
+    random = np.random.RandomState(seed)
+    seconds = np.cumsum(random.choice([1, 1, 1, 2, 5], size=n_observations))
+    return pd.DataFrame({'x': random.normal(size=n_observations),
+                         'deviation': random.uniform(size=n_observations)}, index=seconds)
+
+
+def main(sizes=(3600, 21600, 86400), window_size=3, threshold=1, repeat=3):
+    print('%12s %18s %14s %14s %9s' % ('observations', 'function', 'previous (s)', 'engine (s)', 'speedup'))
+    for size in sizes:
+        stream_df = _random_stream(size)
+        for function_name, previous, engine in [
+            ('smooth', lambda: _datetime_index_smooth(stream_df, window_size, 'x'),
+             lambda: smooth(stream_df, window_size=window_size, smooth_colnames=['x'], use_index=True).x_smooth.values),
+            ('_moving_sum_filter',
+             lambda: _datetime_index_moving_sum_filter(stream_df.deviation, window_size, threshold),
+             lambda: _moving_sum_filter(stream_df.deviation, window_size=window_size, threshold=threshold,
+                                        use_index=True).values)
+        ]:
+            np.testing.assert_allclose(previous(), engine(), rtol=1e-9, atol=1e-12)
+            previous_time = min(timeit.repeat(previous, number=1, repeat=repeat))
+            engine_time = min(timeit.repeat(engine, number=1, repeat=repeat))
+            print('%12d %18s %14.5f %14.5f %8.1fx' % (size, function_name, previous_time, engine_time,
+                                                    previous_time / engine_time))
+
+
+if __name__ == '__main__':
+    main()
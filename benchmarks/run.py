@@ -0,0 +1,116 @@
+"""
+Times the hot paths of pysweat on synthetic data of increasing size and writes the results as JSON, e.g.
+
+    python -m benchmarks.run --sizes small medium --output results.json
+    python -m benchmarks.run --compare results.json
+
+When comparing, the previous results are read from the given file and the ratio of the current to the previous time
+is reported per benchmark and size, i.e. ratios above 1 indicate regressions.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generators import generate_activities, generate_athletes, generate_stream
+from pysweat.features.activities import ActivityFeatures
+from pysweat.features.athletes import summary_stats_all
+from pysweat.transformation.activities import compute_moving_averages
+from pysweat.transformation.gps import lat_long_to_x_y
+from pysweat.transformation.streams import smooth
+from pysweat.transformation.training_load import training_load
+
+# size -> (stream duration in seconds, number of athletes)
+SIZES = {
+    'small': (600, 20),
+    'medium': (3600, 200),
+    'large': (21600, 1000)
+}
+
+
+def _stream_benchmarks(stream_df):
+    return {
+        'sum_of_turns': lambda: ActivityFeatures.sum_of_turns(stream_df[['latlng']]),
+        'max_value_maintained_for_n_minutes': lambda: ActivityFeatures.max_value_maintained_for_n_minutes(
+            stream_df[['heartrate']]),
+        'best_efforts': lambda: ActivityFeatures.best_efforts(stream_df[['distance']]),
+        'smooth': lambda: smooth(stream_df, smooth_colnames=['heartrate', 'watts'], use_index=True),
+        'lat_long_to_x_y': lambda: lat_long_to_x_y(stream_df)
+    }
+
+
+def _activity_benchmarks(athlete_df, activity_df):
+    return {
+        'compute_moving_averages': lambda: compute_moving_averages(activity_df, 'average_speed', [7, 28, 90]),
+        'summary_stats': lambda: summary_stats_all(athlete_df, activity_df, ['average_speed', 'average_heartrate']),
+        'training_load': lambda: training_load(activity_df, 'moving_time')
+    }
+
+
+def _environment():
+    try:
+        revision = subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL,
+                                           universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {'revision': revision, 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'machine': platform.machine()}
+
+
+def _time(function, repeat):
+    timings = timeit.repeat(function, number=1, repeat=repeat)
+    return {'best_seconds': min(timings), 'median_seconds': statistics.median(timings), 'repeat': repeat}
+
+
+def run(sizes=('small', 'medium'), repeat=3, seed=0):
+    results = []
+    for size in sizes:
+        stream_duration, n_athletes = SIZES[size]
+        stream_df = generate_stream(stream_duration, seed=seed)
+        for benchmark, function in _stream_benchmarks(stream_df).items():
+            results.append(dict(benchmark=benchmark, size=size, n=len(stream_df), **_time(function, repeat)))
+
+        athlete_df = generate_athletes(n_athletes, seed=seed)
+        activity_df = generate_activities(athlete_df, seed=seed)
+        for benchmark, function in _activity_benchmarks(athlete_df, activity_df).items():
+            results.append(dict(benchmark=benchmark, size=size, n=len(activity_df), **_time(function, repeat)))
+    return {'environment': _environment(), 'results': results}
+
+
+def compare(current, previous):
+    previous_results = {(result['benchmark'], result['size']): result for result in previous['results']}
+    print('%36s %8s %10s %12s %8s' % ('benchmark', 'size', 'n', 'best (s)', 'ratio'))
+    for result in current['results']:
+        previous_result = previous_results.get((result['benchmark'], result['size']))
+        ratio = result['best_seconds'] / previous_result['best_seconds'] if previous_result else float('nan')
+        print('%36s %8s %10d %12.5f %8.2f' % (result['benchmark'], result['size'], result['n'],
+                                              result['best_seconds'], ratio))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmarks pysweat on synthetic data.')
+    parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='path of the JSON file to write the results to')
+    parser.add_argument('--compare', help='path of a JSON file with previous results to compare with')
+    parsed_args = parser.parse_args(args)
+
+    results = run(parsed_args.sizes, repeat=parsed_args.repeat, seed=parsed_args.seed)
+    if parsed_args.output:
+        with open(parsed_args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if parsed_args.compare:
+        with open(parsed_args.compare) as previous_file:
+            compare(results, json.load(previous_file))
+    else:
+        compare(results, {'results': []})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Resumable backfill of stream-based activity features, e.g.
+
+    pysweat-backfill sum_of_turns --type Run --checkpoint sum_of_turns_run.json
+
+Activities of the given type that are missing the feature are processed in batches, ordered by start date. After each
+batch the computed features are saved and a watermark (start date and strava_id of the last processed activity) is
+written to the checkpoint file, such that a subsequent run resumes after the last completed batch.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from functools import partial
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient
+
+from pysweat.features.activities import ActivityFeatures
+from pysweat.persistence.activities import missing_feature_query, save_activities
+from pysweat.persistence.general import ensure_indexes
+from pysweat.persistence.prefetch import prefetch_streams
+from pysweat.persistence.streams import load_streams
+
+# feature name -> (stream type, function computing the feature from a 1-column stream dataframe)
+STREAM_FEATURES = {
+    'sum_of_turns': ('latlng', ActivityFeatures.sum_of_turns),
+    'max_heartrate_5min': ('heartrate', partial(ActivityFeatures.max_value_maintained_for_n_minutes, window_size=5)),
+    'max_heartrate_20min': ('heartrate', partial(ActivityFeatures.max_value_maintained_for_n_minutes, window_size=20)),
+    'max_watts_5min': ('watts', partial(ActivityFeatures.max_value_maintained_for_n_minutes, window_size=5)),
+    'max_watts_20min': ('watts', partial(ActivityFeatures.max_value_maintained_for_n_minutes, window_size=20)),
+}
+
+
+def _checkpoint_key(feature_name, activity_type):
+    return feature_name + '/' + activity_type
+
+
+def load_checkpoint(checkpoint_path, feature_name, activity_type):
+    """Returns the watermark as (start_date_local, strava_id) of the last processed activity, or None"""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as checkpoint_file:
+        watermark = json.load(checkpoint_file).get(_checkpoint_key(feature_name, activity_type))
+    return (pd.Timestamp(watermark['start_date_local']).to_pydatetime(), watermark['strava_id']) if watermark else None
+
+
+def save_checkpoint(checkpoint_path, feature_name, activity_type, watermark):
+    checkpoint = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    checkpoint[_checkpoint_key(feature_name, activity_type)] = {'start_date_local': watermark[0].isoformat(),
+                                                                'strava_id': watermark[1]}
+    with open(checkpoint_path + '.tmp', 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)  # atomic, i.e. never leaves a partially written checkpoint
+
+
+def _missing_feature_query(feature_name, activity_type, watermark):
+    query = missing_feature_query(feature_name, activity_type)
+    if watermark:
+        query['$or'] = [{'start_date_local': {'$gt': watermark[0]}},
+                        {'start_date_local': watermark[0], 'strava_id': {'$gt': watermark[1]}}]
+    return query
+
+
+def _compute_feature(feature_function, stream_df, strava_id):
+    if stream_df is None:
+        return np.nan
+    try:
+        return feature_function(stream_df)
+    except Exception as e:
+        logging.warning(f'Failed to compute feature for activity {strava_id}, returning NaN, {e}')
+        return np.nan
+
+
+def run_backfill(mongo, feature_name, activity_type='Run', batch_size=100, checkpoint_path=None, max_batches=None,
+                 stream_features=None, io_threads=None):
+    """
+    Computes and saves a stream-based feature for all activities of the given type that are missing the feature.
+    :param mongo: MongoDB client
+    :param feature_name: name of the feature, i.e. a key of stream_features
+    :param activity_type: activity type, e.g. 'Run' or 'Ride'
+    :param batch_size: number of activities loaded, computed and saved at once
+    :param checkpoint_path: optional path of a JSON file to store the watermark in, and to resume from
+    :param max_batches: optional maximum number of batches to process
+    :param stream_features: dict of feature name -> (stream type, feature function), defaults to STREAM_FEATURES
+    :param io_threads: optional number of threads prefetching the streams of a batch (in smaller chunks) while the
+    feature is computed, by default the streams of a batch are loaded at once
+    :return: dict with the number of processed activities, the number of activities for which the feature could not
+    be computed and the elapsed time in seconds
+    """
+    stream_type, feature_function = (stream_features or STREAM_FEATURES)[feature_name]
+    watermark = load_checkpoint(checkpoint_path, feature_name, activity_type)
+    processed, failed, batches = 0, 0, 0
+    start_time = time.time()
+
+    while max_batches is None or batches < max_batches:
+        activities = list(mongo.db.activities
+                          .find(_missing_feature_query(feature_name, activity_type, watermark),
+                                {'_id': False, 'strava_id': True, 'start_date_local': True})
+                          .sort([('start_date_local', 1), ('strava_id', 1)])
+                          .limit(batch_size))
+        if not activities:
+            break
+
+        strava_ids = [activity['strava_id'] for activity in activities]
+        streams = prefetch_streams(mongo, strava_ids, [stream_type], n_threads=io_threads,
+                                   chunk_size=max(1, batch_size // (4 * io_threads))) if io_threads \
+            else load_streams(mongo, strava_ids, [stream_type], chunk_size=batch_size)
+        features_df = pd.DataFrame([
+            (strava_id, _compute_feature(feature_function, stream_df, strava_id)) for strava_id, stream_df in streams
+        ], columns=['strava_id', feature_name])
+        save_activities(mongo, features_df, columns=[feature_name])
+
+        watermark = (activities[-1]['start_date_local'], activities[-1]['strava_id'])
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, feature_name, activity_type, watermark)
+        processed += len(activities)
+        failed += int(features_df[feature_name].isnull().sum())
+        batches += 1
+        elapsed = time.time() - start_time
+        logging.info('%s (%s): processed %d activities (%d failed) up to %s, %.1f activities/s',
+                     feature_name, activity_type, processed, failed, watermark[0], processed / elapsed)
+
+    return {'processed': processed, 'failed': failed, 'elapsed': time.time() - start_time}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='pysweat-backfill',
+                                     description='Computes stream-based features for activities missing them.')
+    parser.add_argument('feature_name', choices=sorted(STREAM_FEATURES))
+    parser.add_argument('--type', dest='activity_type', default='Run', help='activity type (default: Run)')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--max-batches', type=int, default=None)
+    parser.add_argument('--checkpoint', dest='checkpoint_path', default=None, help='path of the checkpoint file')
+    parser.add_argument('--io-threads', type=int, default=None, help='number of threads prefetching streams')
+    parser.add_argument('--ensure-indexes', action='store_true', help='create the indexes used by the queries first')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017')
+    parser.add_argument('--database', default='strava')
+    parsed_args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    mongo = SimpleNamespace(db=MongoClient(parsed_args.mongo_uri)[parsed_args.database])
+    if parsed_args.ensure_indexes:
+        logging.info('Ensured indexes %s', ensure_indexes(mongo))
+    result = run_backfill(mongo, parsed_args.feature_name, activity_type=parsed_args.activity_type,
+                          batch_size=parsed_args.batch_size, checkpoint_path=parsed_args.checkpoint_path,
+                          max_batches=parsed_args.max_batches, io_threads=parsed_args.io_threads)
+    logging.info('Done: %(processed)d activities processed, %(failed)d failed, in %(elapsed).1f s', result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from pysweat.instrumentation import instrumented, register_row_type
+
+
+def lat_long_array(lat_long_values):
+    """Converts a sequence of 2-element lat-long lists (or None) to an (n, 2) float array with NaN for missing values"""
+    nan_lat_long = (np.nan, np.nan)
+    return np.array([nan_lat_long if lat_long is None else lat_long for lat_long in lat_long_values],
+                    dtype=float).reshape(-1, 2)
+
+
+def _seconds(time):
+    """Converts time values to an int64 array of seconds, raising ValueError for values that are not whole seconds"""
+    time = np.asarray(time)
+    with np.errstate(invalid='ignore'):
+        seconds = time.astype(np.int64, copy=False)
+    if not np.array_equal(seconds, time):
+        raise ValueError('Expecting whole seconds as time values, got %s' % time[seconds != time][:5].tolist())
+    return seconds
+
+
+@register_row_type
+class CompactStream(object):
+    """
+    Array-backed alternative to stream dataframes, holding the observations of an activity as an int64 array of
+    seconds since the start, contiguous 1-dimensional float arrays per measurement (channel), and lat-long values as
+    (n, 2) float64 array instead of a column of 2-element lists.
+
+    Supports the subset of the dataframe interface used by the transformation and feature functions (index, columns,
+    item access, assign and len), so that those functions accept either a stream dataframe or a CompactStream.
+    """
+    __slots__ = ('time', 'channels', 'latlng')
+
+    def __init__(self, time, channels=None, latlng=None):
+        """
+        :param time: sorted, unique integer seconds since the start of the activity, fractional values raise a
+        ValueError instead of being truncated to (possibly duplicate) seconds
+        :param channels: optional dict of channel name -> 1-dimensional numpy array with one value per observation
+        :param latlng: optional numpy array of shape (n, 2) with lat-long values, NaN for missing observations
+        """
+        self.time = _seconds(time)
+        self.channels = dict(channels or {})
+        self.latlng = None if latlng is None else np.asarray(latlng, dtype=float).reshape(-1, 2)
+
+    @classmethod
+    def from_df(cls, stream_df, dtype=np.float64, lat_long_colname='latlng', lat_colname='lat', lng_colname='lng'):
+        """
+        Creates a CompactStream from a stream dataframe indexed by seconds since the start of the activity. Columns
+        that already have the given dtype are not copied.
+        :param stream_df: Pandas dataframe with measurement columns and either a column with 2-element lat-long lists
+        or separate latitude and longitude columns
+        :param dtype: dtype of the channels, e.g. np.float32 to halve their memory usage, or None to keep the dtypes of
+        the columns
+        """
+        if not stream_df.index.is_monotonic_increasing:
+            stream_df = stream_df.sort_index()
+
+        latlng = None
+        if lat_long_colname in stream_df:
+            latlng = lat_long_array(stream_df[lat_long_colname].values)
+        elif lat_colname in stream_df and lng_colname in stream_df:
+            latlng = np.column_stack([stream_df[lat_colname].values, stream_df[lng_colname].values]).astype(float)
+
+        return cls(stream_df.index.values, channels={
+            column: np.asarray(stream_df[column].values, dtype=dtype) for column in stream_df.columns
+            if column not in (lat_long_colname, lat_colname, lng_colname)
+        }, latlng=latlng)
+
+    @classmethod
+    def from_lists(cls, time, data_by_type, dtype=np.float64):
+        """
+        Creates a CompactStream from raw stream data (as stored per stream type), keeping the last observation in case
+        of non-unique timestamps.
+        :param time: list of seconds since the start of the activity
+        :param data_by_type: dict of stream type -> list of values, with lists of lat-long values for 'latlng'
+        """
+        time = _seconds(time)
+        order = np.argsort(time, kind='stable')
+        sorted_time = time[order]
+        last_of_second = order[np.append(sorted_time[1:] != sorted_time[:-1], True)]
+
+        return cls(time[last_of_second], channels={
+            stream_type: np.array([np.nan if value is None else value for value in data], dtype=dtype)[last_of_second]
+            for stream_type, data in data_by_type.items() if stream_type != 'latlng'
+        }, latlng=lat_long_array(data_by_type['latlng'])[last_of_second] if 'latlng' in data_by_type else None)
+
+    def to_df(self, lat_long_colname=None):
+        """
+        Converts to a stream dataframe indexed by seconds since the start of the activity.
+        :param lat_long_colname: if provided, lat-long values are added as column of 2-element lists with this name
+        (as loaded by persistence.streams), otherwise as lat and lng float columns
+        """
+        columns = dict(self.channels)
+        if self.latlng is not None and lat_long_colname:
+            columns[lat_long_colname] = [None if np.isnan(lat_long).any() else list(lat_long)
+                                         for lat_long in self.latlng]
+        elif self.latlng is not None:
+            columns['lat'], columns['lng'] = self.latlng[:, 0], self.latlng[:, 1]
+        return pd.DataFrame(columns, index=self.time, copy=False)
+
+    @property
+    def index(self):
+        return self.time
+
+    @property
+    def columns(self):
+        return list(self.channels) + ([] if self.latlng is None else ['latlng'])
+
+    @property
+    def nbytes(self):
+        return (self.time.nbytes + sum(values.nbytes for values in self.channels.values()) +
+                (0 if self.latlng is None else self.latlng.nbytes))
+
+    def to_numpy(self, columns=None):
+        """Returns the given channels (default all) as 2-dimensional array of shape (n, number of channels)"""
+        return np.column_stack([self.channels[column] for column in columns or self.channels]).astype(float)
+
+    def select(self, mask):
+        """Returns the observations selected by the given boolean mask (or integer positions)"""
+        return CompactStream(self.time[mask], channels={name: values[mask] for name, values in self.channels.items()},
+                             latlng=None if self.latlng is None else self.latlng[mask])
+
+    def assign(self, **channels):
+        """Returns a new CompactStream (sharing the existing arrays) with the given channels added or replaced"""
+        return CompactStream(self.time, channels=dict(self.channels, **{
+            name: np.asarray(values) for name, values in channels.items()
+        }), latlng=self.latlng)
+
+    def __getitem__(self, column):
+        return self.latlng if column == 'latlng' else self.channels[column]
+
+    def __contains__(self, column):
+        return column in self.channels or (column == 'latlng' and self.latlng is not None)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        return 'CompactStream(%d observations, columns=%s, %d bytes)' % (len(self), self.columns, self.nbytes)
+
+
+def _is_categorical_like(values, max_unique_ratio):
+    """Whether an object column holds (hashable) scalars with few distinct values relative to its length"""
+    non_null = values.dropna()
+    if len(non_null) == 0 or pd.api.types.infer_dtype(non_null) not in ('string', 'boolean', 'integer', 'floating',
+                                                                         'mixed-integer-float'):
+        return False
+    return non_null.nunique() <= max_unique_ratio * len(values)
+
+
+def _downcast_float(values, rtol):
+    """Returns the values as float32 if all (finite) values are within the relative tolerance, otherwise unchanged"""
+    downcast = values.astype(np.float32)
+    original, converted = values.values, downcast.values.astype(np.float64)
+    finite = np.isfinite(original)
+    if not np.array_equal(np.isfinite(converted), finite):
+        return values  # out of float32 range
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative_errors = np.abs(converted[finite] - original[finite]) / np.abs(original[finite])
+    return downcast if np.all(np.nan_to_num(relative_errors) <= rtol) else values
+
+
+def _encode_object_ids(object_ids):
+    """Splits the 12 bytes of ObjectIds into their 4-byte timestamp and 8-byte remainder, as unsigned integers"""
+    binaries = b''.join(object_id.binary for object_id in object_ids)
+    encoded = np.frombuffer(binaries, dtype=np.dtype([('timestamp', '>u4'), ('suffix', '>u8')]))
+    return encoded['timestamp'].astype(np.uint32), encoded['suffix'].astype(np.uint64)
+
+
+def object_ids(compact_df, id_colname='_id'):
+    """Returns the ObjectIds encoded by compact_frame(id_handling='encode') as list"""
+    return [ObjectId(int(timestamp).to_bytes(4, 'big') + int(suffix).to_bytes(8, 'big'))
+            for timestamp, suffix in zip(compact_df[id_colname + '_timestamp'], compact_df[id_colname + '_suffix'])]
+
+
+@instrumented()
+def compact_frame(documents_df, float_rtol=1e-6, max_unique_ratio=0.5, id_colname='_id', id_handling='drop',
+                  exclude=()):
+    """
+    Reduces the memory usage of a dataframe of documents, e.g. as loaded by load_activities, such that the
+    transformation and feature functions can process more activities at once:
+
+    - object columns with few distinct (scalar) values, e.g. type, are converted to category
+    - integer columns are downcast to the smallest signed integer type that holds their values
+    - float columns are downcast to float32 if all values are within the relative tolerance
+    - the _id column (ObjectIds) is dropped, or encoded as two unsigned integer columns [id_colname]_timestamp and
+      [id_colname]_suffix (see object_ids)
+
+    Grouping by categorical columns should use observed=True, to leave out combinations without activities, and
+    aggregates of float32 columns (e.g. summary stats) are float32 as well.
+    :param documents_df: Pandas dataframe
+    :param float_rtol: maximum relative difference between original and downcast float values
+    :param max_unique_ratio: maximum number of distinct values (relative to the number of rows) of object columns to
+    convert to category
+    :param id_colname: name of the ObjectId column
+    :param id_handling: 'drop', 'encode' or 'keep'
+    :param exclude: iterable of column names to leave unchanged
+    :return: compacted dataframe, see memory_report to compare with the original
+    """
+    if id_handling not in ('drop', 'encode', 'keep'):
+        raise ValueError('Expecting id_handling drop, encode or keep, got %s' % id_handling)
+    compact_columns = {}
+    for column in documents_df.columns:
+        values = documents_df[column]
+        if column in exclude:
+            compact_columns[column] = values
+        elif column == id_colname:
+            if id_handling == 'encode':
+                compact_columns[column + '_timestamp'], compact_columns[column + '_suffix'] = \
+                    _encode_object_ids(values)
+            elif id_handling == 'keep':
+                compact_columns[column] = values
+        elif values.dtype == object and _is_categorical_like(values, max_unique_ratio):
+            compact_columns[column] = values.astype('category')
+        elif pd.api.types.is_integer_dtype(values.dtype) and not pd.api.types.is_extension_array_dtype(values.dtype):
+            compact_columns[column] = pd.to_numeric(values, downcast='integer')
+        elif values.dtype == np.float64:
+            compact_columns[column] = _downcast_float(values, float_rtol)
+        else:
+            compact_columns[column] = values
+    return pd.DataFrame(compact_columns, index=documents_df.index, copy=False)
+
+
+def memory_report(original_df, compact_df):
+    """
+    Compares the (deep) memory usage of the columns of two dataframes, e.g. before and after compact_frame.
+    :return: Pandas dataframe indexed by column, with dtype and bytes before and after and a total row
+    """
+    report = pd.DataFrame({
+        'dtype_before': original_df.dtypes.astype(str),
+        'bytes_before': original_df.memory_usage(index=False, deep=True),
+    }).join(pd.DataFrame({
+        'dtype_after': compact_df.dtypes.astype(str),
+        'bytes_after': compact_df.memory_usage(index=False, deep=True)
+    }), how='outer').reindex(list(original_df.columns) + [column for column in compact_df.columns
+                                                          if column not in original_df.columns])
+    report[['dtype_before', 'dtype_after']] = report[['dtype_before', 'dtype_after']].fillna('')
+    report[['bytes_before', 'bytes_after']] = report[['bytes_before', 'bytes_after']].fillna(0).astype(int)
+    report.loc['total'] = ['', report.bytes_before.sum(), '', report.bytes_after.sum()]
+    report['ratio'] = report.bytes_after / report.bytes_before
+    return report[['dtype_before', 'dtype_after', 'bytes_before', 'bytes_after', 'ratio']]
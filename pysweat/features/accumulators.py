@@ -0,0 +1,158 @@
+"""
+Stateful accumulators computing stream features from consecutive chunks of a stream (e.g. of a live activity), with the
+same results as the corresponding ActivityFeatures functions on the complete stream, e.g.
+
+    turns = SumOfTurnsAccumulator(window_size=3)
+    for chunk_df in chunks:
+        turns.update(chunk_df)
+        print(turns.result())
+
+Only the observations within the feature's time windows are kept across chunks, such that memory usage does not grow
+with the length of the stream. Chunks have to be passed in order of time.
+"""
+import numpy as np
+import pandas as pd
+
+from pysweat.compact import CompactStream
+from pysweat.features.activities import filter_turn_deviations, turn_deviations
+from pysweat.transformation.gps import clean_lat_long, project_lat_long
+from pysweat.transformation.windows import trailing_time_window_minima
+
+
+def _check_order(seconds, last_second):
+    if len(seconds) and (np.any(np.diff(seconds) <= 0) or (last_second is not None and seconds[0] <= last_second)):
+        raise ValueError('Expecting chunks with unique, increasing seconds, following those of previous chunks')
+
+
+class MaxValuesMaintainedAccumulator(object):
+    """
+    Accumulates the maximum values of one or more measurements that are maintained for at least n minutes, see
+    ActivityFeatures.max_values_maintained_for_n_minutes. Keeps the observations of the last max(window_sizes)
+    minutes.
+    """
+
+    def __init__(self, window_sizes=(1, 5, 20, 60)):
+        """:param window_sizes: iterable of (integer) numbers of minutes for which a minimum value is maintained"""
+        self.window_sizes = list(window_sizes)
+        self.columns = None
+        self._maxima = np.full((len(self.window_sizes), 0), np.nan)
+        self._seconds = np.empty(0)
+        self._values = None
+
+    def update(self, stream_df):
+        """
+        :param stream_df: next chunk of the stream, i.e. Pandas dataframe with measurement columns and an index that
+        represents the number of seconds since the start of the activity, or a CompactStream
+        """
+        if isinstance(stream_df, CompactStream):
+            columns, values = list(stream_df.channels), stream_df.to_numpy()
+        else:
+            columns, values = list(stream_df.columns), stream_df.values.astype(float)
+        seconds = np.asarray(stream_df.index, dtype=float)
+        if self.columns is None:
+            self.columns = columns
+            self._maxima = np.full((len(self.window_sizes), len(columns)), np.nan)
+            self._values = np.empty((0, len(columns)))
+        elif columns != self.columns:
+            raise ValueError('Expecting chunks with columns %s, got %s' % (self.columns, columns))
+        _check_order(seconds, self._seconds[-1] if len(self._seconds) else None)
+        if len(seconds) == 0:
+            return self
+
+        carried = len(self._seconds)
+        self._seconds = np.concatenate([self._seconds, seconds])
+        self._values = np.concatenate([self._values, values])
+        window_minima = trailing_time_window_minima(self._seconds, self._values,
+                                                    [window_size * 60 for window_size in self.window_sizes])
+        with np.errstate(invalid='ignore'):
+            self._maxima = np.fmax(self._maxima, np.nanmax(window_minima[:, carried:], axis=1, initial=-np.inf))
+
+        keep = self._seconds >= self._seconds[-1] - max(self.window_sizes) * 60
+        self._seconds, self._values = self._seconds[keep], self._values[keep]
+        return self
+
+    def result(self):
+        """:return: Pandas dataframe indexed by window size, with one column per measurement"""
+        return pd.DataFrame(np.where(np.isinf(self._maxima), np.nan, self._maxima), index=self.window_sizes,
+                            columns=self.columns)
+
+
+class SumOfTurnsAccumulator(object):
+    """
+    Accumulates the sum of turns, see ActivityFeatures.sum_of_turns. Turns are final once the observations within
+    window_size seconds after them have been received, the turns of the last window_size seconds are computed as if
+    the stream ends with the last chunk. Keeps the observations of the last 2 * window_size seconds.
+
+    The x-y projection depends on the center of the latitude range, for results equal to those of the complete stream
+    it should be provided (e.g. from the bounding box of a planned route), otherwise the center of the first chunk
+    is used, which is an accurate approximation for streams that do not span large latitude ranges.
+    """
+
+    def __init__(self, window_size=3, noise_threshold=0, center_lat=None):
+        """
+        :param window_size: window size for filters, expressed in seconds
+        :param noise_threshold: the minimum amount of deviation within window_size seconds to count as a turn
+        :param center_lat: optional latitude (in degrees) to center the projection on
+        """
+        self.window_size = window_size
+        self.noise_threshold = noise_threshold
+        self.center_lat = center_lat
+        self._total = 0.
+        self._seconds = np.empty(0)
+        self._x = np.empty(0)
+        self._y = np.empty(0)
+        self._from_start = True  # whether the buffered observations start at the start of the stream
+        self._n_final = 0  # number of buffered observations of which the turns are included in _total
+
+    def _filtered_deviations(self):
+        deviation = turn_deviations(self._seconds, self._x, self._y, window_size=self.window_size)
+        return filter_turn_deviations(self._seconds, deviation, window_size=self.window_size,
+                                      noise_threshold=self.noise_threshold)
+
+    def update(self, lat_long_stream_df):
+        """
+        :param lat_long_stream_df: next chunk of the stream, i.e. Pandas dataframe with a latlng column and an index
+        that represents the number of seconds since the start of the activity, or a CompactStream
+        """
+        lat_long_clean_df, lat_long = clean_lat_long(lat_long_stream_df)
+        seconds = np.asarray(lat_long_clean_df.index, dtype=float)
+        _check_order(seconds, self._seconds[-1] if len(self._seconds) else None)
+        if len(seconds) == 0:
+            return self
+
+        if self.center_lat is None:
+            self.center_lat = lat_long[:, 0].min() + (lat_long[:, 0].max() - lat_long[:, 0].min()) / 2
+        x, y = project_lat_long(lat_long, center_lat=self.center_lat)
+        self._seconds = np.concatenate([self._seconds, seconds])
+        self._x = np.concatenate([self._x, x])
+        self._y = np.concatenate([self._y, y])
+
+        # turns are final once all observations within their forward window [t, t + window_size) are known
+        n_final = np.searchsorted(self._seconds, self._seconds[-1] - self.window_size, side='right')
+        if n_final > self._n_final:
+            self._total += self._filtered_deviations()[self._n_final:n_final].sum()
+            self._n_final = n_final
+        self._trim()
+        return self
+
+    def _trim(self):
+        """
+        Drops the buffered observations that are not needed anymore, i.e. those before the backward window of the
+        first non-final turn, the two observations before it (used by its velocities) and their smoothing windows.
+        """
+        if self._n_final == 0:
+            return
+        first_in_window = np.searchsorted(self._seconds, self._seconds[self._n_final] - self.window_size, side='right')
+        if self._from_start and first_in_window < 2:
+            return
+        first_needed = np.searchsorted(self._seconds, self._seconds[first_in_window - 2] - self.window_size,
+                                       side='right')
+        self._seconds, self._x, self._y = self._seconds[first_needed:], self._x[first_needed:], self._y[first_needed:]
+        self._n_final -= first_needed
+        self._from_start = self._from_start and first_needed == 0
+
+    def result(self):
+        """:return: the sum of turns of the stream so far, NaN if no observations have been received"""
+        if len(self._seconds) == 0:
+            return np.nan
+        return self._total + self._filtered_deviations()[self._n_final:].sum()
@@ -5,26 +5,22 @@ import logging
 import numpy as np
 import pandas as pd
 
-from pysweat.transformation.gps import lat_long_to_x_y
-from pysweat.transformation.similarities import cosine_similarity, cosine_to_deviation
+from pysweat.compact import CompactStream
+from pysweat.features.graph import STREAM, FeatureGraph
+from pysweat.instrumentation import instrumented
+from pysweat.transformation.gps import (EARTH_RADIUS_METERS, clean_lat_long, haversine_distances, lat_long_to_x_y,
+                                        project_lat_long)
+from pysweat.transformation.similarities import cosine_similarity, cosine_similarities, cosine_to_deviation
 from pysweat.transformation.streams import smooth, derivative, rolling_similarity
-from pysweat.transformation.windows import subtract_n_minutes
+from pysweat.transformation.windows import time_rolling, trailing_time_window_minima
 
 
 def _moving_sum_filter(series, window_size=3, threshold=0, use_index=False):
     if use_index:
         # assumes series has index representing seconds since start, window size is interpreted as seconds (and dynamic)
-        series = series.copy()  # prevent overwriting original index
-        base_dt = pd.Timestamp.now()  # pick arbitrary date as base for artificial DatetimeIndex
-        base_index_seconds = series.index
-
-        series.index = pd.DatetimeIndex(base_dt + pd.to_timedelta(base_index_seconds, unit='s'))
-        sums_ascending = series.rolling(f'{window_size}s').sum()
-
-        # Reverse rolling sum
-        series_rev = series[::-1]
-        series_rev.index = pd.DatetimeIndex(base_dt + pd.to_timedelta(base_index_seconds[::-1], unit='s'))
-        sums_descending = series_rev.rolling(f'{window_size}s').sum()[::-1]
+        sums_ascending = pd.Series(time_rolling(series.index.values, series.values, window_size, statistic='sum'))
+        sums_descending = pd.Series(time_rolling(series.index.values, series.values, window_size, statistic='sum',
+                                                 direction='forward'))
     else:
         # uses fixed window size
         sums_ascending = series.rolling(window=window_size, min_periods=1).sum()
@@ -33,54 +29,285 @@ def _moving_sum_filter(series, window_size=3, threshold=0, use_index=False):
     return pd.Series(np.where(np.maximum(sums_ascending.values, sums_descending.values) > threshold, series, 0))
 
 
+@instrumented()
+def turns_stream(lat_long_stream_df, window_size=3):
+    """
+    Returns the stream with all intermediate columns used to compute the sum of turns (x-y projection, smoothed x-y,
+    derivatives, cosine similarity and deviation). Serves as (debuggable) reference for sum_of_turns_kernel.
+    """
+    return (
+        lat_long_to_x_y(lat_long_stream_df)
+        .pipe(smooth, smooth_colnames=['x', 'y'], window_size=window_size, use_index=True)
+        .pipe(derivative, derivative_colnames=['x_smooth', 'y_smooth'])
+        .pipe(rolling_similarity, cosine_similarity, 'dx_smooth_dt', 'dy_smooth_dt')
+        .pipe(cosine_to_deviation, 'cosine_similarity_dx_smooth_dt_dy_smooth_dt')
+    )
+
+
+def turn_deviations(seconds, x, y, window_size=3):
+    """
+    Computes the deviation (turn severity) at each observation from projected x-y values, see sum_of_turns_kernel.
+    :return: numpy array of shape (n,), 0 for the first two observations
+    """
+    dt = np.diff(seconds)
+    velocities = np.column_stack([np.diff(time_rolling(seconds, x, window_size, statistic='mean')) / dt,
+                                  np.diff(time_rolling(seconds, y, window_size, statistic='mean')) / dt])
+
+    # the first deviation is undefined (no velocity), the second compares with the undefined first velocity
+    deviation = np.zeros(len(seconds))
+    deviation[2:] = np.nan_to_num(np.arccos(cosine_similarities(velocities[:-1], velocities[1:])) / np.pi)
+    return deviation
+
+
+def filter_turn_deviations(seconds, deviation, window_size=3, noise_threshold=0):
+    """Sets deviations to 0 unless the deviation within window_size seconds before or after exceeds the threshold"""
+    sums_ascending = time_rolling(seconds, deviation, window_size, statistic='sum')
+    sums_descending = time_rolling(seconds, deviation, window_size, statistic='sum', direction='forward')
+    return np.where(np.maximum(sums_ascending, sums_descending) > noise_threshold, deviation, 0)
+
+
+def sum_of_turns_kernel(seconds, lat_long, window_size=3, noise_threshold=0, center_lat=None):
+    """
+    Computes the sum of turns directly on arrays, numerically equivalent to filtering the deviation of turns_stream,
+    without intermediate dataframes.
+    :param seconds: sorted numpy array with the number of seconds since the start of the activity
+    :param lat_long: numpy array of shape (n, 2) with (non-null) lat-long values
+    :param center_lat: optional latitude (in degrees) to center the projection on, see gps.project_lat_long
+    :return: numpy scalar representing the total sum of turns
+    """
+    seconds = np.asarray(seconds, dtype=float)
+    x, y = project_lat_long(lat_long, center_lat=center_lat)
+    deviation = turn_deviations(seconds, x, y, window_size=window_size)
+    return filter_turn_deviations(seconds, deviation, window_size=window_size, noise_threshold=noise_threshold).sum()
+
+
+def best_efforts_kernel(seconds, distance, segment_distances):
+    """
+    Computes the shortest time in which each of the given distances was covered, interpolating linearly between
+    observations. The optimal segment either ends or starts at an observation, so both are evaluated: for each
+    observation the (latest) start of the segment ending there, and the (earliest) end of the segment starting there.
+    Both are found for all observations at once by searching the sorted cumulative distance, i.e. a vectorized
+    two-pointer pass.
+    :param seconds: sorted numpy array with the number of seconds since the start of the activity
+    :param distance: numpy array with the cumulative distance (in meters) at each observation
+    :param segment_distances: iterable of segment distances (in meters)
+    :return: numpy array with the best time (in seconds) per segment distance, NaN if the activity is shorter
+    """
+    seconds = np.asarray(seconds, dtype=float)
+    distance = np.maximum.accumulate(np.asarray(distance, dtype=float))
+    n = len(distance)
+    best_times = np.full(len(segment_distances), np.nan)
+
+    for k, segment_distance in enumerate(segment_distances):
+        if n < 2 or distance[-1] - distance[0] < segment_distance:
+            continue
+
+        # segments ending at an observation, starting in (starts, starts + 1]
+        ends = np.flatnonzero(distance >= distance[0] + segment_distance)
+        start_distance = distance[ends] - segment_distance
+        starts = np.searchsorted(distance, start_distance, side='right') - 1
+        next_starts = np.minimum(starts + 1, n - 1)
+        start_seconds = seconds[starts] + _interpolation_fraction(distance, starts, next_starts, start_distance) * \
+            (seconds[next_starts] - seconds[starts])
+
+        # segments starting at an observation, ending in (stops - 1, stops]
+        begins = np.flatnonzero(distance <= distance[-1] - segment_distance)
+        stop_distance = distance[begins] + segment_distance
+        stops = np.searchsorted(distance, stop_distance, side='left')
+        previous_stops = np.maximum(stops - 1, 0)
+        stop_seconds = seconds[previous_stops] + \
+            _interpolation_fraction(distance, previous_stops, stops, stop_distance) * \
+            (seconds[stops] - seconds[previous_stops])
+
+        best_times[k] = min((seconds[ends] - start_seconds).min(), (stop_seconds - seconds[begins]).min())
+    return best_times
+
+
+def _interpolation_fraction(distance, lower, upper, target_distance):
+    """Returns the fraction of the way from distance[lower] to distance[upper] at which target_distance lies"""
+    distance_deltas = distance[upper] - distance[lower]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(distance_deltas > 0, (target_distance - distance[lower]) / distance_deltas, 0)
+
+
+def best_effort_feature_name(segment_distance):
+    """Returns the feature name of the best effort over the given distance, e.g. best_effort_21097_5 for 21097.5 m"""
+    return 'best_effort_' + ('%f' % segment_distance).rstrip('0').rstrip('.').replace('.', '_')
+
+
+# features of the lat-long values, sharing their cleaning, projection and distances, see ActivityFeatures.gps_features
+GPS_FEATURES = FeatureGraph()
+
+
+@GPS_FEATURES.stage('observations', STREAM)
+def _gps_observations(lat_long_stream_df):
+    """Seconds since the start and (n, 2) lat-long values of the observations with lat-long values"""
+    lat_long_clean_df, lat_long = clean_lat_long(lat_long_stream_df)
+    if len(lat_long) == 0:
+        raise ValueError('No lat-long values')
+    return np.asarray(lat_long_clean_df.index, dtype=float), lat_long
+
+
+@GPS_FEATURES.stage('x_y', 'observations')
+def _gps_x_y(observations, center_lat=None):
+    return project_lat_long(observations[1], center_lat=center_lat)
+
+
+@GPS_FEATURES.stage('turn_deviations', 'observations', 'x_y')
+def _gps_turn_deviations(observations, x_y, window_size=3):
+    return turn_deviations(observations[0], *x_y, window_size=window_size)
+
+
+@GPS_FEATURES.stage('cumulative_distance', 'observations')
+def _gps_cumulative_distance(observations):
+    return np.concatenate([[0], np.cumsum(haversine_distances(observations[1]))])
+
+
+@GPS_FEATURES.feature('sum_of_turns', 'observations', 'turn_deviations')
+def _gps_sum_of_turns(observations, deviation, window_size=3, noise_threshold=0):
+    """See ActivityFeatures.sum_of_turns"""
+    return filter_turn_deviations(observations[0], deviation, window_size=window_size,
+                                  noise_threshold=noise_threshold).sum()
+
+
+@GPS_FEATURES.feature('gps_distance', 'cumulative_distance')
+def _gps_distance(cumulative_distance):
+    return cumulative_distance[-1]
+
+
+@GPS_FEATURES.feature('max_distance_from_start', 'x_y')
+def _gps_max_distance_from_start(x_y):
+    x, y = x_y
+    return np.hypot(x - x[0], y - y[0]).max() * EARTH_RADIUS_METERS
+
+
+@GPS_FEATURES.feature('average_gps_speed', 'observations', 'cumulative_distance')
+def _gps_average_speed(observations, cumulative_distance):
+    """Average speed (in meters per second) from the first to the last observation with lat-long values"""
+    seconds = observations[0]
+    if len(seconds) < 2 or seconds[-1] == seconds[0]:
+        raise ValueError('Less than two observations with lat-long values at different times')
+    return cumulative_distance[-1] / (seconds[-1] - seconds[0])
+
+
+@GPS_FEATURES.feature('gps_best_effort_1000', 'observations', 'cumulative_distance')
+def _gps_best_effort_1000(observations, cumulative_distance):
+    return best_efforts_kernel(observations[0], cumulative_distance, [1000])[0]
+
+
+@GPS_FEATURES.feature('gps_best_effort_5000', 'observations', 'cumulative_distance')
+def _gps_best_effort_5000(observations, cumulative_distance):
+    return best_efforts_kernel(observations[0], cumulative_distance, [5000])[0]
+
+
 class ActivityFeatures(object):
 
     @staticmethod
-    def sum_of_turns(lat_long_stream_df, window_size=3, noise_threshold=0):
+    @instrumented()
+    def sum_of_turns(lat_long_stream_df, window_size=3, noise_threshold=0, use_pipeline=False):
         """
         Returns the total number of 180 degree turns during an activity, i.e. an activity consisting of a single lap
         on a running track would return "2". A threshold can be provided to filter out relatively small route
         deviations that are not real turns. The window size represents the number of seconds a turn takes.
         :param lat_long_stream_df: Pandas dataframe with (at least) one column called 'latlng' consisting of
         2-element lists with lat-long values and index that represents number of seconds since the start of the
-        activity
+        activity, or a CompactStream with lat-long values
         :param window_size: window size for filters, expressed in seconds
         :type window_size: int, > 0
         :param noise_threshold: the minimum amount of deviation within window_size seconds to count as a turn
         (sensible values are between 0.25 and 0.5, or 45-degree to 90-degree turns).
         :type noise_threshold: float, in the range [0, 1]
+        :param use_pipeline: if True, computes the sum of turns with the (slower) dataframe pipeline in turns_stream
+        instead of the stages of GPS_FEATURES (see gps_features)
         :return: numpy scalar representing the total sum of turns in the stream, or NaN if the computation failed
         """
-        turns_stream_df = (
-            lat_long_to_x_y(lat_long_stream_df)
-            .pipe(smooth, smooth_colnames=['x', 'y'], window_size=window_size, use_index=True)
-            .pipe(derivative, derivative_colnames=['x_smooth', 'y_smooth'])
-            .pipe(rolling_similarity, cosine_similarity, 'dx_smooth_dt', 'dy_smooth_dt')
-            .pipe(cosine_to_deviation, 'cosine_similarity_dx_smooth_dt_dy_smooth_dt')
-        )
-
+        if not use_pipeline:
+            return ActivityFeatures.gps_features(lat_long_stream_df, ['sum_of_turns'], feature_kwargs={
+                'sum_of_turns': {'window_size': window_size, 'noise_threshold': noise_threshold}
+            }).sum_of_turns
         try:
-            return _moving_sum_filter(
-                turns_stream_df.deviation.fillna(0), use_index=True, window_size=window_size, threshold=noise_threshold
-            ).sum()
+            if isinstance(lat_long_stream_df, CompactStream):
+                lat_long_stream_df = lat_long_stream_df.to_df(lat_long_colname='latlng')
+            return _moving_sum_filter(turns_stream(lat_long_stream_df, window_size=window_size).deviation.fillna(0),
+                                      use_index=True, window_size=window_size, threshold=noise_threshold).sum()
         except ValueError as e:
             logging.warning(f'Failed to compute sum of turns, returning NaN, {e}')
             return np.nan
 
     @staticmethod
+    @instrumented()
+    def gps_features(lat_long_stream_df, feature_names=None, feature_kwargs=None, max_memo_size=None):
+        """
+        Computes several features from the lat-long values of an activity, sharing their intermediate stages (cleaned
+        observations, x-y projection, turn deviations and cumulative distance), see GPS_FEATURES and FeatureGraph.
+        :param lat_long_stream_df: Pandas dataframe with a latlng column (see sum_of_turns), or a CompactStream
+        :param feature_names: iterable of feature names, by default all GPS features: sum_of_turns, gps_distance,
+        max_distance_from_start, average_gps_speed, gps_best_effort_1000 and gps_best_effort_5000
+        :param feature_kwargs: optional dict of feature name -> dict of parameters, e.g.
+        {'sum_of_turns': {'window_size': 5, 'noise_threshold': 0.3}}, or {'max_distance_from_start': {'center_lat': 52}}
+        :param max_memo_size: optional maximum number of memoized stage values
+        :return: Pandas series indexed by feature name, with NaN for features of which the computation failed, e.g. to
+        assign as columns of an activity for save_activities
+        """
+        return GPS_FEATURES.compute(lat_long_stream_df, feature_names=feature_names, feature_kwargs=feature_kwargs,
+                                    max_memo_size=max_memo_size)
+
+    @staticmethod
+    @instrumented()
     def max_value_maintained_for_n_minutes(stream_df, window_size=5):
         """
         Returns the maximum value of a measurement that is maintained for at least n minutes, e.g.
         if during a low-intensity activity there was one intense interval of at least n minutes during which the
         minimum heart rate was x, then x is returned.
-        :param stream_df: Pandas dataframe with exactly one column representing the measurement
+        :param stream_df: Pandas dataframe (or CompactStream) with exactly one column representing the measurement
         :param window_size: (integer) number of minutes for which a minimum value needs to be maintained
         :return: the maximum value of the measurement that was maintained for at least n minutes
         """
         if len(stream_df.columns) != 1:
             raise ValueError('Expecting exactly 1 measurement column in stream dataframe, got %d' %
                              len(stream_df.columns))
-        min_index = stream_df.index.min()
-        return np.nanmax(
-            [stream_df.loc[subtract_n_minutes(second, minutes=window_size, minimum_value=min_index):second].min()
-             for second in stream_df.index])
+        return ActivityFeatures.max_values_maintained_for_n_minutes(
+            stream_df, window_sizes=[window_size]).iloc[0, 0]
+
+    @staticmethod
+    @instrumented()
+    def max_values_maintained_for_n_minutes(stream_df, window_sizes=(1, 5, 20, 60)):
+        """
+        Returns the maximum values of one or more measurements that are maintained for at least n minutes, for
+        several values of n at once, computed in a single pass over the stream.
+        :param stream_df: Pandas dataframe with one or more measurement columns and an index that represents the
+        number of seconds since the start of the activity, or a CompactStream (of which all channels are used)
+        :param window_sizes: iterable of (integer) numbers of minutes for which a minimum value needs to be maintained
+        :return: Pandas dataframe indexed by window size, with one column per measurement
+        """
+        if isinstance(stream_df, CompactStream):
+            seconds, values, columns = stream_df.time, stream_df.to_numpy(), list(stream_df.channels)
+        else:
+            if not stream_df.index.is_monotonic_increasing:
+                stream_df = stream_df.sort_index()
+            seconds, values, columns = stream_df.index.values, stream_df.values.astype(float), stream_df.columns
+        window_sizes = list(window_sizes)
+        window_minima = trailing_time_window_minima(seconds, values, [window_size * 60 for window_size in window_sizes])
+        return pd.DataFrame(np.nanmax(window_minima, axis=1), index=window_sizes, columns=columns)
+
+    @staticmethod
+    @instrumented()
+    def best_efforts(stream_df, segment_distances=(400, 1000, 5000, 10000, 21097.5), distance_colname='distance'):
+        """
+        Returns the shortest time (in seconds) in which each of the given distances was covered during an activity,
+        e.g. the fastest kilometer, interpolating between observations at the start and end of the segments.
+        :param stream_df: Pandas dataframe (or CompactStream) with a column with the cumulative distance in meters,
+        e.g. as loaded by load_stream(mongo, activity_id, 'distance'), and an index that represents the number of
+        seconds since the start of the activity
+        :param segment_distances: iterable of segment distances (in meters)
+        :param distance_colname: name of the distance column
+        :return: Pandas series with a best_effort_[distance] value per segment distance (see best_effort_feature_name),
+        NaN for distances longer than the activity, e.g. to assign as columns of an activity for save_activities
+        """
+        segment_distances = list(segment_distances)
+        distance = np.asarray(stream_df[distance_colname], dtype=float)
+        observed = ~np.isnan(distance)
+        seconds = np.asarray(stream_df.index)[observed]
+        order = np.argsort(seconds, kind='stable')
+        return pd.Series(best_efforts_kernel(seconds[order], distance[observed][order], segment_distances),
+                         index=[best_effort_feature_name(segment_distance) for segment_distance in segment_distances])
@@ -1,19 +1,93 @@
+import numpy as np
 import pandas as pd
 
+from pysweat.instrumentation import instrumented
 
+
+@instrumented()
 def summary_stats(athlete_df, activity_df, activity_measurement='average_speed'):
     if len(activity_df.type.unique()) > 1:
         raise ValueError("Expecting only 1 activity type, %d provided" % len(activity_df.type.unique()))
 
     activity_type = activity_df.type[0]
-    athlete_activity_stats = pd.DataFrame([(athlete_id,
-                                            athlete_activities[activity_measurement].mean(),
-                                            athlete_activities[activity_measurement].std(),
-                                            len(athlete_activities))
-                                           for athlete_id, athlete_activities in activity_df.groupby('athlete_id')],
-                                          columns=['id',
-                                                   activity_type.lower() + '_' + activity_measurement + '_' +
-                                                   'mean',
-                                                   activity_type.lower() + '_' + activity_measurement + '_' + 'std',
-                                                   activity_type.lower() + '_' + 'count'])
+    grouped_measurements = activity_df.groupby('athlete_id')[activity_measurement]
+    athlete_activity_stats = pd.DataFrame({
+        activity_type.lower() + '_' + activity_measurement + '_' + 'mean': grouped_measurements.mean(),
+        activity_type.lower() + '_' + activity_measurement + '_' + 'std': grouped_measurements.std(),
+        activity_type.lower() + '_' + 'count': grouped_measurements.size()
+    }).rename_axis('id').reset_index()
     return pd.merge(athlete_df, athlete_activity_stats, how='left', on='id')
+
+
+def _activity_stats(activity_df, activity_measurements):
+    """
+    Returns per-athlete mean, std and (non-null) count of the given measurements for all activity types, in columns
+    [type]_[measurement]_mean/std/count, and the number of activities per type in columns [type]_count.
+    """
+    grouped = activity_df.groupby(['athlete_id', 'type'], observed=True)
+    stats = grouped[list(activity_measurements)].agg(['mean', 'std', 'count'])
+    stats.columns = ['_'.join(column) for column in stats.columns]
+    stats['count'] = grouped.size()
+    stats = stats.unstack('type')
+    # groups of categorical types are in order of appearance, order the type columns as for object types
+    stats = stats.reindex(columns=pd.MultiIndex.from_product([stats.columns.get_level_values(0).unique(),
+                                                              sorted(stats.columns.get_level_values(1).unique())]))
+    stats.columns = [str(activity_type).lower() + '_' + stat for stat, activity_type in stats.columns]
+    return stats.rename_axis('id')
+
+
+@instrumented()
+def summary_stats_all(athlete_df, activity_df, activity_measurements=('average_speed',)):
+    """
+    Adds summary stats (mean, unbiased std and count) of the given measurements of all activity types to the athletes,
+    in columns [type]_[measurement]_mean/std/count, as well as the number of activities per type in [type]_count.
+    :param athlete_df: Pandas dataframe with athletes, with an id column
+    :param activity_df: Pandas dataframe with activities of any types, with athlete_id, type and measurement columns
+    :param activity_measurements: iterable of measurement names
+    :return: athlete dataframe with summary stats columns added, NaN for athletes without activities of a type
+    """
+    return pd.merge(athlete_df, _activity_stats(activity_df, activity_measurements).reset_index(), how='left',
+                    on='id')
+
+
+@instrumented()
+def update_summary_stats(athlete_stats_df, new_activity_df, activity_measurements=('average_speed',)):
+    """
+    Merges new activities into existing summary stats as computed by summary_stats_all, without requiring the
+    previous activities, by combining the stored count, mean and std with those of the new activities (using the
+    parallel variant of Welford's algorithm).
+    :param athlete_stats_df: Pandas dataframe with athletes and their summary stats so far
+    :param new_activity_df: Pandas dataframe with activities not yet included in the summary stats
+    :param activity_measurements: iterable of measurement names
+    :return: athlete dataframe with updated (or added) summary stats columns
+    """
+    new_stats = _activity_stats(new_activity_df, activity_measurements).reindex(athlete_stats_df.id)
+    updated_stats_df = athlete_stats_df.copy()
+
+    def existing(column_name):
+        return (athlete_stats_df[column_name].values.astype(float) if column_name in athlete_stats_df
+                else np.full(len(athlete_stats_df), np.nan))
+
+    for activity_type in new_activity_df.type.unique():
+        prefix = str(activity_type).lower() + '_'
+        type_count = np.nan_to_num(existing(prefix + 'count')) + np.nan_to_num(new_stats[prefix + 'count'].values)
+        updated_stats_df[prefix + 'count'] = np.where(type_count > 0, type_count, np.nan)
+        for measurement in activity_measurements:
+            prefix = str(activity_type).lower() + '_' + measurement + '_'
+            count_a = np.nan_to_num(existing(prefix + 'count'))
+            count_b = np.nan_to_num(new_stats[prefix + 'count'].values)
+            mean_a = np.nan_to_num(existing(prefix + 'mean'))
+            mean_b = np.nan_to_num(new_stats[prefix + 'mean'].values)
+            sum_squares_a = np.nan_to_num(existing(prefix + 'std') ** 2 * (count_a - 1))
+            sum_squares_b = np.nan_to_num(new_stats[prefix + 'std'].values ** 2 * (count_b - 1))
+
+            count = count_a + count_b
+            with np.errstate(divide='ignore', invalid='ignore'):
+                delta = mean_b - mean_a
+                mean = mean_a + delta * count_b / count
+                sum_squares = sum_squares_a + sum_squares_b + delta ** 2 * count_a * count_b / count
+                updated_stats_df[prefix + 'mean'] = np.where(count > 0, mean, np.nan)
+                updated_stats_df[prefix + 'std'] = np.where(count > 1, np.sqrt(sum_squares / (count - 1)), np.nan)
+            updated_stats_df[prefix + 'count'] = np.where(count > 0, count, np.nan)
+
+    return updated_stats_df
@@ -0,0 +1,159 @@
+"""
+Declarative graph of stream features and the intermediate stages they share. Stages and features are declared as
+functions of the values of other stages (the stream itself is the 'stream' stage), followed by optional keyword
+parameters:
+
+    graph = FeatureGraph()
+
+    @graph.stage('observations', 'stream')
+    def observations(stream_df): ...
+
+    @graph.stage('deviations', 'observations')
+    def deviations(observations, window_size=3): ...
+
+    @graph.feature('sum_of_turns', 'observations', 'deviations')
+    def sum_of_turns(observations, deviation, window_size=3, noise_threshold=0): ...
+
+    graph.compute(stream_df, ['sum_of_turns'], feature_kwargs={'sum_of_turns': {'window_size': 5}})
+
+The parameters of a feature are passed to the feature and to all stages it depends on that accept them, and a stage is
+memoized per name and parameter values, such that features with the same parameters share it. The executor computes
+each needed stage once per activity and frees it as soon as no remaining stage or feature needs it. Optionally, the
+number of memoized stages is bounded, in which case the least recently used stage is evicted (and recomputed if needed
+again) to limit memory usage.
+
+The GPS features of ActivityFeatures are declared in features.activities, see ActivityFeatures.gps_features.
+"""
+import inspect
+import logging
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+STREAM = 'stream'
+
+
+class FeatureGraph(object):
+    """Registry of stages and features, each a function of the values of the stages it declares as inputs"""
+
+    def __init__(self):
+        self.nodes = OrderedDict()  # name -> (function, input names, parameter name -> default)
+        self.features = []
+
+    def stage(self, name, *inputs):
+        """Returns a decorator registering the decorated function as the stage with the given name and inputs"""
+        def register(function):
+            if name == STREAM or name in self.nodes:
+                raise ValueError('Stage %s is already defined' % name)
+            unknown_inputs = [input_name for input_name in inputs
+                              if input_name != STREAM and input_name not in self.nodes]
+            if unknown_inputs:
+                raise ValueError('Stage %s depends on undefined stages %s' % (name, unknown_inputs))
+            parameters = OrderedDict((parameter.name, parameter.default) for parameter
+                                     in list(inspect.signature(function).parameters.values())[len(inputs):])
+            self.nodes[name] = (function, inputs, parameters)
+            return function
+        return register
+
+    def feature(self, name, *inputs):
+        """Returns a decorator registering the decorated function as the feature with the given name and inputs"""
+        def register(function):
+            self.stage(name, *inputs)(function)
+            self.features.append(name)
+            return function
+        return register
+
+    def dependencies(self, names):
+        """Returns the given stages and all stages they depend on, in order of computation"""
+        ordered = OrderedDict()
+
+        def visit(name):
+            if name == STREAM or name in ordered:
+                return
+            if name not in self.nodes:
+                raise ValueError('Unknown feature or stage %s' % name)
+            for input_name in self.nodes[name][1]:
+                visit(input_name)
+            ordered[name] = True
+
+        for name in names:
+            visit(name)
+        return list(ordered)
+
+    def _plan(self, kwargs_by_feature):
+        """
+        Returns the key of each feature, and the keys of all stages needed in order of computation mapped to the keys
+        of their inputs. A key consists of the name and parameter values of a stage, i.e. the feature's kwargs that
+        the stage accepts, complemented with the defaults of the stage.
+        """
+        feature_keys, plan = OrderedDict(), OrderedDict()
+
+        def visit(name, kwargs):
+            if name == STREAM:
+                return STREAM
+            _, inputs, parameters = self.nodes[name]
+            key = (name, tuple((parameter, kwargs.get(parameter, default))
+                               for parameter, default in parameters.items()
+                               if parameter in kwargs or default is not inspect.Parameter.empty))
+            if key not in plan:
+                plan[key] = [visit(input_name, kwargs) for input_name in inputs]
+            return key
+
+        for feature_name, kwargs in kwargs_by_feature.items():
+            accepted = set(parameter for name in self.dependencies([feature_name])
+                           for parameter in self.nodes[name][2])
+            unknown_kwargs = sorted(set(kwargs) - accepted)
+            if unknown_kwargs:
+                raise ValueError('Unknown parameters %s of feature %s' % (unknown_kwargs, feature_name))
+            feature_keys[feature_name] = visit(feature_name, kwargs)
+        return feature_keys, plan
+
+    def compute(self, stream_df, feature_names=None, feature_kwargs=None, max_memo_size=None):
+        """
+        Computes the given features of a single activity, computing the stages they share only once.
+        :param stream_df: Pandas dataframe or CompactStream, the value of the 'stream' stage
+        :param feature_names: iterable of feature names, by default all features of the graph
+        :param feature_kwargs: optional dict of feature name -> dict of parameters, passed to the feature and to the
+        stages it depends on that accept them, e.g. {'sum_of_turns': {'window_size': 5}}
+        :param max_memo_size: optional maximum number of memoized stage values
+        :return: Pandas series indexed by feature name, with NaN for features of which the computation failed
+        """
+        feature_names = list(self.features if feature_names is None else feature_names)
+        feature_keys, plan = self._plan({feature_name: (feature_kwargs or {}).get(feature_name, {})
+                                         for feature_name in feature_names})
+        features_by_key = {}
+        for feature_name, key in feature_keys.items():
+            features_by_key.setdefault(key, []).append(feature_name)
+        remaining_consumers = Counter(input_key for input_keys in plan.values() for input_key in input_keys)
+        memo = OrderedDict()
+
+        def value(key):
+            if key == STREAM:
+                return stream_df
+            if key in memo:
+                memo.move_to_end(key)
+                return memo[key]
+            function = self.nodes[key[0]][0]
+            result = function(*[value(input_key) for input_key in plan[key]], **dict(key[1]))
+            memo[key] = result
+            while max_memo_size is not None and len(memo) > max_memo_size:
+                memo.popitem(last=False)
+            return result
+
+        results = {}
+        for key, input_keys in plan.items():
+            try:
+                result = value(key)
+                results.update((feature_name, result) for feature_name in features_by_key.get(key, []))
+            except ValueError as e:
+                for feature_name in features_by_key.get(key, []):
+                    logging.warning(f'Failed to compute {feature_name}, returning NaN, {e}')
+                    results[feature_name] = np.nan
+            for input_key in input_keys:
+                remaining_consumers[input_key] -= 1
+                if remaining_consumers[input_key] == 0:
+                    memo.pop(input_key, None)
+            if remaining_consumers[key] == 0:
+                memo.pop(key, None)
+        return pd.Series([results[name] for name in feature_names], index=feature_names, dtype=float)
@@ -0,0 +1,99 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from pysweat.compact import lat_long_array
+
+
+def _stream_to_arrays(stream_df):
+    """
+    Converts a stream dataframe to plain numpy arrays, e.g. a column of lat-long lists to an (n, 2) float array with
+    NaN for missing values
+    """
+    return stream_df.index.values, {
+        column: lat_long_array(stream_df[column].values) if stream_df[column].dtype == object
+        else stream_df[column].values
+        for column in stream_df.columns
+    }
+
+
+def _arrays_to_stream(index, columns):
+    return pd.DataFrame({
+        column: [None if np.isnan(row).any() else list(row) for row in values] if values.ndim > 1 else values
+        for column, values in columns.items()
+    }, index=index)
+
+
+def _compute_chunk(feature_function, feature_kwargs, chunk):
+    results = []
+    for activity_id, index, columns, error in chunk:
+        if error is not None:
+            results.append((activity_id, np.nan, error))
+            continue
+        try:
+            results.append((activity_id, feature_function(_arrays_to_stream(index, columns), **feature_kwargs), None))
+        except Exception as e:
+            results.append((activity_id, np.nan, str(e)))
+    return results
+
+
+def _work_item_arrays(activity_id, stream_df):
+    """Returns the activity id with its stream as arrays, or with the error if the stream cannot be converted"""
+    try:
+        return (activity_id,) + _stream_to_arrays(stream_df) + (None,)
+    except Exception as e:
+        return activity_id, None, None, str(e)
+
+
+def _chunks(work_items, chunk_size):
+    work_items = iter(work_items)
+    chunk = list(islice(work_items, chunk_size))
+    while chunk:
+        yield [_work_item_arrays(activity_id, stream_df) for activity_id, stream_df in chunk]
+        chunk = list(islice(work_items, chunk_size))
+
+
+def map_activity_features(feature_function, work_items, feature_name=None, n_workers=None, chunk_size=16,
+                          **feature_kwargs):
+    """
+    Computes a per-activity stream feature for many activities in parallel, using a pool of worker processes. Streams
+    are sent to the workers as plain numpy arrays, in chunks of activities. At most two chunks per worker are in
+    flight at any time, such that work items can be generated lazily (e.g. by load_streams).
+    :param feature_function: picklable function computing the feature from a stream dataframe, e.g.
+    ActivityFeatures.sum_of_turns
+    :param work_items: iterable of (activity_id, stream_df) tuples, activities with stream_df None are skipped
+    :param feature_name: name of the feature column, defaults to the name of feature_function
+    :param n_workers: number of worker processes, defaults to the number of CPUs, 1 computes in the current process
+    :param chunk_size: number of activities sent to a worker at once
+    :param feature_kwargs: keyword arguments passed to feature_function, e.g. window_size
+    :return: Pandas dataframe with strava_id and feature columns, in order of completion, with NaN for activities for
+    which the computation failed
+    """
+    feature_name = feature_name or feature_function.__name__
+    n_workers = n_workers or os.cpu_count()
+    chunks = _chunks(((activity_id, stream_df) for activity_id, stream_df in work_items if stream_df is not None),
+                     chunk_size)
+
+    results = []
+    if n_workers == 1:
+        for chunk in chunks:
+            results.extend(_compute_chunk(feature_function, feature_kwargs, chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            in_flight = set()
+            for chunk in chunks:
+                if len(in_flight) >= 2 * n_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    results.extend(result for future in done for result in future.result())
+                in_flight.add(executor.submit(_compute_chunk, feature_function, feature_kwargs, chunk))
+            results.extend(result for future in in_flight for result in future.result())
+
+    for activity_id, _, error in results:
+        if error is not None:
+            logging.warning(f'Failed to compute {feature_name} for activity {activity_id}, returning NaN, {error}')
+    return pd.DataFrame([(activity_id, value) for activity_id, value, _ in results],
+                        columns=['strava_id', feature_name])
@@ -0,0 +1,138 @@
+"""
+Opt-in timing of the pipeline stages, i.e. the public persistence, transformation and feature functions, e.g.
+
+    with profile() as stages:
+        ActivityFeatures.sum_of_turns(load_stream(mongo, activity_id, 'latlng'))
+    print(stages.report())
+
+Outside of a profile context, instrumented functions only check whether any profile is active before calling the
+original function.
+"""
+import functools
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# stage name -> instrumented function
+INSTRUMENTED = {}
+
+_active_profiles = []
+_lock = threading.Lock()
+_row_types = (pd.DataFrame, pd.Series)
+
+
+def register_row_type(row_type):
+    """Class decorator registering a type of which the number of rows is its length, e.g. CompactStream"""
+    global _row_types
+    _row_types += (row_type,)
+    return row_type
+
+
+def _rows(value):
+    """
+    Returns the number of rows of a dataframe, series, array or registered row type, None for other values. Only these
+    types are inspected, since e.g. pymongo collections answer any attribute lookup and cannot be tested for truth.
+    """
+    if isinstance(value, _row_types):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.shape[0] if value.ndim else None
+    return None
+
+
+def _first_rows(args, kwargs):
+    for value in list(args) + list(kwargs.values()):
+        rows = _rows(value)
+        if rows is not None:
+            return rows
+    return None
+
+
+class Profile(object):
+    """
+    Aggregates the calls of instrumented stages while active: number of calls, wall time (including time spent in
+    nested instrumented stages) and the number of rows of the first dataframe/array argument and of the result.
+    :param callback: optional function called after each call of a stage with stage, seconds, rows_in and rows_out
+    (None if not a dataframe or array)
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stats = {}
+
+    def record(self, stage, seconds, rows_in, rows_out):
+        with _lock:
+            stage_stats = self.stats.setdefault(stage, dict(calls=0, total_seconds=0., max_seconds=0., rows_in=0,
+                                                            rows_out=0))
+            stage_stats['calls'] += 1
+            stage_stats['total_seconds'] += seconds
+            stage_stats['max_seconds'] = max(stage_stats['max_seconds'], seconds)
+            stage_stats['rows_in'] += rows_in or 0
+            stage_stats['rows_out'] += rows_out or 0
+        if self.callback is not None:
+            self.callback(stage, seconds, rows_in, rows_out)
+
+    def report(self):
+        """
+        :return: Pandas dataframe indexed by stage with calls, total_seconds, mean_seconds, max_seconds, rows_in and
+        rows_out columns, ordered by total_seconds (descending)
+        """
+        report_df = pd.DataFrame.from_dict(
+            self.stats, orient='index',
+            columns=['calls', 'total_seconds', 'max_seconds', 'rows_in', 'rows_out']).rename_axis('stage')
+        report_df.insert(2, 'mean_seconds', report_df.total_seconds / report_df.calls)
+        return report_df.sort_values('total_seconds', ascending=False)
+
+
+class profile(object):
+    """
+    Context manager recording the instrumented stages called within its body (in any thread of this process, but not
+    in worker processes, e.g. of features.parallel). Profiles can be nested, each one records all calls made while it
+    is active.
+    :param callback: optional function called after each call of a stage, see Profile
+    """
+
+    def __init__(self, callback=None):
+        self.profile = Profile(callback)
+
+    def __enter__(self):
+        with _lock:
+            _active_profiles.append(self.profile)
+        return self.profile
+
+    def __exit__(self, *exc_info):
+        with _lock:
+            _active_profiles.remove(self.profile)
+        return False
+
+
+def instrumented(stage=None):
+    """
+    Decorator registering a function as pipeline stage, such that its calls are recorded by active profiles.
+    :param stage: name of the stage, defaults to the module (without the pysweat prefix) and name of the function
+    """
+    def decorator(function):
+        stage_name = stage or '%s.%s' % (function.__module__.replace('pysweat.', '', 1), function.__qualname__)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _active_profiles:
+                return function(*args, **kwargs)
+
+            rows_in = _first_rows(args, kwargs)
+            result = None
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+                return result
+            finally:
+                seconds = time.perf_counter() - start
+                rows_out = _rows(result)
+                for active_profile in list(_active_profiles):
+                    active_profile.record(stage_name, seconds, rows_in, rows_out)
+
+        INSTRUMENTED[stage_name] = wrapper
+        return wrapper
+    return decorator
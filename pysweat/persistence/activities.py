@@ -1,53 +1,181 @@
 from pymongo import UpdateOne
 import pandas as pd
 import numpy as np
-import json
 import logging
 
 from pymongo.errors import BulkWriteError
 
+from pysweat.instrumentation import instrumented
+from pysweat.persistence.general import load_documents
 
-def load_activities(mongo, **query):
-    return pd.DataFrame(list(mongo.db.activities.find(query)))
+# Compact dtypes for commonly used activity fields, e.g. load_activities(mongo, dtypes=ACTIVITY_DTYPES)
+ACTIVITY_DTYPES = dict({'type': 'category', 'start_date_local': 'datetime64[ns]'}, **{
+    measurement: 'float32' for measurement in ['distance', 'moving_time', 'elapsed_time', 'total_elevation_gain',
+                                               'average_speed', 'max_speed', 'average_heartrate', 'max_heartrate',
+                                               'average_watts', 'kilojoules', 'suffer_score']
+})
 
 
-def __should_write_field(key, value):
-    if key != 'strava_id':
+@instrumented()
+def load_activities(mongo, fields=None, dtypes=None, chunksize=None, **query):
+    """
+    Loads activities matching the query (given as keyword arguments) as dataframe.
+    :param fields: optional list of fields to load (projection)
+    :param dtypes: optional dict of column name -> dtype, see ACTIVITY_DTYPES
+    :param chunksize: if provided, returns a generator of dataframes with at most chunksize activities each
+    """
+    return load_documents(mongo.db.activities, query, fields=fields, dtypes=dtypes, chunksize=chunksize)
+
+
+def _write_mask(column):
+    """Returns boolean array indicating which values should be written, i.e. all values except float NaNs"""
+    if column.dtype.kind == 'f':
+        return ~np.isnan(column.values)
+    elif column.dtype == object or column.dtype.name == 'category':
+        return np.array([not (isinstance(value, float) and np.isnan(value)) for value in column.tolist()], dtype=bool)
+    return np.ones(len(column), dtype=bool)
+
+
+def _changed_mask(column, original_column):
+    """Returns boolean array indicating which values differ from the original values, treating NaN as equal"""
+    values, original_values = column.to_numpy(), original_column.to_numpy()
+    return ~((values == original_values) | (pd.isnull(values) & pd.isnull(original_values)))
+
+
+def _bulk_write_summary(strava_ids, result=None, details=None):
+    if details is not None:
+        return {'matched': details.get('nMatched', 0),
+                'modified': details.get('nModified', 0),
+                'upserted': details.get('nUpserted', 0),
+                'failed_ids': [strava_ids[error['index']] for error in details.get('writeErrors', [])]}
+    return {'matched': result.matched_count,
+            'modified': result.modified_count,
+            'upserted': result.upserted_count,
+            'failed_ids': []}
+
+
+def activity_updates(activities_df, columns=None, original_df=None):
+    """
+    Returns the fields to set per activity as list of (strava_id, fields) tuples, leaving out NaN values, values equal
+    to those in original_df (if provided) and activities without any fields to set.
+    """
+    columns = [column for column in (columns if columns is not None else activities_df.columns)
+               if column != 'strava_id']
+    strava_ids = activities_df.strava_id.tolist()
+    if original_df is not None:
+        original_df = original_df.set_index('strava_id').reindex(activities_df.strava_id)
+
+    values_by_column = {}
+    write_masks = {}
+    for column in columns:
+        write_mask = _write_mask(activities_df[column])
+        if original_df is not None and column in original_df:
+            write_mask &= _changed_mask(activities_df[column], original_df[column])
+        values_by_column[column] = activities_df[column].tolist()
+        write_masks[column] = write_mask
+
+    updates = [(strava_id, {column: values_by_column[column][i] for column in columns if write_masks[column][i]})
+               for i, strava_id in enumerate(strava_ids)]
+    return [(strava_id, fields) for strava_id, fields in updates if fields]
+
+
+@instrumented()
+def save_activities(mongo, activities_df, columns=None, original_df=None, chunk_size=1000):
+    """
+    Upserts activities by strava_id, setting only non-NaN values. Writes are sent as unordered bulk writes per chunk of
+    activities, such that a failing activity does not prevent the others from being written.
+    :param mongo: MongoDB client
+    :param activities_df: Pandas dataframe with activities, including a strava_id column
+    :param columns: optional subset of columns to write, e.g. newly computed features, by default all columns
+    :param original_df: optional dataframe with the activities as loaded, only values that differ from the original
+    values (matched by strava_id) are written
+    :param chunk_size: number of activities per bulk write
+    :return: list with a summary per chunk with the number of matched, modified and upserted activities and the
+    strava_ids of activities that failed to be written
+    """
+    updates = activity_updates(activities_df, columns=columns, original_df=original_df)
+
+    summaries = []
+    for start in range(0, len(updates), chunk_size):
+        chunk = updates[start:start + chunk_size]
+        chunk_strava_ids = [strava_id for strava_id, _ in chunk]
         try:
-            return not np.isnan(value)
-        except TypeError:
-            return True
-    else:
-        return False
-
-
-def save_activities(mongo, activities_df):
-    try:
-        mongo.db.activities.bulk_write([
-            UpdateOne({'strava_id': record['strava_id']},
-                      {'$set': {key: value for (key, value) in record.items()
-                                if __should_write_field(key, value)}},
-                      upsert=True)
-            for record in activities_df.to_dict(orient='record')
-        ])
-    except BulkWriteError as bwe:
-        logging.error('Failed to persist (updated) activities: %s', str(bwe.details))
+            result = mongo.db.activities.bulk_write([UpdateOne({'strava_id': strava_id}, {'$set': fields}, upsert=True)
+                                                     for strava_id, fields in chunk], ordered=False)
+            summaries.append(_bulk_write_summary(chunk_strava_ids, result=result))
+        except BulkWriteError as bwe:
+            logging.error('Failed to persist (updated) activities: %s', str(bwe.details))
+            summaries.append(_bulk_write_summary(chunk_strava_ids, details=bwe.details))
+    return summaries
 
 
 def get_activity_types(mongo):
     return mongo.db.activities.find().distinct('type')
 
 
+def missing_feature_query(feature_name, activity_type='Run', athlete_id=None):
+    """Returns the query matching (non-suspicious, non-flagged) activities of the given type without the feature"""
+    query = {'type': activity_type, 'suspicious': {'$exists': False}, 'flagged': False,
+             feature_name: {'$exists': False}}
+    if athlete_id:
+        query['athlete_id'] = athlete_id
+    return query
+
+
+def missing_features_query(feature_names, activity_types=None, athlete_id=None):
+    """
+    Returns the query matching (non-suspicious, non-flagged) activities without any of the features
+    :param activity_types: optional list of activity types, by default all types
+    """
+    query = {'suspicious': {'$exists': False}, 'flagged': False,
+             '$or': [{feature_name: {'$exists': False}} for feature_name in feature_names]}
+    if activity_types is not None:
+        query['type'] = {'$in': list(activity_types)}
+    if athlete_id:
+        query['athlete_id'] = athlete_id
+    return query
+
+
 def get_first_activity_without_feature_for_type(mongo, feature_name, activity_type='Run', athlete_id=None):
     """Returns the datetime of the first activity (in time) of the given type for which the given feature does not
     exist. If athlete_id is provided, returns only the datetime for that athlete."""
-    athlete_id_filter_json = """, "athlete_id": %s""" % athlete_id
-    match_expression_json = """{"$match": {"type": "%s",
-                                        "suspicious": {"$exists": false},
-                                        "flagged": false,
-                                        "%s": {"$exists": false}
-                                        %s}}""" % \
-                            (activity_type, feature_name, athlete_id_filter_json if athlete_id else "")
-    return mongo.db.activities.aggregate([json.loads(match_expression_json),
-                                          {"$group": {"_id": "$athlete_id",
-                                                      "first_date": {"$min": "$start_date_local"}}}])
+    return mongo.db.activities.aggregate([{'$match': missing_feature_query(feature_name, activity_type, athlete_id)},
+                                          {'$group': {'_id': '$athlete_id',
+                                                      'first_date': {'$min': '$start_date_local'}}}])
+
+
+def missing_feature_backlog_df(backlog_df, feature_names):
+    """Converts per athlete/type rows with [i]_first_date and [i]_count columns to one row per missing feature"""
+    columns = ['athlete_id', 'type', 'feature', 'first_date', 'count']
+    backlog_df = pd.concat([
+        backlog_df[['athlete_id', 'type', '%d_first_date' % i, '%d_count' % i]]
+        .set_axis(['athlete_id', 'type', 'first_date', 'count'], axis=1)
+        .assign(feature=feature_name)
+        for i, feature_name in enumerate(feature_names)
+    ]) if len(backlog_df) else pd.DataFrame(columns=columns)
+    return backlog_df[backlog_df['count'] > 0][columns].sort_values(['feature', 'type', 'athlete_id'])\
+        .reset_index(drop=True)
+
+
+def get_missing_feature_backlog(mongo, feature_names, activity_types=None, athlete_id=None):
+    """
+    Returns, for many features and activity types at once, the date of the first (non-suspicious, non-flagged)
+    activity without the feature and the number of such activities per athlete and type, using a single aggregation.
+    :param mongo: MongoDB client
+    :param feature_names: list of feature names
+    :param activity_types: optional list of activity types, by default all types
+    :param athlete_id: optional athlete id to restrict the backlog to
+    :return: Pandas dataframe with athlete_id, type, feature, first_date and count columns, with a row per athlete, type
+    and feature for which at least one activity misses the feature
+    """
+    feature_names = list(feature_names)
+    match = missing_features_query(feature_names, activity_types, athlete_id)
+    group = {'_id': {'athlete_id': '$athlete_id', 'type': '$type'}}
+    for i, feature_name in enumerate(feature_names):
+        missing = {'$eq': [{'$type': '$' + feature_name}, 'missing']}
+        group['%d_first_date' % i] = {'$min': {'$cond': [missing, '$start_date_local', None]}}
+        group['%d_count' % i] = {'$sum': {'$cond': [missing, 1, 0]}}
+
+    backlog_df = pd.DataFrame([dict(group_result.pop('_id'), **group_result) for group_result in
+                               mongo.db.activities.aggregate([{'$match': match}, {'$group': group}])])
+    return missing_feature_backlog_df(backlog_df, feature_names)
@@ -1,8 +1,16 @@
-import pandas as pd
+from pysweat.instrumentation import instrumented
+from pysweat.persistence.general import load_documents
 
 
-def load_athletes(mongo, **query):
-    return pd.DataFrame(list(mongo.db.athletes.find(query)))
+@instrumented()
+def load_athletes(mongo, fields=None, dtypes=None, chunksize=None, **query):
+    """
+    Loads athletes matching the query (given as keyword arguments) as dataframe.
+    :param fields: optional list of fields to load (projection)
+    :param dtypes: optional dict of column name -> dtype, e.g. {'sex': 'category'}
+    :param chunksize: if provided, returns a generator of dataframes with at most chunksize athletes each
+    """
+    return load_documents(mongo.db.athletes, query, fields=fields, dtypes=dtypes, chunksize=chunksize)
 
 
 def get_athlete_ids(mongo):
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+_FILE_SUFFIX = '.npy'
+_SEPARATOR = '~'  # never part of safe names, such that file names split unambiguously
+_VERSION_TOKEN = re.compile(r'^(any|[0-9a-f]{16})$')
+
+
+def _version_token(version):
+    return 'any' if version is None else hashlib.sha1(repr(version).encode('utf-8')).hexdigest()[:16]
+
+
+def _safe_name(value):
+    return re.sub(r'[^A-Za-z0-9_.-]', '-', str(value))
+
+
+def _parse_file_name(file_name):
+    """Returns the (activity_id, stream_type) key of a cached stream file, or None for other files"""
+    parts = file_name[:-len(_FILE_SUFFIX)].split(_SEPARATOR) if file_name.endswith(_FILE_SUFFIX) else []
+    return tuple(parts[:2]) if len(parts) == 3 and all(parts[:2]) and _VERSION_TOKEN.match(parts[2]) else None
+
+
+class StreamCache(object):
+    """
+    Local on-disk cache for streams, keyed by (activity_id, stream_type). Each stream is stored as a single
+    uncompressed numpy file holding a structured array with the time index and the decoded values (e.g. an (n, 2)
+    float array for lat-long streams), which is memory-mapped on read. The least recently used streams are evicted
+    once the total size exceeds max_bytes. Cached streams are tagged with a version (e.g. derived from the source
+    documents), a lookup with a different version counts as a miss and invalidates the cached stream. The version used
+    by load_stream consists of the metadata and data length of the source documents, such that in-place updates of
+    the data that keep its length (and no other field) leave a stale stream in the cache, use invalidate for those.
+    """
+
+    def __init__(self, directory, max_bytes=2 ** 30, validate=True):
+        """
+        :param directory: directory to store the cached streams in, created if it does not exist
+        :param max_bytes: size budget for the cache on disk
+        :param validate: whether the source streams should be checked for changes when loading through the cache
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.validate = validate
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (activity_id, stream_type) -> (file name, size), least recently used first
+
+        os.makedirs(directory, exist_ok=True)
+        file_names = [file_name for file_name in os.listdir(directory) if _parse_file_name(file_name)]
+        for file_name in sorted(file_names, key=lambda name: os.path.getmtime(os.path.join(directory, name))):
+            self._entries[_parse_file_name(file_name)] = (file_name, os.path.getsize(self._path(file_name)))
+
+    @staticmethod
+    def _key(activity_id, stream_type):
+        return _safe_name(activity_id), _safe_name(stream_type)
+
+    def _path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    @property
+    def size_bytes(self):
+        return sum(size for _, size in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, activity_id_and_stream_type):
+        return self._key(*activity_id_and_stream_type) in self._entries
+
+    def get(self, activity_id, stream_type, version=None):
+        """
+        Returns the cached stream as 1-column dataframe indexed by time, or None if the stream is not cached (or was
+        cached with another version).
+        """
+        key = self._key(activity_id, stream_type)
+        entry = self._entries.get(key)
+        if entry and version is not None and not entry[0].endswith(_version_token(version) + _FILE_SUFFIX):
+            self.invalidate(activity_id, stream_type)
+            entry = None
+        if not entry:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        os.utime(self._path(entry[0]))  # persist recency for subsequent sessions
+        stream = np.load(self._path(entry[0]), mmap_mode='r')
+        data = stream['data']
+        return pd.DataFrame({stream_type: data.tolist() if data.ndim > 1 else data}, index=stream['time'])
+
+    def put(self, activity_id, stream_type, stream_df, version=None):
+        """Stores a 1-column stream dataframe indexed by time, evicting least recently used streams if needed"""
+        values = np.asarray(stream_df[stream_type].tolist()) if stream_df[stream_type].dtype == object \
+            else stream_df[stream_type].values
+        stream = np.empty(len(stream_df), dtype=[('time', stream_df.index.values.dtype),
+                                                 ('data', values.dtype, values.shape[1:])])
+        stream['time'] = stream_df.index.values
+        stream['data'] = values
+
+        self.invalidate(activity_id, stream_type)
+        key = self._key(activity_id, stream_type)
+        file_name = _SEPARATOR.join(key + (_version_token(version),)) + _FILE_SUFFIX
+        np.save(self._path(file_name), stream)
+        self._entries[key] = (file_name, os.path.getsize(self._path(file_name)))
+        self._evict()
+
+    def invalidate(self, activity_id, stream_type=None):
+        """Removes the given stream, or all streams of the given activity, from the cache"""
+        keys = [self._key(activity_id, stream_type)] if stream_type else \
+            [key for key in self._entries if key[0] == _safe_name(activity_id)]
+        for key in keys:
+            entry = self._entries.pop(key, None)
+            if entry:
+                os.remove(self._path(entry[0]))
+
+    def clear(self):
+        for file_name, _ in self._entries.values():
+            os.remove(self._path(file_name))
+        self._entries.clear()
+
+    def _evict(self):
+        size_bytes = self.size_bytes
+        while size_bytes > self.max_bytes and self._entries:
+            _, (file_name, size) = self._entries.popitem(last=False)
+            os.remove(self._path(file_name))
+            size_bytes -= size
+            self.evictions += 1
@@ -0,0 +1,60 @@
+from itertools import islice
+
+import pandas as pd
+
+from pysweat.instrumentation import instrumented
+
+# collection name -> compound indexes used by the persistence functions (load_stream(s), missing feature queries and
+# saving activities by strava_id)
+INDEXES = {
+    'streams': [[('activity_id', 1), ('type', 1)]],
+    'activities': [[('type', 1), ('athlete_id', 1), ('start_date_local', 1)], [('strava_id', 1)]]
+}
+
+
+def with_dtypes(documents_df, dtypes=None):
+    """Converts the given columns to the given dtypes, ignoring columns that were not loaded"""
+    return documents_df.astype({column: dtype for column, dtype in (dtypes or {}).items()
+                                if column in documents_df}) if len(documents_df) else documents_df
+
+
+def _documents_to_df(documents, dtypes=None):
+    return with_dtypes(pd.DataFrame(documents), dtypes)
+
+
+def _chunked_documents_to_dfs(cursor, dtypes, chunksize):
+    documents = iter(cursor)
+    chunk = list(islice(documents, chunksize))
+    while chunk:
+        yield _documents_to_df(chunk, dtypes)
+        chunk = list(islice(documents, chunksize))
+
+
+@instrumented()
+def load_documents(collection, query, fields=None, dtypes=None, chunksize=None):
+    """
+    Loads the documents matching the query as dataframe, or as generator of dataframes of (at most) chunksize rows.
+    :param collection: MongoDB collection
+    :param query: query document
+    :param fields: optional list of fields to load, other fields (including _id, unless listed) are not transferred
+    :param dtypes: optional dict of column name -> dtype, e.g. {'type': 'category'}, columns not loaded are ignored
+    :param chunksize: if provided, returns a generator of dataframes with at most chunksize rows each, such that only
+    one chunk of documents is held in memory at a time
+    """
+    cursor = collection.find(query) if fields is None else \
+        collection.find(query, dict({'_id': False}, **{field: True for field in fields}))
+    if chunksize:
+        return _chunked_documents_to_dfs(cursor.batch_size(chunksize), dtypes, chunksize)
+    return _documents_to_df(list(cursor), dtypes)
+
+
+def ensure_indexes(mongo, indexes=None):
+    """
+    Creates the indexes used by the persistence functions, if they do not exist yet (creating an existing index is a
+    no-op in MongoDB).
+    :param mongo: MongoDB client
+    :param indexes: dict of collection name -> list of indexes (lists of (field, direction) tuples), defaults to INDEXES
+    :return: dict of collection name -> list of index names
+    """
+    return {collection_name: [getattr(mongo.db, collection_name).create_index(keys) for keys in collection_indexes]
+            for collection_name, collection_indexes in (indexes or INDEXES).items()}
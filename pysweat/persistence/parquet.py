@@ -0,0 +1,341 @@
+"""
+Local columnar storage of activities, athletes and streams in Parquet files, requires pyarrow (pip install
+pysweat[parquet]). The directory layout is
+
+    activities/athlete_id=<athlete_id>/type=<type>/activities.parquet
+    athletes/athletes.parquet
+    streams/<activity_id>.parquet
+
+Activities are partitioned by athlete and type, such that queries on those fields only read the matching partitions,
+and queries on other fields are evaluated on the (column-pruned) row groups by pyarrow. Streams are stored with one
+column per stream type (latlng as lat and lng columns), such that loading a single stream type only reads that column.
+"""
+import operator
+import os
+from functools import reduce
+from glob import glob
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from pysweat.compact import CompactStream
+from pysweat.instrumentation import instrumented
+from pysweat.persistence.activities import activity_updates, missing_feature_backlog_df, missing_feature_query, \
+    missing_features_query
+from pysweat.persistence.general import with_dtypes
+from pysweat.persistence.storage import Storage
+
+_PARTITION_SCHEMA = pa.schema([('athlete_id', pa.int64()), ('type', pa.string())])
+_COMPARISONS = {'$eq': operator.eq, '$ne': operator.ne, '$gt': operator.gt, '$gte': operator.ge,
+                '$lt': operator.lt, '$lte': operator.le}
+
+
+def _condition(field_names, field, condition):
+    """Translates the condition on a single field of a MongoDB query to a pyarrow expression"""
+    if not isinstance(condition, dict):
+        condition = {'$eq': condition}
+
+    expressions = []
+    for query_operator, value in condition.items():
+        if query_operator == '$exists':
+            exists = ds.field(field).is_valid() if field in field_names else ds.scalar(False)
+            expressions.append(exists if value else ~exists)
+        elif field not in field_names:
+            expressions.append(ds.scalar(query_operator == '$ne' or (query_operator == '$eq' and value is None)))
+        elif query_operator == '$in':
+            expressions.append(ds.field(field).isin(list(value)))
+        elif query_operator in _COMPARISONS and value is None:
+            is_null = ds.field(field).is_null()
+            expressions.append(~is_null if query_operator == '$ne' else is_null)
+        elif query_operator == '$ne':
+            expressions.append((ds.field(field) != value) | ds.field(field).is_null())
+        elif query_operator in _COMPARISONS:
+            expressions.append(_COMPARISONS[query_operator](ds.field(field), value))
+        else:
+            raise ValueError('Unsupported query operator %s' % query_operator)
+    return reduce(operator.and_, expressions)
+
+
+def query_expression(query, field_names):
+    """
+    Translates a MongoDB query (equality, $eq, $ne, $gt(e), $lt(e), $in, $exists and $or) to a pyarrow expression.
+    :param query: dict with the query
+    :param field_names: names of the stored fields, conditions on other fields are evaluated as if they are missing
+    """
+    expressions = [
+        reduce(operator.or_, [query_expression(sub_query, field_names) for sub_query in condition])
+        if field == '$or' else _condition(field_names, field, condition)
+        for field, condition in query.items()
+    ]
+    return reduce(operator.and_, expressions) if expressions else ds.scalar(True)
+
+
+def _write_table(df, path):
+    """Writes a dataframe to a Parquet file, replacing any existing file atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def _read_df(path):
+    """Reads a single Parquet file, without adding partition columns derived from its path"""
+    return pq.ParquetFile(path).read().to_pandas() if os.path.exists(path) else None
+
+
+def _read_stream_df(path):
+    """Reads the stored streams of an activity indexed by time, with integer streams as nullable integer columns"""
+    return pq.ParquetFile(path).read().to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get).set_index('time') \
+        if os.path.exists(path) else None
+
+
+def _without_nullable_integers(stream_df):
+    """Converts nullable integer columns to int64, or to float64 with NaN for missing values"""
+    return stream_df.astype({column: np.float64 if stream_df[column].hasnans else np.int64
+                             for column in stream_df.columns if isinstance(stream_df[column].dtype, pd.Int64Dtype)})
+
+
+def _chunked_dfs(batches, dtypes, chunksize):
+    buffered, n_buffered = [], 0
+    for batch in batches:
+        buffered.append(batch)
+        n_buffered += batch.num_rows
+        while n_buffered >= chunksize:
+            table = pa.Table.from_batches(buffered)
+            yield with_dtypes(table.slice(0, chunksize).to_pandas(), dtypes)
+            remainder = table.slice(chunksize)
+            buffered, n_buffered = remainder.to_batches(), remainder.num_rows
+    if n_buffered:
+        yield with_dtypes(pa.Table.from_batches(buffered).to_pandas(), dtypes)
+
+
+def _merge_fields(stored_df, updates_df):
+    """
+    Sets the non-null fields of updates_df (indexed by strava_id) on the stored activities, adding activities that are
+    not stored yet.
+    :return: tuple of the merged dataframe and the number of stored activities of which a value has changed
+    """
+    stored_df = stored_df.set_index('strava_id') if stored_df is not None else pd.DataFrame(
+        index=pd.Index([], name='strava_id'))
+    matched = updates_df.index.isin(stored_df.index)
+    merged_df = stored_df.reindex(stored_df.index.append(updates_df.index[~matched]))
+
+    changed = np.zeros(len(updates_df), dtype=bool)
+    for column in updates_df.columns:
+        updated = updates_df[column].notnull().values
+        if column not in merged_df:
+            merged_df[column] = pd.Series(dtype=updates_df[column].dtype)
+            changed |= matched & updated
+        else:
+            stored_values = merged_df[column].reindex(updates_df.index).values
+            changed |= matched & updated & ~((stored_values == updates_df[column].values) |
+                                             (pd.isnull(stored_values) & pd.isnull(updates_df[column].values)))
+        merged_df.loc[updates_df.index[updated], column] = updates_df[column][updated]
+    return merged_df.rename_axis('strava_id').reset_index(), int(changed.sum())
+
+
+class ParquetStorage(Storage):
+    """Storage in local Parquet files, see the module documentation for the layout"""
+
+    def __init__(self, directory):
+        """:param directory: root directory of the storage, created if it does not exist"""
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _activities_directory(self):
+        return os.path.join(self.directory, 'activities')
+
+    def _partition_path(self, athlete_id, activity_type):
+        return os.path.join(self._activities_directory(), 'athlete_id=%d' % athlete_id,
+                            'type=%s' % quote(str(activity_type), safe=''), 'activities.parquet')
+
+    def _stream_path(self, activity_id):
+        return os.path.join(self.directory, 'streams', '%s.parquet' % quote(str(activity_id), safe=''))
+
+    def _athletes_path(self):
+        return os.path.join(self.directory, 'athletes', 'athletes.parquet')
+
+    def _activities_dataset(self):
+        """Returns the pyarrow dataset of all activity partitions (with a schema unifying all partitions), or None"""
+        paths = sorted(glob(os.path.join(self._activities_directory(), '*', '*', 'activities.parquet')))
+        if not paths:
+            return None
+        # permissive, e.g. a column that is int64 in one partition and double in another is read as double
+        schema = pa.unify_schemas([pq.read_schema(path).remove_metadata() for path in paths] + [_PARTITION_SCHEMA],
+                                  promote_options='permissive')
+        return ds.dataset(paths, schema=schema, format='parquet', partition_base_dir=self._activities_directory(),
+                          partitioning=ds.partitioning(_PARTITION_SCHEMA, flavor='hive'))
+
+    @staticmethod
+    def _load(dataset, fields, dtypes, chunksize, query):
+        if dataset is None:
+            return iter([]) if chunksize else pd.DataFrame()
+        field_names = dataset.schema.names
+        columns = None if fields is None else [field for field in fields if field in field_names]
+        scan_filter = query_expression(query, field_names)
+        if chunksize:
+            return _chunked_dfs(dataset.to_batches(columns=columns, filter=scan_filter), dtypes, chunksize)
+        return with_dtypes(dataset.to_table(columns=columns, filter=scan_filter).to_pandas(), dtypes)
+
+    @instrumented()
+    def load_activities(self, fields=None, dtypes=None, chunksize=None, **query):
+        """
+        Loads activities matching the query (given as keyword arguments, see query_expression) as dataframe, reading
+        only the given fields of the partitions matching the query.
+        """
+        return self._load(self._activities_dataset(), fields, dtypes, chunksize, query)
+
+    def write_activities(self, activities_df):
+        """
+        Stores complete activities, e.g. exported from MongoDB, replacing stored activities with the same strava_id.
+        :param activities_df: Pandas dataframe with activities, including strava_id, athlete_id and type columns
+        """
+        activities_df = activities_df.drop(columns=['_id'], errors='ignore')
+        for (athlete_id, activity_type), partition_df in activities_df.groupby(['athlete_id', 'type'],
+                                                                              observed=True):
+            path = self._partition_path(athlete_id, activity_type)
+            stored_df = _read_df(path)
+            if stored_df is not None:
+                partition_df = pd.concat([stored_df[~stored_df.strava_id.isin(partition_df.strava_id)],
+                                          partition_df])
+            _write_table(partition_df.drop(columns=['athlete_id', 'type']), path)
+
+    @instrumented()
+    def save_activities(self, activities_df, columns=None, original_df=None, chunk_size=1000):
+        """
+        Sets the non-NaN values of the given activities, like persistence.activities.save_activities. Activities that
+        are not stored yet are added if athlete_id and type are provided, and fail otherwise. Only the partitions of
+        the updated activities are rewritten.
+        """
+        stored_partitions = {}
+        dataset = self._activities_dataset()
+        if dataset is not None:
+            stored_df = dataset.to_table(columns=['strava_id', 'athlete_id', 'type']).to_pandas()
+            stored_partitions = dict(zip(stored_df.strava_id, zip(stored_df.athlete_id, stored_df.type)))
+
+        updates = activity_updates(activities_df, columns=columns, original_df=original_df)
+        summaries = []
+        for start in range(0, len(updates), chunk_size):
+            chunk = updates[start:start + chunk_size]
+            updates_by_partition, failed_ids = {}, []
+            for strava_id, fields in chunk:
+                partition = stored_partitions.get(strava_id) or (fields.get('athlete_id'), fields.get('type'))
+                if None in partition:
+                    failed_ids.append(strava_id)
+                    continue
+                updates_by_partition.setdefault(partition, []).append(
+                    dict({key: value for key, value in fields.items() if key not in ('athlete_id', 'type')},
+                         strava_id=strava_id))
+
+            summary = {'matched': 0, 'modified': 0, 'upserted': 0, 'failed_ids': failed_ids}
+            for (athlete_id, activity_type), partition_updates in updates_by_partition.items():
+                path = self._partition_path(athlete_id, activity_type)
+                updates_df = pd.DataFrame(partition_updates).set_index('strava_id')
+                merged_df, modified = _merge_fields(_read_df(path), updates_df)
+                _write_table(merged_df, path)
+                matched = sum(strava_id in stored_partitions for strava_id in updates_df.index)
+                summary['matched'] += matched
+                summary['modified'] += modified
+                summary['upserted'] += len(updates_df) - matched
+                stored_partitions.update((strava_id, (athlete_id, activity_type)) for strava_id in updates_df.index)
+            summaries.append(summary)
+        return summaries
+
+    @instrumented()
+    def load_athletes(self, fields=None, dtypes=None, chunksize=None, **query):
+        path = self._athletes_path()
+        return self._load(ds.dataset(path, format='parquet') if os.path.exists(path) else None, fields, dtypes,
+                          chunksize, query)
+
+    def write_athletes(self, athletes_df):
+        """Stores complete athletes, replacing stored athletes with the same id"""
+        athletes_df = athletes_df.drop(columns=['_id'], errors='ignore')
+        stored_df = _read_df(self._athletes_path())
+        if stored_df is not None:
+            athletes_df = pd.concat([stored_df[~stored_df.id.isin(athletes_df.id)], athletes_df])
+        _write_table(athletes_df, self._athletes_path())
+
+    def write_streams(self, activity_id, stream_df):
+        """
+        Stores the streams of an activity, adding them to (or replacing) the stored stream types of that activity.
+        :param stream_df: stream dataframe indexed by time, as loaded by persistence.streams.load_streams, or
+        CompactStream
+        """
+        stream = stream_df if isinstance(stream_df, CompactStream) else CompactStream.from_df(stream_df, dtype=None)
+        stream_df = stream.to_df().rename_axis('time')
+        stored_df = _read_stream_df(self._stream_path(activity_id))
+        if stored_df is not None:
+            # nullable integers keep integer streams integer where the stream types have different timestamps
+            stream_df = stream_df.astype({column: pd.Int64Dtype() for column in stream_df.columns
+                                          if pd.api.types.is_integer_dtype(stream_df[column])})
+            stream_df = stream_df.combine_first(stored_df)
+        _write_table(stream_df.reset_index(), self._stream_path(activity_id))
+
+    def _read_streams(self, activity_id, stream_types, compact):
+        path = self._stream_path(activity_id)
+        if not os.path.exists(path):
+            return None
+        stored_columns = set(pq.read_schema(path).names)
+        stream_types = [stream_type for stream_type in stream_types
+                        if ({'lat', 'lng'} if stream_type == 'latlng' else {stream_type}) <= stored_columns]
+        columns = [column for stream_type in stream_types
+                   for column in (['lat', 'lng'] if stream_type == 'latlng' else [stream_type])]
+        if not columns:
+            return None
+
+        stream_df = _without_nullable_integers(pq.read_table(path, columns=['time'] + columns).to_pandas()
+                                               .set_index('time'))
+        if len(stream_df) == 0:
+            return None
+        if compact:
+            return CompactStream.from_df(stream_df)
+        # stored integer streams are loaded as integers (as by MongoStorage), unless missing for some timestamps
+        return CompactStream.from_df(stream_df, dtype=None).to_df(lat_long_colname='latlng')[stream_types]
+
+    @instrumented()
+    def load_stream(self, activity_id, stream_type, compact=False):
+        """Loads a single stream as 1-column dataframe (or CompactStream) indexed by time, or None if not stored"""
+        return self._read_streams(activity_id, [stream_type], compact)
+
+    def load_streams(self, activity_ids, stream_types, compact=False):
+        """Loads the streams of the given types for many activities, see persistence.streams.load_streams"""
+        for activity_id in activity_ids:
+            yield activity_id, self._read_streams(activity_id, list(stream_types), compact)
+
+    def get_activity_types(self):
+        activities_df = self.load_activities(fields=['type'])
+        return sorted(activities_df.type.unique()) if len(activities_df) else []
+
+    def get_athlete_ids(self):
+        athletes_df = self.load_athletes(fields=['id'])
+        return athletes_df.id.tolist() if len(athletes_df) else []
+
+    def get_first_activity_without_feature_for_type(self, feature_name, activity_type='Run', athlete_id=None):
+        activities_df = self.load_activities(fields=['athlete_id', 'start_date_local'],
+                                             **missing_feature_query(feature_name, activity_type, athlete_id))
+        if len(activities_df) == 0:
+            return []
+        first_dates = activities_df.groupby('athlete_id').start_date_local.min()
+        return [{'_id': athlete_id, 'first_date': first_date.to_pydatetime()}
+                for athlete_id, first_date in first_dates.items()]
+
+    def get_missing_feature_backlog(self, feature_names, activity_types=None, athlete_id=None):
+        """See persistence.activities.get_missing_feature_backlog, null values count as missing"""
+        feature_names = list(feature_names)
+        activities_df = self.load_activities(fields=['athlete_id', 'type', 'start_date_local'] + feature_names,
+                                             **missing_features_query(feature_names, activity_types, athlete_id))
+
+        missing_df = pd.DataFrame({'athlete_id': activities_df.get('athlete_id'), 'type': activities_df.get('type')})
+        for i, feature_name in enumerate(feature_names):
+            missing = activities_df[feature_name].isnull() if feature_name in activities_df \
+                else pd.Series(True, index=activities_df.index)
+            missing_df['%d_first_date' % i] = activities_df.start_date_local.where(missing)
+            missing_df['%d_count' % i] = missing.astype(int)
+        aggregations = dict(('%d_first_date' % i, 'min') for i in range(len(feature_names)))
+        aggregations.update(('%d_count' % i, 'sum') for i in range(len(feature_names)))
+        backlog_df = missing_df.groupby(['athlete_id', 'type']).agg(aggregations).reset_index() \
+            if len(missing_df) else pd.DataFrame()
+        return missing_feature_backlog_df(backlog_df, feature_names)
@@ -0,0 +1,57 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from pysweat.persistence.streams import load_streams
+
+
+def _load_chunk(mongo, activity_ids, stream_types, compact):
+    return list(load_streams(mongo, activity_ids, stream_types, chunk_size=len(activity_ids), compact=compact))
+
+
+def prefetch_streams(mongo, activity_ids, stream_types, n_threads=4, chunk_size=10, max_prefetched_chunks=None,
+                     compact=False):
+    """
+    Loads the streams of many activities in a pool of I/O threads, ahead of their consumption, such that loading the
+    streams of upcoming activities overlaps with computations on the current ones, e.g.
+
+        for activity_id, stream_df in prefetch_streams(mongo, activity_ids, ['latlng']):
+            features.append(ActivityFeatures.sum_of_turns(stream_df))
+
+    At most max_prefetched_chunks chunks are loaded or waiting to be consumed at any time (backpressure), the next
+    chunk is only requested once the consumer has taken one. If loading fails, the error is raised in the consumer and
+    remaining loads are cancelled. Closing the generator (e.g. by breaking out of the loop) also cancels remaining
+    loads and waits for the running ones to finish.
+    :param mongo: MongoDB client (shared by the threads)
+    :param activity_ids: iterable of activity ids, consumed lazily
+    :param stream_types: list of stream types, e.g. ['latlng', 'heartrate']
+    :param n_threads: number of I/O threads
+    :param chunk_size: number of activities loaded per query (by one thread)
+    :param max_prefetched_chunks: bound on the number of chunks in flight or prefetched, defaults to 2 * n_threads
+    :param compact: if True, yields CompactStreams instead of dataframes
+    :return: generator of (activity_id, stream_df) tuples in the order of activity_ids, see load_streams
+    """
+    activity_ids = iter(activity_ids)
+    stream_types = list(stream_types)
+    max_prefetched_chunks = max_prefetched_chunks or 2 * n_threads
+    executor = ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix='pysweat-prefetch')
+    prefetched = deque()
+
+    def request_next_chunk():
+        chunk = list(islice(activity_ids, chunk_size))
+        if chunk:
+            prefetched.append(executor.submit(_load_chunk, mongo, chunk, stream_types, compact))
+        return bool(chunk)
+
+    try:
+        while len(prefetched) < max_prefetched_chunks and request_next_chunk():
+            pass
+        while prefetched:
+            streams = prefetched.popleft().result()
+            request_next_chunk()
+            for activity_id_and_stream in streams:
+                yield activity_id_and_stream
+    finally:
+        for future in prefetched:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,97 @@
+"""
+Storage backends with a common interface, such that jobs can run against either MongoDB or local files, e.g.
+
+    storage = MongoStorage(mongo)  # or ParquetStorage('/data/pysweat'), see persistence.parquet
+    activities_df = storage.load_activities(fields=['strava_id', 'average_speed'], type='Run')
+"""
+from abc import ABC, abstractmethod
+
+from pysweat.persistence import activities, athletes, streams
+
+
+class Storage(ABC):
+    """
+    Interface of storage backends, with the same arguments and results as the corresponding persistence functions. A
+    backend that does not implement all methods cannot be instantiated.
+    """
+
+    @abstractmethod
+    def load_activities(self, fields=None, dtypes=None, chunksize=None, **query):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_activities(self, activities_df, columns=None, original_df=None, chunk_size=1000):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_athletes(self, fields=None, dtypes=None, chunksize=None, **query):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_stream(self, activity_id, stream_type, compact=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_streams(self, activity_ids, stream_types, compact=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_activity_types(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_athlete_ids(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_first_activity_without_feature_for_type(self, feature_name, activity_type='Run', athlete_id=None):
+        """Returns documents with the athlete id (_id) and datetime of the first activity without the feature"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_missing_feature_backlog(self, feature_names, activity_types=None, athlete_id=None):
+        """Returns per athlete, type and feature the first date and number of activities without the feature"""
+        raise NotImplementedError
+
+
+class MongoStorage(Storage):
+    """Storage backed by MongoDB, delegating to the persistence functions"""
+
+    def __init__(self, mongo, stream_cache=None):
+        """
+        :param mongo: MongoDB client
+        :param stream_cache: optional StreamCache used by load_stream
+        """
+        self.mongo = mongo
+        self.stream_cache = stream_cache
+
+    def load_activities(self, fields=None, dtypes=None, chunksize=None, **query):
+        return activities.load_activities(self.mongo, fields=fields, dtypes=dtypes, chunksize=chunksize, **query)
+
+    def save_activities(self, activities_df, columns=None, original_df=None, chunk_size=1000):
+        return activities.save_activities(self.mongo, activities_df, columns=columns, original_df=original_df,
+                                          chunk_size=chunk_size)
+
+    def load_athletes(self, fields=None, dtypes=None, chunksize=None, **query):
+        return athletes.load_athletes(self.mongo, fields=fields, dtypes=dtypes, chunksize=chunksize, **query)
+
+    def load_stream(self, activity_id, stream_type, compact=False):
+        return streams.load_stream(self.mongo, activity_id, stream_type, cache=self.stream_cache, compact=compact)
+
+    def load_streams(self, activity_ids, stream_types, compact=False):
+        return streams.load_streams(self.mongo, activity_ids, stream_types, compact=compact)
+
+    def get_activity_types(self):
+        return activities.get_activity_types(self.mongo)
+
+    def get_athlete_ids(self):
+        return athletes.get_athlete_ids(self.mongo)
+
+    def get_first_activity_without_feature_for_type(self, feature_name, activity_type='Run', athlete_id=None):
+        return list(activities.get_first_activity_without_feature_for_type(self.mongo, feature_name,
+                                                                           activity_type=activity_type,
+                                                                           athlete_id=athlete_id))
+
+    def get_missing_feature_backlog(self, feature_names, activity_types=None, athlete_id=None):
+        return activities.get_missing_feature_backlog(self.mongo, feature_names, activity_types=activity_types,
+                                                      athlete_id=athlete_id)
@@ -1,10 +1,99 @@
+import logging
+from itertools import islice
+
 import pandas as pd
 
+from pysweat.compact import CompactStream
+from pysweat.instrumentation import instrumented
+
+
+def _stream_df(index_data, data_by_type, compact=False):
+    if compact:
+        return CompactStream.from_lists(index_data, data_by_type)
+    return pd.DataFrame(data_by_type, index=index_data).groupby(level=0).last()
+
+
+def _activity_stream_df(activity_id, index_data, data_by_type, compact=False):
+    """Returns the stream dataframe of an activity, or None with a warning if its streams are malformed"""
+    try:
+        return _stream_df(index_data, data_by_type, compact=compact)
+    except (ValueError, IndexError) as e:
+        logging.warning(f'Failed to load streams of activity {activity_id}, returning None, {e}')
+        return None
+
+
+def _stream_version(mongo, activity_id, stream_type):
+    """
+    Returns the metadata (i.e. all fields except the data itself) and the number of data points of the time and data
+    stream documents, computed by MongoDB without transferring the data
+    """
+    return sorted((sorted(stream.items()) for stream in mongo.db.streams.aggregate([
+        {'$match': {'activity_id': activity_id, 'type': {'$in': ['time', stream_type]}}},
+        {'$addFields': {'data_size': {'$size': {'$ifNull': ['$data', []]}}}},
+        {'$project': {'data': False}}
+    ])), key=str)
 
-def load_stream(mongo, activity_id, stream_type):
+
+def _load_stream(mongo, activity_id, stream_type, compact=False):
     index_stream = mongo.db.streams.find_one({'activity_id': activity_id, 'type': 'time'})
     data_stream = mongo.db.streams.find_one({'activity_id': activity_id, 'type': stream_type})
-    return pd.DataFrame({stream_type: data_stream['data']},
-                        index=index_stream['data']).groupby(level=0).last() \
+    return _stream_df(index_stream['data'], {stream_type: data_stream['data']}, compact=compact) \
         if (index_stream and data_stream and len(data_stream['data']) > 0) \
         else None
+
+
+@instrumented()
+def load_stream(mongo, activity_id, stream_type, cache=None, compact=False):
+    """
+    Loads a single stream as 1-column dataframe indexed by time, or None if the stream does not exist or is empty.
+    :param cache: optional StreamCache, streams are loaded from the cache if available (and unchanged in the source if
+    the cache validates), otherwise loaded from MongoDB and added to the cache. Changes are detected by the metadata and
+    number of data points of the stream documents, in-place updates of the data keeping its length are not detected,
+    unless they also update another field (e.g. a modification date)
+    :param compact: if True, returns a CompactStream instead of a dataframe
+    """
+    if cache is not None:
+        version = _stream_version(mongo, activity_id, stream_type) if cache.validate else None
+        stream_df = cache.get(activity_id, stream_type, version=version)
+        if stream_df is None:
+            stream_df = _load_stream(mongo, activity_id, stream_type)
+            if stream_df is not None:
+                cache.put(activity_id, stream_type, stream_df, version=version)
+        return CompactStream.from_df(stream_df) if compact and stream_df is not None else stream_df
+
+    return _load_stream(mongo, activity_id, stream_type, compact=compact)
+
+
+def load_streams(mongo, activity_ids, stream_types, chunk_size=100, batch_size=1000, compact=False):
+    """
+    Loads the streams of the given types for many activities, using one query per chunk of activities instead of
+    separate queries per activity and stream type.
+    :param mongo: MongoDB client
+    :param activity_ids: iterable of activity ids
+    :param stream_types: list of stream types, e.g. ['latlng', 'heartrate']
+    :param chunk_size: number of activities per query, bounding the number of streams held in memory
+    :param batch_size: cursor batch size, i.e. number of stream documents per round trip
+    :param compact: if True, yields CompactStreams instead of dataframes, such that many activities can be held in
+    memory at once
+    :return: generator of (activity_id, stream_df) tuples in the order of activity_ids, where stream_df has one column
+    per (non-empty) stream type and is indexed by time, or None if the activity has no time stream or no non-empty
+    streams of the given types, or if its streams are malformed (e.g. time and data streams of different lengths)
+    """
+    activity_ids = iter(activity_ids)
+    stream_types = list(stream_types)
+    chunk = list(islice(activity_ids, chunk_size))
+    while chunk:
+        streams_by_activity = {activity_id: {} for activity_id in chunk}
+        for stream in mongo.db.streams.find({'activity_id': {'$in': chunk}, 'type': {'$in': ['time'] + stream_types}},
+                                            projection={'_id': False, 'activity_id': True, 'type': True, 'data': True}
+                                            ).batch_size(batch_size):
+            streams_by_activity[stream['activity_id']][stream['type']] = stream['data']
+
+        for activity_id in chunk:
+            streams = streams_by_activity[activity_id]
+            index_data = streams.get('time')
+            data_by_type = {stream_type: streams[stream_type] for stream_type in stream_types
+                            if len(streams.get(stream_type) or []) > 0}
+            yield activity_id, _activity_stream_df(activity_id, index_data, data_by_type, compact) \
+                if index_data and data_by_type else None
+        chunk = list(islice(activity_ids, chunk_size))
@@ -1,16 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from pysweat.instrumentation import instrumented
 from pysweat.transformation.general import get_observations_without_feature
-from pysweat.transformation.windows import select_activity_window
 
 
 def weighted_average(activity_df, feature, weight_feature):
     return sum(activity_df[weight_feature] * activity_df[feature]) / sum(activity_df[weight_feature])
 
 
-def compute_moving_averages(activity_df, feature_name, window_days):
-    to_be_computed = get_observations_without_feature(activity_df, feature_name + '_' + str(window_days))
-    return activity_df[to_be_computed].assign(**{
-        feature_name + '_' + str(window_days): [
-            weighted_average(select_activity_window(activity_df, before, window_days), feature_name, 'distance')
-            for before in activity_df.start_date_local[to_be_computed]
-        ]
-    })
+def _window_weighted_averages(dates, features, weights, window_days):
+    """
+    Computes the weighted average of the features of all activities within (date - window_days, date] for each
+    activity, using cumulative sums over activities sorted by date. Windows containing NaN values result in NaN.
+    """
+    order = np.argsort(dates, kind='stable')
+    sorted_dates = dates[order]
+    weighted_features = (weights * features)[order]
+    cumulative_weighted_features = np.concatenate([[0], np.cumsum(np.nan_to_num(weighted_features))])
+    cumulative_weights = np.concatenate([[0], np.cumsum(np.nan_to_num(weights[order]))])
+    cumulative_nan_counts = np.concatenate([[0], np.cumsum(np.isnan(weighted_features))])
+
+    rights = np.searchsorted(sorted_dates, dates, side='right')
+    lefts = np.searchsorted(sorted_dates, dates - pd.Timedelta(days=window_days).to_timedelta64(), side='right')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        averages = ((cumulative_weighted_features[rights] - cumulative_weighted_features[lefts]) /
+                    (cumulative_weights[rights] - cumulative_weights[lefts]))
+    return np.where(cumulative_nan_counts[rights] - cumulative_nan_counts[lefts] > 0, np.nan, averages)
+
+
+@instrumented()
+def compute_moving_averages(activity_df, feature_name, window_days, weight_feature='distance',
+                            group_colname='athlete_id'):
+    """
+    Computes moving averages of one or more features, weighted by distance, over the activities within the given
+    number of days up to (and including) the start date of each activity. Activities are only averaged within their
+    group (i.e. athlete) if the group column exists. Only activities for which (one of) the moving averages is missing
+    are returned, with the missing moving averages added as [feature_name]_[window_days].
+    :param activity_df: Pandas dataframe with activities, with (at least) the features, weight_feature and
+    start_date_local columns
+    :param feature_name: name of the feature to be averaged, or list of names
+    :param window_days: window size in days, or list of window sizes
+    :param weight_feature: name of the feature used as weight
+    :param group_colname: name of the column to group activities by, ignored if not in activity_df
+    :return: dataframe with the activities for which moving averages were missing
+    """
+    feature_names = [feature_name] if isinstance(feature_name, str) else list(feature_name)
+    window_days_list = [window_days] if np.isscalar(window_days) else list(window_days)
+    moving_average_names = {(name, days): name + '_' + str(days) for name in feature_names for days in window_days_list}
+
+    to_be_computed_by_name = {moving_average_name: np.asarray(get_observations_without_feature(activity_df,
+                                                                                              moving_average_name))
+                              for moving_average_name in moving_average_names.values()}
+    to_be_computed = np.logical_or.reduce(list(to_be_computed_by_name.values()))
+
+    # factorized groups (with -1 for missing values) keep activities without group, without groupby(dropna=False)
+    group_positions = (activity_df.groupby(pd.factorize(activity_df[group_colname])[0], sort=False).indices.values()
+                       if group_colname in activity_df else [np.arange(len(activity_df))])
+    dates = activity_df.start_date_local.values
+    weights = activity_df[weight_feature].values.astype(float)
+
+    moving_averages = {}
+    for (name, days), moving_average_name in moving_average_names.items():
+        features = activity_df[name].values.astype(float)
+        averages = np.full(len(activity_df), np.nan)
+        for positions in group_positions:
+            averages[positions] = _window_weighted_averages(dates[positions], features[positions], weights[positions],
+                                                            days)
+        existing = (activity_df[moving_average_name].values if moving_average_name in activity_df
+                    else np.full(len(activity_df), np.nan))
+        moving_averages[moving_average_name] = np.where(to_be_computed_by_name[moving_average_name],
+                                                        averages, existing)[to_be_computed]
+
+    return activity_df[to_be_computed].assign(**moving_averages)
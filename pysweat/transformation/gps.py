@@ -1,13 +1,89 @@
-import pandas as pd
-import math
+import numpy as np
 
+from pysweat.compact import CompactStream
+from pysweat.instrumentation import instrumented
+
+EARTH_RADIUS_METERS = 6371008.8  # mean earth radius
+
+
+def clean_lat_long(lat_long_df, lat_long_colname='latlng', lat_colname=None, lng_colname=None):
+    """
+    Returns the non-null observations of the given dataframe (or CompactStream) together with their lat-long values as
+    (n, 2) array
+    """
+    if isinstance(lat_long_df, CompactStream):
+        observed = ~np.isnan(lat_long_df.latlng).any(axis=1)
+        return lat_long_df.select(observed), lat_long_df.latlng[observed]
+
+    if lat_colname and lng_colname:
+        lat_long_clean_df = lat_long_df[~(lat_long_df[lat_colname].isnull() | lat_long_df[lng_colname].isnull())]
+        return lat_long_clean_df, lat_long_clean_df[[lat_colname, lng_colname]].values.astype(float)
 
-def lat_long_to_x_y(lat_long_df, lat_long_colname='latlng'):
     lat_long_clean_df = lat_long_df[~lat_long_df[lat_long_colname].isnull()]
-    latitude = pd.Series([point[0] for point in lat_long_clean_df[lat_long_colname]], index=lat_long_clean_df.index)
-    longitude = pd.Series([point[1] for point in lat_long_clean_df[lat_long_colname]], index=lat_long_clean_df.index)
-    center_lat = min(latitude) + (max(latitude) - min(latitude)) / 2
-    return lat_long_clean_df.assign(**{
-        'x': [math.radians(lng) * math.cos(math.radians(center_lat)) for lng in longitude],
-        'y': [math.radians(lat) for lat in latitude]
-    })
+    return lat_long_clean_df, np.array(lat_long_clean_df[lat_long_colname].tolist(), dtype=float).reshape(-1, 2)
+
+
+def project_lat_long(lat_long, center_lat=None):
+    """
+    Projects lat-long values (in degrees) to x-y values (in radians) using the Equirectangular projection, centered on
+    the middle of the latitude range.
+    :param lat_long: numpy array of shape (n, 2) with latitude and longitude values
+    :param center_lat: optional latitude (in degrees) to center the projection on instead, e.g. to project parts of a
+    stream consistently
+    :return: tuple of numpy arrays x, y
+    """
+    lat_long_radians = np.radians(np.asarray(lat_long, dtype=float))
+    latitude, longitude = lat_long_radians[:, 0], lat_long_radians[:, 1]
+    center_lat = np.radians(center_lat) if center_lat is not None else \
+        latitude.min() + (latitude.max() - latitude.min()) / 2
+    return longitude * np.cos(center_lat), latitude
+
+
+@instrumented()
+def lat_long_to_x_y(lat_long_df, lat_long_colname='latlng', lat_colname=None, lng_colname=None):
+    """
+    Adds x and y columns to the dataframe, using the Equirectangular projection of its lat-long values. Observations
+    without lat-long values are dropped.
+    :param lat_long_df: Pandas dataframe with either a column of 2-element lists with lat-long values, or separate
+    latitude and longitude columns, or a CompactStream
+    :param lat_long_colname: name of the column with 2-element lists with lat-long values
+    :param lat_colname: name of the latitude column, overrides lat_long_colname if provided with lng_colname
+    :param lng_colname: name of the longitude column, overrides lat_long_colname if provided with lat_colname
+    :return: dataframe with x and y columns added
+    """
+    lat_long_clean_df, lat_long = clean_lat_long(lat_long_df, lat_long_colname, lat_colname, lng_colname)
+    x, y = project_lat_long(lat_long)
+    return lat_long_clean_df.assign(x=x, y=y)
+
+
+def haversine_distances(lat_long):
+    """
+    Computes the great-circle distance (in meters) between each pair of subsequent lat-long values.
+    :param lat_long: numpy array of shape (n, 2) with latitude and longitude values
+    :return: numpy array of length n - 1
+    """
+    lat_long_radians = np.radians(np.asarray(lat_long, dtype=float))
+    latitude, longitude = lat_long_radians[:, 0], lat_long_radians[:, 1]
+    a = (np.sin(np.diff(latitude) / 2) ** 2 +
+         np.cos(latitude[:-1]) * np.cos(latitude[1:]) * np.sin(np.diff(longitude) / 2) ** 2)
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+@instrumented()
+def haversine_distance(lat_long_df, lat_long_colname='latlng', lat_colname=None, lng_colname=None,
+                       include_speed=False):
+    """
+    Adds a column with the great-circle distance (in meters) to the previous observation and optionally a column with
+    the corresponding speed (in meters per second), assuming an index representing seconds since the start of the
+    activity. Observations without lat-long values are dropped.
+    :return: dataframe (or CompactStream) with haversine_distance and (optionally) haversine_speed columns added,
+    NaN for the first observation
+    """
+    lat_long_clean_df, lat_long = clean_lat_long(lat_long_df, lat_long_colname, lat_colname, lng_colname)
+    distances = np.full(len(lat_long), np.nan)
+    distances[1:] = haversine_distances(lat_long)
+    if include_speed:
+        speeds = np.full(len(lat_long), np.nan)
+        speeds[1:] = distances[1:] / np.diff(np.asarray(lat_long_clean_df.index))
+        return lat_long_clean_df.assign(haversine_distance=distances, haversine_speed=speeds)
+    return lat_long_clean_df.assign(haversine_distance=distances)
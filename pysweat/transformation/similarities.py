@@ -4,12 +4,44 @@ from math import pi
 
 import numpy as np
 
+from pysweat.instrumentation import instrumented
+
 
 def cosine_similarity(v1, v2):
     cosine = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
     return 1 if cosine > 1 else (-1 if cosine < -1 else cosine)  # Correcting for floating point rounding errors
 
 
+def cosine_similarities(vs1, vs2):
+    """Row-wise cosine similarity between two (n, d) arrays of vectors, equivalent to cosine_similarity per pair"""
+    vs1, vs2 = np.asarray(vs1, dtype=float), np.asarray(vs2, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosines = np.einsum('ij,ij->i', vs1, vs2) / (np.linalg.norm(vs1, axis=1) * np.linalg.norm(vs2, axis=1))
+    return np.clip(cosines, -1, 1)  # Correcting for floating point rounding errors, NaN is retained
+
+
+def euclidean_distance(v1, v2):
+    return np.linalg.norm(np.subtract(v1, v2))
+
+
+def euclidean_distances(vs1, vs2):
+    """Row-wise Euclidean distance between two (n, d) arrays of vectors"""
+    return np.linalg.norm(np.asarray(vs1, dtype=float) - np.asarray(vs2, dtype=float), axis=1)
+
+
+# Pairwise similarity functions mapped to their row-wise equivalents operating on (n, d) arrays
+VECTORIZED_SIMILARITIES = {
+    cosine_similarity: cosine_similarities,
+    euclidean_distance: euclidean_distances
+}
+
+
+def vectorized_similarity(similarity_function):
+    """Returns the row-wise equivalent of the given pairwise similarity function, or None if there is none"""
+    return VECTORIZED_SIMILARITIES.get(similarity_function)
+
+
+@instrumented()
 def cosine_to_deviation(stream_df, cosine_col='cos'):
     # deviation corresponds (linearly) to turn severity, e.g. 45 deg = 0.25, 90 deg = 0.5, 180 deg = 1
     return stream_df.assign(deviation=np.arccos(stream_df[cosine_col]) / pi)
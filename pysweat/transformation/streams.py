@@ -1,15 +1,27 @@
 from __future__ import division
 
-import arrow
 import pandas as pd
 import numpy as np
 
+from pysweat.compact import CompactStream, lat_long_array
+from pysweat.instrumentation import instrumented
+from pysweat.transformation.similarities import vectorized_similarity
+from pysweat.transformation.windows import time_rolling
 
+
+def _after_first(values, n):
+    """Returns the n - 1 values computed between subsequent observations as n values, NaN for the first"""
+    values_after_first = np.full(n, np.nan)
+    values_after_first[1:] = values
+    return values_after_first
+
+
+@instrumented()
 def smooth(stream_df, window_size=3, smooth_colnames=None, use_index=False):
     """
     Smooths signals in dataframe with moving average filter. Uses either fix-sized window or fixed-duration window in
     case that observations are non-equally spread over time.
-    :param stream_df: Pandas dataframe
+    :param stream_df: Pandas dataframe or CompactStream
     :param window_size: Window size for moving average filter, interpreted either as number of observations (default),
     or number of seconds (if use_index is true).
     :param smooth_colnames: Iterable of column names to use, by default all columns are smoothed.
@@ -18,36 +30,160 @@ def smooth(stream_df, window_size=3, smooth_colnames=None, use_index=False):
     :return:
     """
     if use_index:
-        tmp_df = stream_df.copy()  # prevent overwriting original index
-        base_dt = arrow.get('2001-01-01')  # pick arbitrary date as base for artificial DatetimeIndex
-        base_index_seconds = stream_df.index
-        tmp_df.index = [pd.Timestamp(base_dt.shift(seconds=s).datetime) for s in base_index_seconds]
-        window_size = str(window_size) + 's'
-
         return stream_df.assign(**{
-            smooth_colname + '_smooth': pd.Series(tmp_df[smooth_colname].rolling(window=window_size).mean().values,
-                                                  index=stream_df.index)
+            smooth_colname + '_smooth': time_rolling(np.asarray(stream_df.index), np.asarray(stream_df[smooth_colname]),
+                                                     window_size, statistic='mean')
             for smooth_colname in smooth_colnames or stream_df.columns
         })
     else:
         return stream_df.assign(**{
-            smooth_colname + '_smooth': pd.Series(stream_df[smooth_colname].rolling(window=window_size).mean())
+            smooth_colname + '_smooth': pd.Series(np.asarray(stream_df[smooth_colname])).rolling(window=window_size)
+            .mean().values
             for smooth_colname in smooth_colnames or stream_df.columns
         })
 
 
+@instrumented()
 def derivative(stream_df, derivative_colnames=None):
+    dt = np.diff(np.asarray(stream_df.index))
     return stream_df.assign(**{
-        'd' + derivative_colname + '_dt': pd.Series(
-            np.diff(stream_df[derivative_colname]) / np.diff(stream_df.index.values), index=stream_df.index[1:])
+        'd' + derivative_colname + '_dt': _after_first(np.diff(np.asarray(stream_df[derivative_colname])) / dt,
+                                                       len(stream_df))
         for derivative_colname in derivative_colnames or stream_df.columns
     })
 
 
+@instrumented()
 def rolling_similarity(stream_df, similarity_function, *column_names):
-    vectors = list(zip(*[stream_df[column_name] for column_name in column_names]))
+    """
+    Computes the similarity between each vector defined by the given columns and the vector of the previous
+    observation. Similarity functions that have a row-wise equivalent (see similarities.VECTORIZED_SIMILARITIES) are
+    computed on all vectors at once, any other callable is applied per pair of vectors.
+    :param stream_df: Pandas dataframe or CompactStream
+    :param similarity_function: function computing the similarity between two vectors
+    :param column_names: names of the columns that make up the vectors
+    :return: stream dataframe with a column [similarity_function]_[column_names] added
+    """
+    vectorized_similarity_function = vectorized_similarity(similarity_function)
+    if vectorized_similarity_function:
+        vectors = np.column_stack([np.asarray(stream_df[column_name], dtype=float) for column_name in column_names])
+        similarities = vectorized_similarity_function(vectors[:-1], vectors[1:])
+    else:
+        vectors = list(zip(*[stream_df[column_name] for column_name in column_names]))
+        similarities = [similarity_function(vectors[i - 1], vectors[i]) for i in range(1, len(vectors))]
+
     return stream_df.assign(**{
-        similarity_function.__name__ + '_' + '_'.join(column_names): pd.Series([
-            similarity_function(vectors[i - 1], vectors[i]) for i in range(1, len(vectors))
-        ], index=stream_df.index[1:])
+        similarity_function.__name__ + '_' + '_'.join(column_names): _after_first(similarities, len(stream_df))
     })
+
+
+RESAMPLE_METHODS = ('linear', 'previous', 'nearest')
+
+
+def _enclosing_observations(seconds, grid):
+    """
+    Returns per grid second the position of the last observation at or before it and of the first observation after
+    it (the same observation at the end of the stream), and whether the grid second lies within the observed range.
+    """
+    previous = np.searchsorted(seconds, grid, side='right') - 1
+    within = (previous >= 0) & (grid <= seconds[-1]) if len(seconds) else np.zeros(len(grid), dtype=bool)
+    previous = np.clip(previous, 0, max(len(seconds) - 1, 0))
+    return previous, np.minimum(previous + 1, max(len(seconds) - 1, 0)), within
+
+
+def _in_gaps(seconds, grid, previous, following, max_gap):
+    """Returns whether grid seconds lie strictly between two subsequent observations more than max_gap seconds apart"""
+    return (seconds[following] - seconds[previous] > max_gap) & (seconds[previous] != grid)
+
+
+def resample_values(seconds, values, grid, method='linear', max_gap=None):
+    """
+    Resamples the (non-missing) values of a single channel onto the given grid of seconds.
+    :param seconds: sorted numpy array of seconds of the observations
+    :param values: numpy array of values of the observations, NaN for missing values
+    :param grid: sorted numpy array of seconds to resample to
+    :param method: 'linear' (interpolation), 'previous' (last observed value) or 'nearest' (closest observation)
+    :param max_gap: optional maximum number of seconds between observations to resample in between, grid seconds
+    within larger gaps become NaN
+    :return: numpy array of floats with one value per grid second, NaN outside the range of observed values
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError('Expecting one of the methods %s, got %s' % (RESAMPLE_METHODS, method))
+    values = np.asarray(values, dtype=float)
+    observed = ~np.isnan(values)
+    seconds, values = np.asarray(seconds)[observed], values[observed]
+    previous, following, within = _enclosing_observations(seconds, grid)
+    if not within.any():
+        return np.full(len(grid), np.nan)
+
+    if method == 'previous':
+        resampled = values[previous]
+    else:
+        durations = (seconds[following] - seconds[previous]).astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fractions = np.where(durations > 0, (grid - seconds[previous]) / durations, 0)
+        if method == 'nearest':
+            resampled = np.where(fractions > 0.5, values[following], values[previous])
+        else:
+            resampled = values[previous] + fractions * (values[following] - values[previous])
+
+    invalid = ~within
+    if max_gap is not None:
+        invalid |= _in_gaps(seconds, grid, previous, following, max_gap)
+    resampled[invalid] = np.nan
+    return resampled
+
+
+@instrumented()
+def resample(stream_df, columns=None, method='linear', max_gap=None, pause_colname=None, lat_long_colname='latlng'):
+    """
+    Resamples a stream with an irregular index (e.g. due to smart recording or pauses) onto a uniform grid of integer
+    seconds from the first to the last observation, such that fixed-size windows (e.g. smooth with use_index=False)
+    correspond to fixed durations. All channels are resampled at once with vectorized lookups of the enclosing
+    observations, using memory proportional to the number of observations and grid seconds.
+    :param stream_df: Pandas dataframe indexed by seconds since the start of the activity, or CompactStream
+    :param columns: iterable of column names to resample, by default all columns
+    :param method: 'linear' (interpolation), 'previous' (last observed value) or 'nearest' (closest observation),
+    lat-long values are interpolated per coordinate
+    :param max_gap: optional maximum number of seconds between observations to resample in between, e.g. to not
+    interpolate over pauses. Grid seconds within larger gaps become NaN, unless pause_colname is given.
+    :param pause_colname: if provided (requires max_gap), values within gaps are resampled as usual and a boolean
+    column with this name marks the grid seconds within gaps between any observations
+    :param lat_long_colname: name of the column with 2-element lat-long lists, in case of a dataframe (the lat-long
+    values of a CompactStream are its 'latlng' column)
+    :return: resampled Pandas dataframe (or CompactStream) with one row per second
+    """
+    if pause_colname is not None and max_gap is None:
+        raise ValueError('Expecting max_gap to mark the gaps in %s' % pause_colname)
+    is_compact = isinstance(stream_df, CompactStream)
+    lat_long_colname = 'latlng' if is_compact else lat_long_colname
+    seconds = np.asarray(stream_df.index)
+    if len(seconds) and np.any(np.diff(seconds) < 0):
+        order = np.argsort(seconds, kind='stable')
+        stream_df, seconds = stream_df.select(order) if is_compact else stream_df.iloc[order], seconds[order]
+    grid = np.arange(np.ceil(seconds[0]), np.floor(seconds[-1]) + 1, dtype=int) if len(seconds) else \
+        np.empty(0, dtype=int)
+    gap_in_values = max_gap if pause_colname is None else None
+    columns = list(columns or stream_df.columns)
+
+    def resampled_lat_long(lat_long):
+        return np.column_stack([resample_values(seconds, lat_long[:, k], grid, method=method, max_gap=gap_in_values)
+                                for k in range(2)]).reshape(-1, 2)
+
+    resampled = {column: resample_values(seconds, stream_df[column], grid, method=method, max_gap=gap_in_values)
+                 for column in columns if column != lat_long_colname}
+    if pause_colname is not None and len(seconds):
+        previous, following, _ = _enclosing_observations(seconds, grid)
+        resampled[pause_colname] = _in_gaps(seconds, grid, previous, following, max_gap)
+
+    if is_compact:
+        return CompactStream(grid, channels=resampled, latlng=resampled_lat_long(stream_df.latlng)
+                             if lat_long_colname in columns and stream_df.latlng is not None else None)
+
+    resampled_df = pd.DataFrame(resampled, index=grid, columns=[column for column in columns + [pause_colname]
+                                                                if column in resampled])
+    if lat_long_colname in columns:
+        lat_long = resampled_lat_long(lat_long_array(stream_df[lat_long_colname].values))
+        resampled_df.insert(columns.index(lat_long_colname), lat_long_colname,
+                            [None if np.isnan(lat) else [lat, lng] for lat, lng in lat_long])
+    return resampled_df
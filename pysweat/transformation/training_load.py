@@ -0,0 +1,140 @@
+"""
+Acute and chronic training load (ATL, CTL) and training stress balance (TSB) per athlete and day, e.g.
+
+    training_load_df = training_load(activity_df, 'suffer_score')
+    state_df = training_load_state(training_load_df)
+
+and later, from the stored state and only the newer activities:
+
+    new_training_load_df = training_load(new_activity_df, 'suffer_score', state_df=state_df)
+
+The loads are computed for all athletes at once on a matrix of daily loads with one column per athlete.
+"""
+import numpy as np
+import pandas as pd
+
+from pysweat.instrumentation import instrumented
+
+STATE_COLUMNS = ['date', 'atl', 'ctl']
+
+
+def _days(dates):
+    return pd.DatetimeIndex(dates).normalize()
+
+
+def daily_loads(activity_df, load_colname, start_date=None, end_date=None, group_colname='athlete_id',
+                date_colname='start_date_local'):
+    """
+    Sums the load of the activities per group (athlete) and day.
+    :param activity_df: Pandas dataframe with (at least) the load, group and date columns
+    :param load_colname: name of the column with the load of an activity, e.g. suffer_score, missing loads count as 0
+    :param start_date: optional first day, by default the day of the first activity
+    :param end_date: optional last day, by default the day of the last activity
+    :return: Pandas dataframe indexed by day, with one column per group and 0 for days without activities
+    """
+    days = _days(activity_df[date_colname])
+    loads = (activity_df[load_colname].astype(float).groupby([days, activity_df[group_colname].values]).sum()
+             .unstack(fill_value=0.))
+    start_date = _days([start_date])[0] if start_date is not None else days.min()
+    end_date = _days([end_date])[0] if end_date is not None else days.max()
+    return loads.reindex(pd.date_range(start_date, end_date, freq='D'), fill_value=0.)
+
+
+def _exponentially_weighted(daily_load_df, days, initial):
+    """Exponentially weighted averages of the daily loads with smoothing factor 1 / days, starting from initial"""
+    prefixed = np.vstack([initial, daily_load_df.values])
+    return pd.DataFrame(prefixed).ewm(alpha=1. / days, adjust=False).mean().values
+
+
+def _stacked(dates, groups, first_days, columns, group_colname):
+    """Stacks the (days, groups) arrays to a long dataframe, leaving out the days before the first day per group"""
+    day_positions, group_positions = np.nonzero(dates.values[:, None] >= first_days[None, :])
+    return pd.DataFrame(dict({group_colname: groups[group_positions], 'date': dates[day_positions]}, **{
+        column: values[day_positions, group_positions] for column, values in columns.items()
+    }))
+
+
+def _training_load(daily_load_df, first_days, initial_atl, initial_ctl, acute_days, chronic_days, group_colname):
+    atl = _exponentially_weighted(daily_load_df, acute_days, initial_atl)
+    ctl = _exponentially_weighted(daily_load_df, chronic_days, initial_ctl)
+    return _stacked(daily_load_df.index, daily_load_df.columns.values, first_days, {
+        'load': daily_load_df.values,
+        'atl': atl[1:],
+        'ctl': ctl[1:],
+        'tsb': (ctl - atl)[:-1]
+    }, group_colname)
+
+
+@instrumented()
+def training_load(activity_df, load_colname, acute_days=7, chronic_days=42, state_df=None, end_date=None,
+                  group_colname='athlete_id', date_colname='start_date_local'):
+    """
+    Computes the acute (ATL) and chronic (CTL) training load per athlete and day as exponentially weighted averages of
+    the daily loads, with smoothing factors 1 / acute_days and 1 / chronic_days, and the training stress balance
+    (TSB) as the difference between the CTL and ATL of the previous day. The averages are computed for all athletes
+    at once, on a matrix of daily loads with one column per athlete.
+
+    Without state, the loads of each athlete start at 0 before the day of their first activity. Given the state of a
+    previous computation (see training_load_state), the loads of the athletes in the state continue from their state
+    on the day after the state date, only using the activities after that date, such that only the newest days
+    need to be computed.
+    :param activity_df: Pandas dataframe with (at least) the load, group and date columns
+    :param load_colname: name of the column with the load of an activity, e.g. suffer_score
+    :param acute_days: number of days of the acute training load time constant
+    :param chronic_days: number of days of the chronic training load time constant
+    :param state_df: optional Pandas dataframe indexed by group (athlete id) with date, atl and ctl columns
+    :param end_date: optional last day, by default the day of the last activity (or the latest state date)
+    :param group_colname: name of the column to group activities by, i.e. athlete
+    :param date_colname: name of the date column
+    :return: Pandas dataframe with group, date, load, atl, ctl and tsb columns, one row per athlete and day
+    """
+    state_df = state_df if state_df is not None else pd.DataFrame(columns=STATE_COLUMNS)
+    state_dates = _days(state_df.date)
+    days = _days(activity_df[date_colname])
+    if end_date is None:
+        end_date = max(days.max() if len(days) else pd.NaT, state_dates.max() if len(state_dates) else pd.NaT)
+    if pd.isnull(end_date):
+        return pd.DataFrame(columns=[group_colname, 'date', 'load', 'atl', 'ctl', 'tsb'])
+    end_date = _days([end_date])[0]
+
+    # activities of athletes in the state are only used after their state date
+    activity_state_dates = pd.Series(state_dates, index=state_df.index).reindex(activity_df[group_colname].values)
+    activity_df = activity_df[~(days <= activity_state_dates.values)]
+
+    training_load_dfs = []
+    new_activity_df = activity_df[~activity_df[group_colname].isin(state_df.index).values]
+    if len(new_activity_df):
+        new_daily_load_df = daily_loads(new_activity_df, load_colname, end_date=end_date, group_colname=group_colname,
+                                        date_colname=date_colname)
+        first_days = (_days(new_activity_df[date_colname]).to_series()
+                      .groupby(new_activity_df[group_colname].values).min())
+        zeros = np.zeros(len(new_daily_load_df.columns))
+        training_load_dfs.append(_training_load(new_daily_load_df, first_days[new_daily_load_df.columns].values, zeros,
+                                                zeros, acute_days, chronic_days, group_colname))
+
+    for state_date, group_state_df in state_df.groupby(state_dates):
+        start_date = state_date + pd.Timedelta(days=1)
+        if start_date > end_date:
+            continue
+        in_group = activity_df[group_colname].isin(group_state_df.index).values
+        daily_load_df = (daily_loads(activity_df[in_group], load_colname, start_date=start_date, end_date=end_date,
+                                     group_colname=group_colname, date_colname=date_colname) if in_group.any()
+                         else pd.DataFrame(index=pd.date_range(start_date, end_date, freq='D')))
+        daily_load_df = daily_load_df.reindex(columns=group_state_df.index, fill_value=0.)
+        first_days = np.full(len(group_state_df), start_date.to_datetime64())
+        training_load_dfs.append(_training_load(daily_load_df, first_days, group_state_df.atl.values.astype(float),
+                                                group_state_df.ctl.values.astype(float), acute_days, chronic_days,
+                                                group_colname))
+
+    if not training_load_dfs:
+        return pd.DataFrame(columns=[group_colname, 'date', 'load', 'atl', 'ctl', 'tsb'])
+    return pd.concat(training_load_dfs, ignore_index=True).sort_values([group_colname, 'date'], ignore_index=True)
+
+
+def training_load_state(training_load_df, group_colname='athlete_id'):
+    """
+    Returns the state to continue a training load computation from, i.e. the last day per athlete.
+    :param training_load_df: Pandas dataframe as returned by training_load
+    :return: Pandas dataframe indexed by group (athlete id) with date, atl and ctl columns
+    """
+    return training_load_df.sort_values('date').groupby(group_colname).last()[STATE_COLUMNS]
@@ -1,5 +1,8 @@
+from collections import deque
 from datetime import timedelta
 
+import numpy as np
+
 
 def subtract_n_minutes(secs, minutes=5, minimum_value=0):
     if secs < minutes * 60:
@@ -11,3 +14,115 @@ def subtract_n_minutes(secs, minutes=5, minimum_value=0):
 def select_activity_window(activity_df, date, window_size_days):
     return activity_df[(activity_df.start_date_local <= date) &
                        (activity_df.start_date_local > date - timedelta(days=window_size_days))]
+
+
+def sliding_minima(values, lefts, rights):
+    """
+    Computes the minimum of values[lefts[k][i]:rights[i]] for every window k and every position i, for one or more
+    measurement columns, in a single pass using monotonic deques (O(n) per window and column). NaN values are ignored,
+    windows without any valid value result in NaN.
+    :param values: numpy array of shape (n,) or (n, columns)
+    :param lefts: sequence of integer arrays of length n with (inclusive) window start positions, one per window; each
+    must be non-decreasing
+    :param rights: integer array of length n with (exclusive) window end positions; must be non-decreasing
+    :return: numpy array of shape (windows, n) or (windows, n, columns), matching the dimensionality of values
+    """
+    values = np.asarray(values, dtype=float)
+    one_dimensional = values.ndim == 1
+    values = values.reshape(len(values), -1)
+    n, n_columns = values.shape
+    lefts = [np.asarray(left).tolist() for left in lefts]
+    rights = np.asarray(rights).tolist()
+    columns = [values[:, column].tolist() for column in range(n_columns)]
+
+    minima = np.full((len(lefts), n, n_columns), np.nan)
+    deques = [[deque() for _ in range(n_columns)] for _ in lefts]
+    pushed = 0
+    for i in range(n):
+        while pushed < rights[i]:
+            for column, column_values in enumerate(columns):
+                value = column_values[pushed]
+                if value != value:  # skip NaN
+                    continue
+                for window_deques in deques:
+                    candidates = window_deques[column]
+                    while candidates and column_values[candidates[-1]] >= value:
+                        candidates.pop()
+                    candidates.append(pushed)
+            pushed += 1
+        for window, window_deques in enumerate(deques):
+            left = lefts[window][i]
+            for column, candidates in enumerate(window_deques):
+                while candidates and candidates[0] < left:
+                    candidates.popleft()
+                if candidates:
+                    minima[window, i, column] = columns[column][candidates[0]]
+
+    return minima[:, :, 0] if one_dimensional else minima
+
+
+def trailing_time_window_minima(seconds, values, window_sizes_seconds):
+    """
+    Computes, for every observation at time t, the minimum value observed in the closed time window [t - w, t], for
+    each of the given window sizes w, in a single pass over the stream.
+    :param seconds: sorted numpy array of observation times (in seconds)
+    :param values: numpy array of shape (n,) or (n, columns)
+    :param window_sizes_seconds: iterable of window sizes, expressed in seconds
+    :return: numpy array of shape (windows, n) or (windows, n, columns)
+    """
+    seconds = np.asarray(seconds)
+    lefts = [np.searchsorted(seconds, seconds - window_size, side='left') for window_size in window_sizes_seconds]
+    return sliding_minima(values, lefts, np.arange(1, len(seconds) + 1))
+
+
+def _time_window_bounds(seconds, window_size, direction):
+    positions = np.arange(len(seconds))
+    if direction == 'backward':  # (t - window_size, t]
+        return np.searchsorted(seconds, seconds - window_size, side='right'), positions + 1
+    elif direction == 'forward':  # [t, t + window_size)
+        return positions, np.searchsorted(seconds, seconds + window_size, side='left')
+    elif direction == 'centered':  # (t - window_size / 2, t + window_size / 2]
+        return (np.searchsorted(seconds, seconds - window_size / 2, side='right'),
+                np.searchsorted(seconds, seconds + window_size / 2, side='right'))
+    else:
+        raise ValueError("Unknown window direction '%s', expecting 'backward', 'forward' or 'centered'" % direction)
+
+
+def time_rolling(seconds, values, window_size, statistic='mean', direction='backward'):
+    """
+    Applies a rolling window statistic to a time-indexed signal, using a window of fixed duration rather than a fixed
+    number of observations. Works directly on (sorted) second offsets, i.e. without any conversion to datetimes.
+    Backward windows cover (t - window_size, t] (consistent with time-based rolling windows in pandas), forward windows
+    cover [t, t + window_size) and centered windows cover (t - window_size / 2, t + window_size / 2]. NaN values are
+    ignored, windows without any valid value result in NaN.
+    :param seconds: sorted numpy array of observation times, expressed in seconds
+    :param values: numpy array of shape (n,) with the signal
+    :param window_size: window duration, expressed in seconds
+    :param statistic: one of 'mean', 'sum', 'min' or 'max'
+    :param direction: one of 'backward', 'forward' or 'centered'
+    :return: numpy array of shape (n,)
+    """
+    seconds = np.asarray(seconds, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if np.any(np.diff(seconds) < 0):
+        raise ValueError('Expecting monotonically increasing seconds')
+    lefts, rights = _time_window_bounds(seconds, window_size, direction)
+
+    if statistic == 'min':
+        return sliding_minima(values, [lefts], rights)[0]
+    elif statistic == 'max':
+        return -sliding_minima(-values, [lefts], rights)[0]
+    elif statistic not in ('mean', 'sum'):
+        raise ValueError("Unknown statistic '%s', expecting 'mean', 'sum', 'min' or 'max'" % statistic)
+
+    valid = ~np.isnan(values)
+    # for means, values are centered around their average first to limit cancellation errors in the cumulative sums
+    offset = values[valid].mean() if statistic == 'mean' and valid.any() else 0
+    cumulative_sums = np.concatenate([[0], np.cumsum(np.where(valid, values - offset, 0))])
+    cumulative_counts = np.concatenate([[0], np.cumsum(valid)])
+    sums = cumulative_sums[rights] - cumulative_sums[lefts]
+    counts = cumulative_counts[rights] - cumulative_counts[lefts]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = sums / counts + offset if statistic == 'mean' else sums
+    return np.where(counts > 0, result, np.nan)
@@ -3,12 +3,18 @@ from setuptools import setup, find_packages
 setup(
     name='pysweat',
     version='0.1.dev4',
-    packages=find_packages(exclude=['contrib', 'docs', 'tests*']),
+    packages=find_packages(exclude=['contrib', 'docs', 'tests*', 'benchmarks*']),
     install_requires=[
         'pymongo>=3',
         'pandas>=0.20',
         'arrow>=0.12'
     ],
+    extras_require={
+        'parquet': ['pyarrow>=14']
+    },
+    entry_points={
+        'console_scripts': ['pysweat-backfill=pysweat.backfill:main']
+    },
     url='https://github.com/jsamoocha/pysweat',
     license='Apache',
     author='Jonatan Samoocha',
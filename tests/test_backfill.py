@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+import mock
+from mock import patch
+
+from pysweat.backfill import run_backfill, load_checkpoint
+
+
+def _max_heartrate(stream_df):
+    return stream_df.heartrate.max()
+
+
+class BackfillTest(unittest.TestCase):
+    stream_features = {'max_hr': ('heartrate', _max_heartrate)}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.directory, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def _mock_batches(mongo_mock, activity_batches, stream_batches):
+        mongo_mock.db.activities.find.return_value.sort.return_value.limit.side_effect = activity_batches
+        mongo_mock.db.streams.find.return_value.batch_size.side_effect = [iter(streams) for streams in stream_batches]
+
+    @patch('pymongo.MongoClient')
+    def test_run_backfill_saves_features_per_batch(self, mongo_mock):
+        """Should compute and save features per batch, until no activities are missing the feature"""
+        self._mock_batches(mongo_mock, [
+            [{'strava_id': 1, 'start_date_local': datetime(2015, 5, 1)},
+             {'strava_id': 2, 'start_date_local': datetime(2015, 5, 2)}],
+            [{'strava_id': 3, 'start_date_local': datetime(2015, 5, 3)}],
+            []
+        ], [
+            [{'activity_id': 1, 'type': 'time', 'data': [0, 1]},
+             {'activity_id': 1, 'type': 'heartrate', 'data': [120, 130]}],
+            []
+        ])
+
+        result = run_backfill(mongo_mock, 'max_hr', batch_size=2, checkpoint_path=self.checkpoint_path,
+                              stream_features=self.stream_features)
+
+        self.assertEqual(3, result['processed'])
+        self.assertEqual(2, result['failed'])
+        self.assertEqual(1, mongo_mock.db.activities.bulk_write.call_count)  # second batch has nothing to save
+        saved_updates = mongo_mock.db.activities.bulk_write.call_args_list[0][0][0]
+        self.assertEqual(1, len(saved_updates))  # features that could not be computed are not saved
+        self.assertEqual({'$set': {'max_hr': 130}}, saved_updates[0]._doc)
+        self.assertEqual((datetime(2015, 5, 3), 3), load_checkpoint(self.checkpoint_path, 'max_hr', 'Run'))
+
+    @patch('pymongo.MongoClient')
+    def test_run_backfill_resumes_from_checkpoint(self, mongo_mock):
+        """Should only query activities after the watermark in the checkpoint"""
+        with open(self.checkpoint_path, 'w') as checkpoint_file:
+            json.dump({'max_hr/Ride': {'start_date_local': '2015-05-02T00:00:00', 'strava_id': 2}}, checkpoint_file)
+        self._mock_batches(mongo_mock, [[]], [])
+
+        result = run_backfill(mongo_mock, 'max_hr', activity_type='Ride', checkpoint_path=self.checkpoint_path,
+                              stream_features=self.stream_features)
+
+        self.assertEqual(0, result['processed'])
+        query = mongo_mock.db.activities.find.call_args[0][0]
+        self.assertEqual('Ride', query['type'])
+        self.assertEqual({'$exists': False}, query['max_hr'])
+        self.assertEqual([{'start_date_local': {'$gt': datetime(2015, 5, 2)}},
+                          {'start_date_local': datetime(2015, 5, 2), 'strava_id': {'$gt': 2}}], query['$or'])
+
+    @patch('pymongo.MongoClient')
+    def test_run_backfill_failing_feature_function(self, mongo_mock):
+        """Should count activities for which the feature function raises an exception as failed"""
+        self._mock_batches(mongo_mock, [[{'strava_id': 1, 'start_date_local': datetime(2015, 5, 1)}]], [
+            [{'activity_id': 1, 'type': 'time', 'data': [0, 1]},
+             {'activity_id': 1, 'type': 'heartrate', 'data': [120, 130]}]
+        ])
+
+        with self.assertLogs(level='WARNING'):
+            result = run_backfill(mongo_mock, 'failing', max_batches=1,
+                                  stream_features={'failing': ('heartrate', lambda stream_df: np.log(None))})
+
+        self.assertEqual(1, result['failed'])
+
+    @patch('pymongo.MongoClient')
+    def test_run_backfill_malformed_streams(self, mongo_mock):
+        """Should count activities with malformed streams as failed and move the watermark past them"""
+        self._mock_batches(mongo_mock, [[{'strava_id': 1, 'start_date_local': datetime(2015, 5, 1)},
+                                         {'strava_id': 2, 'start_date_local': datetime(2015, 5, 2)}], []], [
+            [{'activity_id': 1, 'type': 'time', 'data': [0, 1, 2]},
+             {'activity_id': 1, 'type': 'heartrate', 'data': [120, 130]},
+             {'activity_id': 2, 'type': 'time', 'data': [0, 1]},
+             {'activity_id': 2, 'type': 'heartrate', 'data': [120, 140]}]
+        ])
+
+        with self.assertLogs(level='WARNING'):
+            result = run_backfill(mongo_mock, 'max_hr', checkpoint_path=self.checkpoint_path,
+                                  stream_features=self.stream_features)
+
+        self.assertEqual(2, result['processed'])
+        self.assertEqual(1, result['failed'])
+        self.assertEqual({'$set': {'max_hr': 140}}, mongo_mock.db.activities.bulk_write.call_args[0][0][0]._doc)
+        self.assertEqual((datetime(2015, 5, 2), 2), load_checkpoint(self.checkpoint_path, 'max_hr', 'Run'))
+
+    @patch('pymongo.MongoClient')
+    def test_run_backfill_prefetching_streams(self, mongo_mock):
+        """Should compute the same features when prefetching streams in I/O threads"""
+        mongo_mock.db.activities.find.return_value.sort.return_value.limit.side_effect = [
+            [{'strava_id': strava_id, 'start_date_local': datetime(2015, 5, strava_id)} for strava_id in range(1, 9)],
+            []
+        ]
+        mongo_mock.db.streams.find.side_effect = lambda query, projection: mock.MagicMock(**{
+            'batch_size.return_value': iter([stream for strava_id in query['activity_id']['$in'] for stream in [
+                {'activity_id': strava_id, 'type': 'time', 'data': [0, 1]},
+                {'activity_id': strava_id, 'type': 'heartrate', 'data': [120, 120 + strava_id]}
+            ]])
+        })
+
+        result = run_backfill(mongo_mock, 'max_hr', batch_size=8, stream_features=self.stream_features,
+                              io_threads=2)
+
+        self.assertEqual(8, result['processed'])
+        self.assertEqual(0, result['failed'])
+        self.assertEqual(8, mongo_mock.db.streams.find.call_count)  # chunks of batch_size / (4 * io_threads)
+        saved_updates = mongo_mock.db.activities.bulk_write.call_args[0][0]
+        self.assertEqual([{'$set': {'max_hr': 120 + strava_id}} for strava_id in range(1, 9)],
+                         [update._doc for update in saved_updates])
@@ -0,0 +1,193 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from pysweat.compact import CompactStream, compact_frame, memory_report, object_ids
+from pysweat.features.activities import ActivityFeatures
+from pysweat.features.athletes import summary_stats, summary_stats_all, update_summary_stats
+from pysweat.transformation.activities import compute_moving_averages
+from pysweat.transformation.gps import lat_long_to_x_y
+from pysweat.transformation.streams import derivative, smooth
+
+
+class CompactStreamTest(unittest.TestCase):
+    stream_df = pd.DataFrame({
+        'latlng': [[52.1, 5.3], [52.2, 5.4], None, [52.4, 5.4], [52.5, 5.3], [52.5, 5.2]],
+        'heartrate': [100., 110., 120., 130., 125., 120.]
+    }, index=[0, 1, 3, 4, 5, 7])
+
+    def test_from_df(self):
+        """Should convert lat-long lists to an (n, 2) array and measurements to channels of the given dtype"""
+        stream = CompactStream.from_df(self.stream_df, dtype=np.float32)
+
+        self.assertEqual(np.int64, stream.time.dtype)
+        self.assertEqual(np.float32, stream['heartrate'].dtype)
+        self.assertEqual((6, 2), stream.latlng.shape)
+        self.assertTrue(np.isnan(stream.latlng[2]).all())
+        self.assertEqual(['heartrate', 'latlng'], stream.columns)
+        self.assertEqual(6, len(stream))
+
+    def test_from_df_without_copy(self):
+        """Should share memory with the dataframe for columns that already have the channel dtype"""
+        stream = CompactStream.from_df(self.stream_df)
+
+        self.assertTrue(np.shares_memory(stream['heartrate'], self.stream_df.heartrate.values))
+
+    def test_to_df_round_trip(self):
+        """Should convert back to a dataframe with lat and lng columns, or a column of lat-long lists"""
+        stream = CompactStream.from_df(self.stream_df)
+
+        result_df = stream.to_df()
+        self.assertEqual(['heartrate', 'lat', 'lng'], list(result_df.columns))
+        self.assertEqual(list(self.stream_df.index), list(result_df.index))
+        round_trip = CompactStream.from_df(result_df)
+        np.testing.assert_array_equal(stream.latlng, round_trip.latlng)
+
+        lat_long_df = stream.to_df(lat_long_colname='latlng')
+        self.assertEqual(self.stream_df.latlng.tolist(), lat_long_df.latlng.tolist())
+
+    def test_from_lists_duplicate_timestamps(self):
+        """Should sort by time and keep the last observation of duplicate timestamps"""
+        stream = CompactStream.from_lists([0, 2, 1, 1], {'heartrate': [100, 120, 110, None]})
+
+        self.assertEqual([0, 1, 2], list(stream.time))
+        np.testing.assert_array_equal([100, np.nan, 120], stream['heartrate'])
+
+    def test_select_and_assign(self):
+        """Should select observations by mask and add channels without modifying the original stream"""
+        stream = CompactStream.from_df(self.stream_df)
+
+        selected = stream.select(stream.time > 3).assign(double_heartrate=stream['heartrate'][stream.time > 3] * 2)
+
+        self.assertEqual([4, 5, 7], list(selected.time))
+        self.assertEqual([260, 250, 240], list(selected['double_heartrate']))
+        self.assertNotIn('double_heartrate', stream)
+        self.assertEqual(3, len(selected.latlng))
+
+    def test_fractional_seconds(self):
+        """Should raise ValueError for time values that are not whole seconds, instead of truncating them"""
+        with self.assertRaises(ValueError):
+            CompactStream.from_df(pd.DataFrame({'heartrate': [1., 2, 3]}, index=[0.5, 1.2, 1.9]))
+        with self.assertRaises(ValueError):
+            CompactStream.from_lists([0, 1.5], {'heartrate': [100, 110]})
+
+        self.assertEqual([0, 1, 2], list(CompactStream.from_df(self.stream_df[:3].set_axis([0., 1., 2.])).time))
+
+    def test_to_numpy(self):
+        """Should stack the given channels as float columns of a 2-dimensional array"""
+        stream = CompactStream.from_df(self.stream_df).assign(cadence=np.arange(6))
+
+        self.assertEqual((6, 2), stream.to_numpy().shape)
+        self.assertEqual([0., 1., 2.], list(stream.to_numpy(['cadence'])[:3, 0]))
+
+    def test_nbytes(self):
+        """Should report the memory used by all arrays"""
+        stream = CompactStream.from_df(self.stream_df, dtype=np.float32)
+
+        self.assertEqual(6 * 8 + 6 * 4 + 6 * 2 * 8, stream.nbytes)
+
+    def test_transformations(self):
+        """Should support gps projection, smoothing and derivatives, equal to the dataframe versions"""
+        stream = CompactStream.from_df(self.stream_df)
+
+        result = derivative(smooth(lat_long_to_x_y(stream), smooth_colnames=['x'], use_index=True), ['x_smooth'])
+        expected_df = derivative(smooth(lat_long_to_x_y(self.stream_df), smooth_colnames=['x'], use_index=True),
+                                 ['x_smooth'])
+
+        self.assertEqual([0, 1, 4, 5, 7], list(result.time))
+        np.testing.assert_allclose(expected_df.dx_smooth_dt.values, result['dx_smooth_dt'])
+
+    def test_features(self):
+        """Should compute features on CompactStreams, equal to the dataframe versions"""
+        stream = CompactStream.from_df(self.stream_df)
+
+        self.assertAlmostEqual(ActivityFeatures.sum_of_turns(self.stream_df[['latlng']], window_size=1),
+                               ActivityFeatures.sum_of_turns(stream, window_size=1), 9)
+        self.assertAlmostEqual(ActivityFeatures.sum_of_turns(self.stream_df[['latlng']], window_size=1),
+                               ActivityFeatures.sum_of_turns(stream, window_size=1, use_pipeline=True), 9)
+        pd.testing.assert_frame_equal(
+            ActivityFeatures.max_values_maintained_for_n_minutes(self.stream_df[['heartrate']], window_sizes=[1]),
+            ActivityFeatures.max_values_maintained_for_n_minutes(CompactStream.from_df(self.stream_df[['heartrate']]),
+                                                                 window_sizes=[1]),
+            check_column_type=False)
+
+
+class CompactFrameTest(unittest.TestCase):
+    random = np.random.RandomState(42)
+    athlete_df = pd.DataFrame({'id': [1, 2, 3]})
+    activity_df = pd.DataFrame({
+        '_id': [ObjectId() for _ in range(200)],
+        'strava_id': np.arange(10 ** 10, 10 ** 10 + 200),
+        'athlete_id': random.choice([1, 2], size=200),
+        'type': random.choice(['Run', 'Ride', 'Swim'], size=200),
+        'name': ['activity %d' % i for i in range(200)],
+        'start_date_local': pd.Timestamp('2015-05-01') + pd.to_timedelta(random.uniform(0, 90, size=200), unit='D'),
+        'distance': random.gamma(4, 2500, size=200),
+        'average_speed': random.lognormal(1, 0.3, size=200)
+    })
+
+    def test_compact_frame_dtypes(self):
+        """Should convert categorical-like columns to category and downcast numeric columns, dropping _id"""
+        compact_df = compact_frame(self.activity_df)
+
+        self.assertEqual(['strava_id', 'athlete_id', 'type', 'name', 'start_date_local', 'distance', 'average_speed'],
+                         list(compact_df.columns))
+        self.assertEqual('category', compact_df.type.dtype)
+        self.assertEqual(object, compact_df.name.dtype)
+        self.assertEqual(np.int64, compact_df.strava_id.dtype)
+        self.assertEqual(np.int8, compact_df.athlete_id.dtype)
+        self.assertEqual(np.float32, compact_df.distance.dtype)
+        np.testing.assert_allclose(self.activity_df.distance, compact_df.distance, rtol=1e-6)
+
+    def test_compact_frame_float_tolerance(self):
+        """Should keep float64 columns with values that differ more than the tolerance as float32"""
+        compact_df = compact_frame(self.activity_df, float_rtol=1e-9)
+
+        self.assertEqual(np.float64, compact_df.distance.dtype)
+
+    def test_compact_frame_excluded_columns(self):
+        """Should leave excluded columns unchanged"""
+        compact_df = compact_frame(self.activity_df, exclude=['type', 'distance'])
+
+        self.assertEqual(object, compact_df.type.dtype)
+        self.assertEqual(np.float64, compact_df.distance.dtype)
+
+    def test_compact_frame_encoded_ids(self):
+        """Should encode ObjectIds as integers from which they can be restored"""
+        compact_df = compact_frame(self.activity_df, id_handling='encode')
+
+        self.assertEqual(list(self.activity_df._id), object_ids(compact_df))
+        with self.assertRaises(ValueError):
+            compact_frame(self.activity_df, id_handling='unknown')
+
+    def test_memory_report(self):
+        """Should report the memory usage per column and in total before and after compacting"""
+        compact_df = compact_frame(self.activity_df)
+
+        report = memory_report(self.activity_df, compact_df)
+
+        self.assertEqual(list(self.activity_df.columns) + ['total'], list(report.index))
+        self.assertEqual(0, report.bytes_after['_id'])
+        self.assertEqual(self.activity_df.memory_usage(index=False, deep=True).sum(), report.bytes_before['total'])
+        self.assertLess(report.ratio['total'], 0.5)
+
+    def test_downstream_functions(self):
+        """Should compute the same moving averages and summary stats on compacted frames"""
+        compact_df = compact_frame(self.activity_df)
+
+        pd.testing.assert_frame_equal(compute_moving_averages(self.activity_df.drop(columns='_id'), 'average_speed',
+                                                              [7, 28]),
+                                      compute_moving_averages(compact_df, 'average_speed', [7, 28]),
+                                      check_dtype=False, check_categorical=False, check_like=True, rtol=1e-6)
+        stats_df = summary_stats_all(self.athlete_df, self.activity_df, ['average_speed'])
+        pd.testing.assert_frame_equal(stats_df, summary_stats_all(self.athlete_df, compact_df, ['average_speed']),
+                                      check_dtype=False, rtol=1e-6)
+        run_df = self.activity_df[self.activity_df.type == 'Run'].reset_index(drop=True)
+        pd.testing.assert_frame_equal(summary_stats(self.athlete_df, run_df),
+                                      summary_stats(self.athlete_df, compact_frame(run_df)), check_dtype=False,
+                                      rtol=1e-6)
+        pd.testing.assert_frame_equal(update_summary_stats(stats_df, self.activity_df[:50], ['average_speed']),
+                                      update_summary_stats(stats_df, compact_df[:50], ['average_speed']),
+                                      check_dtype=False, rtol=1e-6)
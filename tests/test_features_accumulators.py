@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pysweat.compact import CompactStream
+from pysweat.features.accumulators import MaxValuesMaintainedAccumulator, SumOfTurnsAccumulator
+from pysweat.features.activities import ActivityFeatures, sum_of_turns_kernel
+
+
+class AccumulatorsTest(unittest.TestCase):
+    random = np.random.RandomState(42)
+    seconds = np.cumsum(random.choice([1, 1, 1, 2, 30], size=600))
+    heading = np.cumsum(random.normal(0, 0.4, size=600))
+    stream_df = pd.DataFrame({
+        'latlng': np.column_stack([52.1 + np.cumsum(np.cos(heading)) * 3e-5,
+                                   5.3 + np.cumsum(np.sin(heading)) * 5e-5]).tolist(),
+        'heartrate': np.round(140 + np.cumsum(random.normal(0, 1, size=600))),
+        'watts': random.normal(200, 30, size=600)
+    }, index=seconds)
+    stream_df.loc[stream_df.index[50:55], 'latlng'] = None
+    chunk_boundaries = [1, 2, 50, 53, 54, 120, 121, 300, 450]
+
+    def _chunks(self, columns):
+        return np.split(self.stream_df[columns], self.chunk_boundaries)
+
+    def test_max_values_maintained_equal_to_batch(self):
+        """Should compute the same maximum values as the batch function on the complete stream"""
+        accumulator = MaxValuesMaintainedAccumulator(window_sizes=[1, 5])
+        for chunk_df in self._chunks(['heartrate', 'watts']):
+            accumulator.update(chunk_df)
+
+        pd.testing.assert_frame_equal(
+            ActivityFeatures.max_values_maintained_for_n_minutes(self.stream_df[['heartrate', 'watts']],
+                                                                 window_sizes=[1, 5]),
+            accumulator.result())
+
+    def test_max_values_maintained_bounded_state(self):
+        """Should only keep the observations within the largest window"""
+        accumulator = MaxValuesMaintainedAccumulator(window_sizes=[1])
+        for chunk_df in self._chunks(['heartrate']):
+            accumulator.update(CompactStream.from_df(chunk_df))
+
+        self.assertLessEqual(len(accumulator._seconds), 61)
+        self.assertEqual(ActivityFeatures.max_value_maintained_for_n_minutes(self.stream_df[['heartrate']], 1),
+                         accumulator.result().iloc[0, 0])
+
+    def test_max_values_maintained_unordered_chunks(self):
+        """Should raise an error for chunks that do not follow the previous chunks"""
+        accumulator = MaxValuesMaintainedAccumulator().update(self.stream_df[['heartrate']].iloc[10:20])
+
+        with self.assertRaises(ValueError):
+            accumulator.update(self.stream_df[['heartrate']].iloc[:10])
+
+    def test_sum_of_turns_equal_to_batch(self):
+        """Should compute the same sum of turns as the batch function, given the center latitude of the stream"""
+        latitudes = np.array(self.stream_df.latlng.dropna().tolist())[:, 0]
+        center_lat = latitudes.min() + (latitudes.max() - latitudes.min()) / 2
+        for window_size, noise_threshold in [(3, 0), (10, 0.3)]:
+            accumulator = SumOfTurnsAccumulator(window_size, noise_threshold, center_lat=center_lat)
+            for chunk_df in self._chunks(['latlng']):
+                accumulator.update(chunk_df)
+
+            self.assertAlmostEqual(ActivityFeatures.sum_of_turns(self.stream_df[['latlng']], window_size=window_size,
+                                                                 noise_threshold=noise_threshold),
+                                   accumulator.result(), 6)
+            self.assertLessEqual(len(accumulator._seconds), 2 * window_size + 4)
+
+    def test_sum_of_turns_incremental_results(self):
+        """Should provide the sum of turns of the stream so far after each chunk"""
+        accumulator = SumOfTurnsAccumulator(window_size=3, center_lat=52.1)
+        for chunk_df in self._chunks(['latlng']):
+            accumulator.update(CompactStream.from_df(chunk_df))
+
+            stream_so_far_df = self.stream_df.latlng.loc[:chunk_df.index[-1]].dropna()
+            self.assertAlmostEqual(sum_of_turns_kernel(stream_so_far_df.index.values,
+                                                       np.array(stream_so_far_df.tolist()), center_lat=52.1),
+                                   accumulator.result(), 6)
+
+    def test_sum_of_turns_without_observations(self):
+        """Should return NaN if no lat-long values have been received, like the batch function"""
+        accumulator = SumOfTurnsAccumulator().update(self.stream_df[['latlng']].iloc[50:55])
+
+        self.assertTrue(np.isnan(accumulator.result()))
@@ -1,8 +1,11 @@
 import unittest
 
+import numpy as np
 import pandas as pd
 
-from pysweat.features.activities import ActivityFeatures, _moving_sum_filter
+from pysweat.compact import CompactStream
+from pysweat.features.activities import ActivityFeatures, _moving_sum_filter, best_effort_feature_name, \
+    best_efforts_kernel, sum_of_turns_kernel, turns_stream
 
 
 class ActivityFeaturesTest(unittest.TestCase):
@@ -77,6 +80,38 @@ class ActivityFeaturesTest(unittest.TestCase):
         total_turns_result = ActivityFeatures.sum_of_turns(lat_long_stream_df)
         self.assertAlmostEqual(0.0, total_turns_result, places=2)
 
+    def test_sum_of_turns_kernel_equivalent_to_pipeline(self):
+        """Should compute the same sum of turns as the dataframe pipeline, for random routes with irregular timing"""
+        random = np.random.RandomState(42)
+        seconds = np.cumsum(random.choice([1, 1, 2, 5], size=500))
+        lat_long = np.cumsum(random.normal(0, 1e-4, size=(500, 2)), axis=0) + [52.1, 5.3]
+        lat_long_stream_df = pd.DataFrame({'latlng': lat_long.tolist()}, index=seconds)
+
+        for window_size in [1, 3, 10]:
+            for noise_threshold in [0, 0.25, 0.5]:
+                self.assertAlmostEqual(
+                    ActivityFeatures.sum_of_turns(lat_long_stream_df, window_size, noise_threshold, use_pipeline=True),
+                    sum_of_turns_kernel(seconds, lat_long, window_size, noise_threshold), 6)
+
+    def test_turns_stream(self):
+        """Should return stream with intermediate columns of the sum of turns computation"""
+        lat_long_stream_df = pd.DataFrame(
+            {'latlng': [[-0.2, 0.0], [-0.1, 0.0], [0.0, 0.0], [0.0, 0.1], [0.0, 0.2]]},
+            index=[1, 2, 3, 4, 5])
+
+        turns_stream_df = turns_stream(lat_long_stream_df)
+
+        self.assertIn('x_smooth', turns_stream_df.columns)
+        self.assertIn('dx_smooth_dt', turns_stream_df.columns)
+        self.assertAlmostEqual(0.35, turns_stream_df.deviation.sum(), 2)
+
+    def test_sum_of_turns_empty_stream(self):
+        """Should return NaN if the stream has no lat-long values"""
+        lat_long_stream_df = pd.DataFrame({'latlng': [None, None]}, index=[1, 2])
+
+        with self.assertLogs(level='WARNING'):
+            self.assertTrue(np.isnan(ActivityFeatures.sum_of_turns(lat_long_stream_df)))
+
     def test_max_value_maintained_for_n_minutes(self):
         """Should return the maximum heartrate that was maintained for at least 5 minutes by default"""
         hr_stream_df = pd.DataFrame(
@@ -107,3 +142,59 @@ class ActivityFeaturesTest(unittest.TestCase):
         )
         with self.assertRaises(ValueError):
             ActivityFeatures.max_value_maintained_for_n_minutes(multi_stream_df)
+
+    def test_max_values_maintained_for_n_minutes_multiple_windows_and_measurements(self):
+        """Should return the maximum values maintained for each given window, for all measurements at once"""
+        multi_stream_df = pd.DataFrame(
+            {'heartrate': [100, 115, 120, 100, 110],
+             'power': [200, 215, 220, 200, 210]},
+            index=[180, 360, 540, 720, 900]
+        )
+        max_values_result = ActivityFeatures.max_values_maintained_for_n_minutes(multi_stream_df, window_sizes=[5, 8])
+
+        self.assertListEqual([5, 8], list(max_values_result.index))
+        self.assertListEqual(['heartrate', 'power'], list(max_values_result.columns))
+        self.assertEqual(115, max_values_result.heartrate[5])
+        self.assertEqual(100, max_values_result.heartrate[8])
+        self.assertEqual(215, max_values_result.power[5])
+        self.assertEqual(200, max_values_result.power[8])
+
+    def test_best_efforts(self):
+        """Should return the shortest time per segment distance, interpolating at the start and end of segments"""
+        test_stream_df = pd.DataFrame({'distance': [0, 100, 300, 350, 450, 600, 700]},
+                                      index=[0, 50, 80, 110, 120, 150, 200])
+
+        best_efforts = ActivityFeatures.best_efforts(test_stream_df, segment_distances=[100, 200, 1000])
+
+        self.assertEqual(['best_effort_100', 'best_effort_200', 'best_effort_1000'], list(best_efforts.index))
+        self.assertAlmostEqual(10, best_efforts.best_effort_100)  # 350 -> 450 m
+        self.assertAlmostEqual(10 + 100 / 150. * 30, best_efforts.best_effort_200)  # 350 -> 550 m, ends within 450-600
+        self.assertTrue(np.isnan(best_efforts.best_effort_1000))
+
+    def test_best_efforts_pauses_and_missing_distances(self):
+        """Should not count the time of a pause before a segment and ignore observations without distance"""
+        test_stream_df = pd.DataFrame({'distance': [0, 100, 100, np.nan, 200, 300]}, index=[0, 20, 300, 310, 320, 340])
+
+        best_efforts = ActivityFeatures.best_efforts(test_stream_df, segment_distances=[200])
+
+        self.assertAlmostEqual(40, best_efforts.best_effort_200)
+
+    def test_best_efforts_compact_stream(self):
+        """Should return the same best efforts for compact streams"""
+        random = np.random.RandomState(42)
+        test_stream_df = pd.DataFrame({'distance': np.cumsum(random.uniform(0, 8, size=500))},
+                                      index=np.cumsum(random.choice([1, 1, 2, 30], size=500)))
+
+        pd.testing.assert_series_equal(ActivityFeatures.best_efforts(test_stream_df),
+                                       ActivityFeatures.best_efforts(CompactStream.from_df(test_stream_df)))
+
+    def test_best_efforts_kernel_short_streams(self):
+        """Should return NaN for streams with less than two observations"""
+        self.assertTrue(np.all(np.isnan(best_efforts_kernel(np.array([0]), np.array([0.]), [400, 1000]))))
+        self.assertTrue(np.all(np.isnan(best_efforts_kernel(np.array([]), np.array([]), [400]))))
+
+    def test_best_effort_feature_name(self):
+        """Should return feature names without decimal points"""
+        self.assertEqual('best_effort_1000', best_effort_feature_name(1000))
+        self.assertEqual('best_effort_21097_5', best_effort_feature_name(21097.5))
+        self.assertEqual('best_effort_1000000', best_effort_feature_name(1e6))
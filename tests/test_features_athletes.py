@@ -2,7 +2,7 @@ import unittest
 import pandas as pd
 import numpy as np
 from math import sqrt
-from pysweat.features.athletes import summary_stats
+from pysweat.features.athletes import summary_stats, summary_stats_all, update_summary_stats
 
 
 class AthletesFeaturesTest(unittest.TestCase):
@@ -90,3 +90,49 @@ class AthletesFeaturesTest(unittest.TestCase):
         })
 
         self.assertRaises(ValueError, summary_stats, athlete_df, activity_df)
+
+    def test_summary_stats_all_types_and_measurements(self):
+        """Should return summary stats for all given measurements of all activity types at once"""
+        athlete_df = pd.DataFrame({
+            'id': [1, 2],
+            'name': ['foo', 'bar']
+        })
+        activity_df = pd.DataFrame({
+            'athlete_id': [1, 2, 1, 1],
+            'average_speed': [10, 13, 12, 25],
+            'heart_rate': [130, 140, np.nan, 150],
+            'type': ['Run', 'Run', 'Run', 'Ride']
+        })
+
+        features_results = summary_stats_all(athlete_df, activity_df, activity_measurements=['average_speed',
+                                                                                            'heart_rate'])
+
+        self.assertEqual(len(features_results), 2)
+        self.assertCountEqual(features_results.columns, ['id', 'name', 'run_count', 'ride_count'] + [
+            activity_type + '_' + measurement + '_' + stat for activity_type in ['run', 'ride']
+            for measurement in ['average_speed', 'heart_rate'] for stat in ['mean', 'std', 'count']])
+        self.assertAlmostEqual(features_results.run_average_speed_mean[0], 11, 9)
+        self.assertAlmostEqual(features_results.run_average_speed_std[0], sqrt(2), 9)
+        self.assertEqual(features_results.run_count[0], 2)
+        self.assertEqual(features_results.run_heart_rate_count[0], 1)
+        self.assertAlmostEqual(features_results.run_heart_rate_mean[0], 130, 9)
+        self.assertAlmostEqual(features_results.ride_average_speed_mean[0], 25, 9)
+        self.assertTrue(np.isnan(features_results.ride_average_speed_mean[1]))
+        self.assertTrue(np.isnan(features_results.ride_count[1]))
+
+    def test_update_summary_stats(self):
+        """Should return the same summary stats as computing them from all activities at once"""
+        athlete_df = pd.DataFrame({
+            'id': [1, 2, 3],
+            'name': ['foo', 'bar', 'baz']
+        })
+        activity_df = pd.DataFrame({
+            'athlete_id': [1, 2, 1, 1, 2, 1],
+            'average_speed': [10, 13, 12, 25, 14, 11],
+            'type': ['Run', 'Run', 'Run', 'Ride', 'Run', 'Ride']
+        })
+
+        features_results = update_summary_stats(summary_stats_all(athlete_df, activity_df[:3]), activity_df[3:])
+        expected_results = summary_stats_all(athlete_df, activity_df)
+
+        pd.testing.assert_frame_equal(expected_results, features_results[expected_results.columns], check_dtype=False)
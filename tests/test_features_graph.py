@@ -0,0 +1,181 @@
+import unittest
+import weakref
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from pysweat.compact import CompactStream
+from pysweat.features.activities import GPS_FEATURES, ActivityFeatures, sum_of_turns_kernel
+from pysweat.features.graph import FeatureGraph
+from pysweat.transformation.gps import haversine_distance
+
+
+class Intermediate(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class FeatureGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = Counter()
+        self.graph = FeatureGraph()
+
+        @self.graph.stage('doubled', 'stream')
+        def doubled(stream_df):
+            self.calls['doubled'] += 1
+            return Intermediate(stream_df.x.values * 2)
+
+        @self.graph.stage('summed', 'doubled')
+        def summed(doubled_values):
+            self.calls['summed'] += 1
+            return doubled_values.value.sum()
+
+        @self.graph.feature('total', 'summed')
+        def total(summed_value):
+            return summed_value
+
+        @self.graph.feature('mean', 'summed', 'stream')
+        def mean(summed_value, stream_df):
+            return summed_value / len(stream_df)
+
+        @self.graph.feature('maximum', 'doubled')
+        def maximum(doubled_values):
+            self.doubled_ref = weakref.ref(doubled_values)
+            return doubled_values.value.max()
+
+        @self.graph.feature('count', 'stream')
+        def count(stream_df):
+            self.doubled_alive = self.doubled_ref() is not None
+            return len(stream_df)
+
+        self.stream_df = pd.DataFrame({'x': [1., 2., 3.]})
+
+    def test_compute_shared_stages_once(self):
+        """Should compute the stages shared by several features only once"""
+        result = self.graph.compute(self.stream_df)
+
+        pd.testing.assert_series_equal(pd.Series([12., 4., 6., 3.], index=['total', 'mean', 'maximum', 'count']),
+                                       result)
+        self.assertEqual({'doubled': 1, 'summed': 1}, dict(self.calls))
+
+    def test_compute_requested_features(self):
+        """Should only compute the stages needed by the requested features, in the requested order"""
+        result = self.graph.compute(self.stream_df, feature_names=['maximum', 'count'])
+
+        self.assertEqual(['maximum', 'count'], list(result.index))
+        self.assertEqual({'doubled': 1}, dict(self.calls))
+
+    def test_compute_frees_stages(self):
+        """Should free stages as soon as no remaining feature needs them"""
+        self.graph.compute(self.stream_df, feature_names=['maximum', 'count'])
+
+        self.assertFalse(self.doubled_alive)
+
+    def test_compute_bounded_memo(self):
+        """Should recompute evicted stages when the number of memoized stages is bounded"""
+        result = self.graph.compute(self.stream_df, feature_names=['total', 'maximum'], max_memo_size=1)
+
+        self.assertEqual([12., 6.], list(result))
+        self.assertEqual({'doubled': 2, 'summed': 1}, dict(self.calls))
+
+    def test_compute_failed_features(self):
+        """Should return NaN for features of which a stage fails"""
+        @self.graph.feature('failing', 'doubled')
+        def failing(doubled_values):
+            raise ValueError('failed')
+
+        result = self.graph.compute(self.stream_df, feature_names=['failing', 'total'])
+
+        self.assertTrue(np.isnan(result.failing))
+        self.assertEqual(12, result.total)
+
+    def test_declaration_errors(self):
+        """Should raise an error for unknown, undefined or duplicate stages"""
+        with self.assertRaises(ValueError):
+            self.graph.compute(self.stream_df, feature_names=['unknown'])
+        with self.assertRaises(ValueError):
+            self.graph.stage('tripled', 'undefined')(lambda values: values)
+        with self.assertRaises(ValueError):
+            self.graph.stage('doubled', 'stream')(lambda values: values)
+
+    def test_compute_feature_parameters(self):
+        """Should pass feature parameters to the feature and its stages, sharing stages with equal parameters only"""
+        @self.graph.stage('scaled', 'stream')
+        def scaled(stream_df, factor=1):
+            self.calls['scaled'] += 1
+            return stream_df.x.values * factor
+
+        @self.graph.feature('scaled_total', 'scaled')
+        def scaled_total(scaled_values, offset=0):
+            return scaled_values.sum() + offset
+
+        @self.graph.feature('scaled_maximum', 'scaled')
+        def scaled_maximum(scaled_values):
+            return scaled_values.max()
+
+        result = self.graph.compute(self.stream_df, feature_names=['scaled_total', 'scaled_maximum'],
+                                    feature_kwargs={'scaled_total': {'factor': 10, 'offset': 1}})
+        default_result = self.graph.compute(self.stream_df, feature_names=['scaled_total', 'scaled_maximum'],
+                                            feature_kwargs={'scaled_total': {'factor': 1}})
+
+        self.assertEqual([61, 3], list(result))
+        self.assertEqual([6, 3], list(default_result))
+        self.assertEqual(3, self.calls['scaled'])
+        with self.assertRaises(ValueError):
+            self.graph.compute(self.stream_df, feature_names=['scaled_maximum'],
+                               feature_kwargs={'scaled_maximum': {'offset': 1}})
+
+
+class GPSFeaturesTest(unittest.TestCase):
+    random = np.random.RandomState(42)
+    heading = np.cumsum(random.normal(0, 0.2, size=1200))
+    stream_df = pd.DataFrame({
+        'latlng': np.column_stack([52.1 + np.cumsum(np.cos(heading)) * 3e-5,
+                                   5.3 + np.cumsum(np.sin(heading)) * 5e-5]).tolist()
+    }, index=np.cumsum(random.choice([1, 1, 1, 2, 30], size=1200)))
+    stream_df.loc[stream_df.index[50:55], 'latlng'] = None
+
+    def test_gps_features(self):
+        """Should compute the same features as the corresponding ActivityFeatures and transformation functions"""
+        distance_df = haversine_distance(self.stream_df).fillna(0).haversine_distance.cumsum().to_frame('distance')
+
+        result = ActivityFeatures.gps_features(self.stream_df)
+
+        self.assertEqual(GPS_FEATURES.features, list(result.index))
+        self.assertAlmostEqual(ActivityFeatures.sum_of_turns(self.stream_df, use_pipeline=True), result.sum_of_turns)
+        self.assertAlmostEqual(distance_df.distance.iloc[-1], result.gps_distance)
+        self.assertTrue(0 < result.max_distance_from_start <= result.gps_distance)
+        self.assertAlmostEqual(result.gps_distance / (distance_df.index[-1] - distance_df.index[0]),
+                               result.average_gps_speed)
+        np.testing.assert_array_equal(ActivityFeatures.best_efforts(distance_df, segment_distances=[1000, 5000]),
+                                      [result.gps_best_effort_1000, result.gps_best_effort_5000])
+
+    def test_gps_features_compact_stream(self):
+        """Should compute the same features for compact streams"""
+        pd.testing.assert_series_equal(ActivityFeatures.gps_features(self.stream_df),
+                                       ActivityFeatures.gps_features(CompactStream.from_df(self.stream_df)))
+
+    def test_sum_of_turns_parameters(self):
+        """Should compute the sum of turns for non-default parameters, equal to sum_of_turns and its kernel"""
+        lat_long_clean_df = self.stream_df.dropna()
+        for window_size, noise_threshold in [(5, 0), (10, 0.3)]:
+            result = ActivityFeatures.gps_features(self.stream_df, ['sum_of_turns', 'gps_distance'], feature_kwargs={
+                'sum_of_turns': {'window_size': window_size, 'noise_threshold': noise_threshold}
+            })
+
+            self.assertAlmostEqual(sum_of_turns_kernel(lat_long_clean_df.index.values,
+                                                       np.array(lat_long_clean_df.latlng.tolist()),
+                                                       window_size=window_size, noise_threshold=noise_threshold),
+                                   result.sum_of_turns)
+            self.assertAlmostEqual(ActivityFeatures.sum_of_turns(self.stream_df, window_size=window_size,
+                                                                 noise_threshold=noise_threshold, use_pipeline=True),
+                                   result.sum_of_turns)
+            self.assertEqual(ActivityFeatures.sum_of_turns(self.stream_df, window_size=window_size,
+                                                           noise_threshold=noise_threshold), result.sum_of_turns)
+
+    def test_gps_features_without_lat_long(self):
+        """Should return NaN for all features of streams without lat-long values"""
+        result = ActivityFeatures.gps_features(pd.DataFrame({'latlng': [None, None]}, index=[0, 1]))
+
+        self.assertTrue(result.isnull().all())
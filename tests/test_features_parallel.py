@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pysweat.features.activities import ActivityFeatures
+from pysweat.features.parallel import map_activity_features
+
+
+def _first_latitude(stream_df):
+    return stream_df.latlng.iloc[0][0]
+
+
+class ParallelFeaturesTest(unittest.TestCase):
+    lat_long_stream_df = pd.DataFrame(
+        {'latlng': [[52.1, 5.3], [52.2, 5.4], [58, 5.5], [52.4, 5.4], [52.5, 5.3]]},
+        index=[1, 2, 3, 4, 5])
+    hr_stream_df = pd.DataFrame({'heartrate': [100, 115, 120, 100, 110]}, index=[180, 360, 540, 720, 900])
+
+    def test_map_activity_features(self):
+        """Should compute feature for all activities in worker processes, equal to computing them directly"""
+        work_items = [(activity_id, self.lat_long_stream_df) for activity_id in range(5)]
+
+        result = map_activity_features(ActivityFeatures.sum_of_turns, iter(work_items), n_workers=2, chunk_size=2,
+                                       window_size=1)
+
+        self.assertEqual(['strava_id', 'sum_of_turns'], list(result.columns))
+        self.assertCountEqual(range(5), result.strava_id)
+        for value in result.sum_of_turns:
+            self.assertAlmostEqual(ActivityFeatures.sum_of_turns(self.lat_long_stream_df, window_size=1), value, 9)
+
+    def test_map_activity_features_lat_long_lists(self):
+        """Should provide lat-long values as 2-element sequences to the feature function"""
+        result = map_activity_features(_first_latitude, [(1, self.lat_long_stream_df)], n_workers=1)
+
+        self.assertEqual(52.1, result._first_latitude[0])
+
+    def test_map_activity_features_errors_and_missing_streams(self):
+        """Should return NaN with a warning for failed computations, and skip activities without stream"""
+        work_items = [(1, self.hr_stream_df), (2, None), (3, self.hr_stream_df[[]])]
+
+        with self.assertLogs(level='WARNING'):
+            result = map_activity_features(ActivityFeatures.max_value_maintained_for_n_minutes, work_items,
+                                           feature_name='max_heartrate_5min', n_workers=2)
+
+        self.assertEqual([1, 3], sorted(result.strava_id))
+        self.assertEqual(115, result.set_index('strava_id').max_heartrate_5min[1])
+        self.assertTrue(np.isnan(result.set_index('strava_id').max_heartrate_5min[3]))
+
+    def test_map_activity_features_missing_lat_long(self):
+        """Should provide missing lat-long values as None, equal to computing the feature directly"""
+        lat_long_stream_df = self.lat_long_stream_df.copy()
+        lat_long_stream_df.loc[3, 'latlng'] = None
+
+        result = map_activity_features(ActivityFeatures.sum_of_turns, [(1, lat_long_stream_df)], n_workers=2,
+                                       window_size=1)
+
+        self.assertAlmostEqual(ActivityFeatures.sum_of_turns(lat_long_stream_df, window_size=1),
+                               result.sum_of_turns[0], 9)
+
+    def test_map_activity_features_conversion_errors(self):
+        """Should return NaN with a warning for streams that cannot be converted, and compute the other activities"""
+        invalid_stream_df = pd.DataFrame({'latlng': [[52.1, 5.3], [52.2, 5.4, 1.0]]}, index=[1, 2])
+        work_items = [(1, invalid_stream_df), (2, self.lat_long_stream_df)]
+
+        with self.assertLogs(level='WARNING'):
+            result = map_activity_features(_first_latitude, work_items, n_workers=2).set_index('strava_id')
+
+        self.assertTrue(np.isnan(result._first_latitude[1]))
+        self.assertEqual(52.1, result._first_latitude[2])
@@ -0,0 +1,133 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import pymongo
+
+from pysweat.compact import CompactStream
+from pysweat.features.activities import ActivityFeatures
+from pysweat.instrumentation import INSTRUMENTED, instrumented, profile
+from pysweat.persistence.general import load_documents
+from pysweat.persistence.streams import load_stream
+from pysweat.transformation.gps import lat_long_to_x_y
+
+
+@instrumented('test.double')
+def _double(values):
+    return values * 2
+
+
+@instrumented('test.collection_name')
+def _collection_name(collection, documents_df=None):
+    return collection.name
+
+
+@instrumented('test.failing')
+def _failing(values):
+    raise ValueError('failing stage')
+
+
+class InstrumentationTest(unittest.TestCase):
+    lat_long_stream_df = pd.DataFrame(
+        {'latlng': [[52.1, 5.3], [52.2, 5.4], None, [52.4, 5.4], [52.5, 5.3]]},
+        index=[1, 2, 3, 4, 5])
+
+    def test_registered_stages(self):
+        """Should register public pipeline functions by module and name"""
+        self.assertIn('transformation.gps.lat_long_to_x_y', INSTRUMENTED)
+        self.assertIn('features.activities.ActivityFeatures.sum_of_turns', INSTRUMENTED)
+        self.assertIs(load_stream, INSTRUMENTED['persistence.streams.load_stream'])
+
+    def test_not_recording_outside_profile(self):
+        """Should only call the original function if no profile is active"""
+        with profile() as stages:
+            pass
+        _double(pd.Series([1, 2]))
+
+        self.assertEqual({}, stages.stats)
+
+    def test_profile_records_calls_time_and_rows(self):
+        """Should aggregate calls, wall time and rows in/out per stage"""
+        with profile() as stages:
+            _double(pd.Series([1, 2, 3]))
+            result = _double(values=pd.Series([1, 2]))
+
+        self.assertEqual([2, 4], list(result))
+        self.assertEqual(2, stages.stats['test.double']['calls'])
+        self.assertEqual(5, stages.stats['test.double']['rows_in'])
+        self.assertEqual(5, stages.stats['test.double']['rows_out'])
+        self.assertGreater(stages.stats['test.double']['total_seconds'], 0)
+
+    def test_profile_rows_of_pipeline_functions(self):
+        """Should count rows of dataframe arguments and results, e.g. observations dropped by lat_long_to_x_y"""
+        with profile() as stages:
+            lat_long_to_x_y(self.lat_long_stream_df)
+
+        self.assertEqual(5, stages.stats['transformation.gps.lat_long_to_x_y']['rows_in'])
+        self.assertEqual(4, stages.stats['transformation.gps.lat_long_to_x_y']['rows_out'])
+
+    def test_profile_rows_of_other_arguments(self):
+        """Should only count rows of dataframes, series, arrays and compact streams, not e.g. of pymongo collections"""
+        collection = pymongo.MongoClient(connect=False).db.activities
+
+        with profile() as stages:
+            _collection_name(collection)
+            _collection_name(collection, documents_df=pd.DataFrame({'x': [1, 2]}))
+            _double(np.arange(3))
+            lat_long_to_x_y(CompactStream.from_df(self.lat_long_stream_df))
+
+        self.assertEqual(2, stages.stats['test.collection_name']['rows_in'])
+        self.assertEqual(0, stages.stats['test.collection_name']['rows_out'])
+        self.assertEqual(3, stages.stats['test.double']['rows_in'])
+        self.assertEqual(5, stages.stats['transformation.gps.lat_long_to_x_y']['rows_in'])
+        self.assertEqual(4, stages.stats['transformation.gps.lat_long_to_x_y']['rows_out'])
+
+    def test_profile_load_documents_from_collection(self):
+        """Should profile loading documents from a (real, unconnected) pymongo collection"""
+        collection = pymongo.MongoClient(connect=False, serverSelectionTimeoutMS=1).db.activities
+
+        with profile() as stages:
+            with self.assertRaises(pymongo.errors.ServerSelectionTimeoutError):
+                load_documents(collection, {'type': 'Run'})
+
+        self.assertEqual(1, stages.stats['persistence.general.load_documents']['calls'])
+
+    def test_profile_records_nested_stages(self):
+        """Should record nested stages separately, with inclusive time for the outer stage"""
+        with profile() as stages:
+            ActivityFeatures.sum_of_turns(self.lat_long_stream_df.dropna(), use_pipeline=True)
+
+        report_df = stages.report()
+        self.assertEqual('features.activities.ActivityFeatures.sum_of_turns', report_df.index[0])
+        self.assertIn('transformation.streams.smooth', report_df.index)
+        self.assertEqual(['calls', 'total_seconds', 'mean_seconds', 'max_seconds', 'rows_in', 'rows_out'],
+                         list(report_df.columns))
+        self.assertTrue((report_df.total_seconds <= report_df.total_seconds.iloc[0]).all())
+
+    def test_profile_records_failing_calls(self):
+        """Should record calls that raise, without rows out, and re-raise"""
+        with profile() as stages:
+            with self.assertRaises(ValueError):
+                _failing(pd.Series([1, 2]))
+
+        self.assertEqual(1, stages.stats['test.failing']['calls'])
+        self.assertEqual(0, stages.stats['test.failing']['rows_out'])
+
+    def test_profile_callback(self):
+        """Should call the callback after each call of an instrumented stage"""
+        calls = []
+        with profile(callback=lambda stage, seconds, rows_in, rows_out: calls.append((stage, rows_in, rows_out))):
+            _double(pd.Series([1, 2]))
+            _double(3)
+
+        self.assertEqual([('test.double', 2, 2), ('test.double', None, None)], calls)
+
+    def test_nested_profiles(self):
+        """Should record calls in all active profiles"""
+        with profile() as outer_stages:
+            _double(pd.Series([1]))
+            with profile() as inner_stages:
+                _double(pd.Series([1]))
+
+        self.assertEqual(2, outer_stages.stats['test.double']['calls'])
+        self.assertEqual(1, inner_stages.stats['test.double']['calls'])
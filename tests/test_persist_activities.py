@@ -1,9 +1,13 @@
 import unittest
+from datetime import datetime
 import pandas as pd
 import numpy as np
 from mock import patch
 from pymongo import UpdateOne
-from pysweat.persistence.activities import load_activities, save_activities
+from pymongo.errors import BulkWriteError
+from pysweat.persistence.activities import load_activities, save_activities, ACTIVITY_DTYPES, \
+    get_first_activity_without_feature_for_type, get_missing_feature_backlog, missing_features_query
+from pysweat.persistence.general import ensure_indexes
 
 
 class ActivityPersistenceTest(unittest.TestCase):
@@ -28,6 +32,39 @@ class ActivityPersistenceTest(unittest.TestCase):
         load_activities(mongo_mock, athlete_id=123, ride_type={'$exists': False})
         mongo_mock.db.activities.find.assert_called_with({'athlete_id': 123, 'ride_type': {'$exists': False}})
 
+    @patch('pymongo.MongoClient')
+    def test_load_activities_with_projection(self, mongo_mock):
+        """Should only request the given fields"""
+        load_activities(mongo_mock, fields=['strava_id', 'type'], athlete_id=123)
+        mongo_mock.db.activities.find.assert_called_with({'athlete_id': 123},
+                                                         {'_id': False, 'strava_id': True, 'type': True})
+
+    @patch('pymongo.MongoClient')
+    def test_load_activities_with_dtypes(self, mongo_mock):
+        """Should convert loaded columns to the given dtypes, ignoring columns that were not loaded"""
+        mongo_mock.db.activities.find.return_value = iter([
+            {'strava_id': 456, 'type': 'Run', 'start_date_local': '2015-05-01 10:00', 'average_speed': 3.1},
+            {'strava_id': 457, 'type': 'Ride', 'start_date_local': '2015-05-02 11:00', 'average_speed': 8.2}])
+
+        result = load_activities(mongo_mock, dtypes=ACTIVITY_DTYPES)
+
+        self.assertEqual('category', result.type.dtype.name)
+        self.assertEqual('datetime64[ns]', result.start_date_local.dtype.name)
+        self.assertEqual('float32', result.average_speed.dtype.name)
+        self.assertEqual('int64', result.strava_id.dtype.name)
+
+    @patch('pymongo.MongoClient')
+    def test_load_activities_in_chunks(self, mongo_mock):
+        """Should return generator of dataframes with at most chunksize activities"""
+        mongo_mock.db.activities.find.return_value.batch_size.return_value = iter(
+            [{'strava_id': strava_id} for strava_id in range(5)])
+
+        result = load_activities(mongo_mock, chunksize=2, type='Run')
+
+        self.assertEqual([[0, 1], [2, 3], [4]], [list(chunk_df.strava_id) for chunk_df in result])
+        mongo_mock.db.activities.find.assert_called_with({'type': 'Run'})
+        mongo_mock.db.activities.find.return_value.batch_size.assert_called_with(2)
+
     @patch('pymongo.MongoClient')
     def test_save_activities_all(self, mock_mongo):
         test_df = pd.DataFrame({'strava_id': [11, 12], 'a': [1, 2], 'b': [4, 5]})
@@ -39,7 +76,7 @@ class ActivityPersistenceTest(unittest.TestCase):
         mock_mongo.db.activities.bulk_write.assert_called_with([
             UpdateOne({'strava_id': 11}, {'$set': {'a': 1, 'b': 4}}, upsert=True),
             UpdateOne({'strava_id': 12}, {'$set': {'a': 2, 'b': 5}}, upsert=True)
-        ])
+        ], ordered=False)
 
     @patch('pymongo.MongoClient')
     def test_save_activities_non_numeric(self, mock_mongo):
@@ -52,7 +89,7 @@ class ActivityPersistenceTest(unittest.TestCase):
         mock_mongo.db.activities.bulk_write.assert_called_with([
             UpdateOne({'strava_id': 11}, {'$set': {'a': 1, 'b': 'foo'}}, upsert=True),
             UpdateOne({'strava_id': 12}, {'$set': {'a': 2, 'b': 'bar'}}, upsert=True)
-        ])
+        ], ordered=False)
 
     @patch('pymongo.MongoClient')
     def test_save_activities_with_nan_values(self, mock_mongo):
@@ -64,4 +101,102 @@ class ActivityPersistenceTest(unittest.TestCase):
         mock_mongo.db.activities.bulk_write.assert_called_with([
             UpdateOne({'strava_id': 11}, {'$set': {'b': 4}}, upsert=True),
             UpdateOne({'strava_id': 12}, {'$set': {'a': 2}}, upsert=True)
+        ], ordered=False)
+
+    @patch('pymongo.MongoClient')
+    def test_save_activities_subset_of_columns(self, mock_mongo):
+        """Should only save the given columns, and skip activities without any values to save"""
+        test_df = pd.DataFrame({'strava_id': [11, 12], 'a': [1, 2], 'feature': [0.5, np.nan]})
+
+        save_activities(mock_mongo, test_df, columns=['feature'])
+
+        mock_mongo.db.activities.bulk_write.assert_called_once_with([
+            UpdateOne({'strava_id': 11}, {'$set': {'feature': 0.5}}, upsert=True)
+        ], ordered=False)
+
+    @patch('pymongo.MongoClient')
+    def test_save_activities_changed_values_only(self, mock_mongo):
+        """Should only save values that differ from the original activities"""
+        original_df = pd.DataFrame({'strava_id': [12, 11], 'a': [2, 1], 'b': [np.nan, 4], 'c': ['x', 'y']})
+        test_df = pd.DataFrame({'strava_id': [11, 12, 13], 'a': [1, 3, 1], 'b': [4, 5, np.nan], 'c': ['y', 'x', 'z']})
+
+        save_activities(mock_mongo, test_df, original_df=original_df)
+
+        mock_mongo.db.activities.bulk_write.assert_called_once_with([
+            UpdateOne({'strava_id': 12}, {'$set': {'a': 3, 'b': 5}}, upsert=True),
+            UpdateOne({'strava_id': 13}, {'$set': {'a': 1, 'c': 'z'}}, upsert=True)
+        ], ordered=False)
+
+    @patch('pymongo.MongoClient')
+    def test_save_activities_in_chunks_with_summary(self, mock_mongo):
+        """Should write activities in chunks, returning a summary per chunk including failed activities"""
+        mock_mongo.db.activities.bulk_write.side_effect = [
+            BulkWriteError({'nMatched': 1, 'nModified': 1, 'nUpserted': 0, 'writeErrors': [{'index': 1}]}),
+            mock_mongo.write_result
+        ]
+        mock_mongo.write_result.matched_count = 0
+        mock_mongo.write_result.modified_count = 0
+        mock_mongo.write_result.upserted_count = 1
+        test_df = pd.DataFrame({'strava_id': [11, 12, 13], 'a': [1, 2, 3]})
+
+        summaries = save_activities(mock_mongo, test_df, chunk_size=2)
+
+        self.assertEqual(2, mock_mongo.db.activities.bulk_write.call_count)
+        self.assertEqual([{'matched': 1, 'modified': 1, 'upserted': 0, 'failed_ids': [12]},
+                          {'matched': 0, 'modified': 0, 'upserted': 1, 'failed_ids': []}], summaries)
+
+    @patch('pymongo.MongoClient')
+    def test_get_first_activity_without_feature_for_type(self, mongo_mock):
+        """Should match activities of the type without the feature and group by athlete"""
+        get_first_activity_without_feature_for_type(mongo_mock, 'sum_of_turns', activity_type='Ride', athlete_id=5)
+
+        mongo_mock.db.activities.aggregate.assert_called_once_with([
+            {'$match': {'type': 'Ride', 'suspicious': {'$exists': False}, 'flagged': False,
+                        'sum_of_turns': {'$exists': False}, 'athlete_id': 5}},
+            {'$group': {'_id': '$athlete_id', 'first_date': {'$min': '$start_date_local'}}}
+        ])
+
+    def test_missing_features_query(self):
+        """Should match activities of the types and athlete without any of the features"""
+        self.assertEqual({'suspicious': {'$exists': False}, 'flagged': False,
+                          '$or': [{'sum_of_turns': {'$exists': False}}, {'gps_distance': {'$exists': False}}],
+                          'type': {'$in': ['Run']}, 'athlete_id': 5},
+                         missing_features_query(['sum_of_turns', 'gps_distance'], ('Run',), 5))
+        self.assertNotIn('type', missing_features_query(['sum_of_turns']))
+
+    @patch('pymongo.MongoClient')
+    def test_get_missing_feature_backlog(self, mongo_mock):
+        """Should query the backlog of multiple features and types in one aggregation, one row per missing feature"""
+        mongo_mock.db.activities.aggregate.return_value = iter([
+            {'_id': {'athlete_id': 1, 'type': 'Run'}, '0_first_date': datetime(2015, 5, 1), '0_count': 3,
+             '1_first_date': None, '1_count': 0},
+            {'_id': {'athlete_id': 2, 'type': 'Ride'}, '0_first_date': datetime(2015, 6, 1), '0_count': 1,
+             '1_first_date': datetime(2015, 7, 1), '1_count': 2}
         ])
+
+        result = get_missing_feature_backlog(mongo_mock, ['sum_of_turns', 'max_heartrate_5min'], ['Run', 'Ride'])
+
+        pipeline = mongo_mock.db.activities.aggregate.call_args[0][0]
+        self.assertEqual(1, mongo_mock.db.activities.aggregate.call_count)
+        self.assertEqual({'$in': ['Run', 'Ride']}, pipeline[0]['$match']['type'])
+        self.assertEqual([{'sum_of_turns': {'$exists': False}}, {'max_heartrate_5min': {'$exists': False}}],
+                         pipeline[0]['$match']['$or'])
+        self.assertEqual({'$sum': {'$cond': [{'$eq': [{'$type': '$max_heartrate_5min'}, 'missing']}, 1, 0]}},
+                         pipeline[1]['$group']['1_count'])
+        self.assertEqual(['athlete_id', 'type', 'feature', 'first_date', 'count'], list(result.columns))
+        self.assertEqual([(2, 'Ride', 'max_heartrate_5min', datetime(2015, 7, 1), 2),
+                          (2, 'Ride', 'sum_of_turns', datetime(2015, 6, 1), 1),
+                          (1, 'Run', 'sum_of_turns', datetime(2015, 5, 1), 3)],
+                         [tuple(row) for row in result.itertuples(index=False)])
+
+    @patch('pymongo.MongoClient')
+    def test_ensure_indexes(self, mongo_mock):
+        """Should create the compound indexes of streams and activities"""
+        mongo_mock.db.streams.create_index.return_value = 'activity_id_1_type_1'
+
+        result = ensure_indexes(mongo_mock)
+
+        mongo_mock.db.streams.create_index.assert_called_once_with([('activity_id', 1), ('type', 1)])
+        mongo_mock.db.activities.create_index.assert_any_call([('type', 1), ('athlete_id', 1),
+                                                               ('start_date_local', 1)])
+        self.assertEqual(['activity_id_1_type_1'], result['streams'])
@@ -21,3 +21,18 @@ class AthletePersistenceTest(unittest.TestCase):
     def test_load_athletes_with_simple_filter(self, mongo_mock):
         load_athletes(mongo_mock, sex='F')
         mongo_mock.db.athletes.find.assert_called_with({'sex': 'F'})
+
+    @patch('pymongo.MongoClient')
+    def test_load_athletes_with_projection_and_dtypes_in_chunks(self, mongo_mock):
+        """Should return generator of dataframes with the given fields and dtypes"""
+        mongo_mock.db.athletes.find.return_value.batch_size.return_value = iter([
+            {'id': 123, 'sex': 'M'},
+            {'id': 456, 'sex': 'F'},
+            {'id': 789, 'sex': 'F'}
+        ])
+
+        result = list(load_athletes(mongo_mock, fields=['id', 'sex'], dtypes={'sex': 'category'}, chunksize=2))
+
+        mongo_mock.db.athletes.find.assert_called_with({}, {'_id': False, 'id': True, 'sex': True})
+        self.assertEqual([2, 1], [len(chunk_df) for chunk_df in result])
+        self.assertEqual('category', result[0].sex.dtype.name)
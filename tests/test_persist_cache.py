@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from mock import patch
+
+from pysweat.persistence.cache import StreamCache
+from pysweat.persistence.streams import load_stream
+
+
+class StreamCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.hr_stream_df = pd.DataFrame({'heartrate': [100, 110, 120]}, index=[0, 1, 3])
+        self.latlng_stream_df = pd.DataFrame({'latlng': [[52.1, 5.3], [52.2, 5.4]]}, index=[0, 2])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_and_get(self):
+        """Should return cached streams with original index, values and dtypes, counting hits and misses"""
+        cache = StreamCache(self.directory)
+        self.assertIsNone(cache.get(123, 'heartrate'))
+
+        cache.put(123, 'heartrate', self.hr_stream_df)
+        cache.put(123, 'latlng', self.latlng_stream_df)
+        hr_result = cache.get(123, 'heartrate')
+        latlng_result = cache.get(123, 'latlng')
+
+        self.assertEqual([0, 1, 3], list(hr_result.index))
+        self.assertEqual([100, 110, 120], list(hr_result.heartrate))
+        self.assertEqual(self.hr_stream_df.heartrate.dtype, hr_result.heartrate.dtype)
+        self.assertEqual([[52.1, 5.3], [52.2, 5.4]], list(latlng_result.latlng))
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_persisted_between_instances(self):
+        """Should find streams cached by another cache instance on the same directory"""
+        StreamCache(self.directory).put(123, 'heartrate', self.hr_stream_df)
+
+        cache = StreamCache(self.directory)
+
+        self.assertIn((123, 'heartrate'), cache)
+        self.assertEqual([100, 110, 120], list(cache.get(123, 'heartrate').heartrate))
+
+    def test_persisted_names_with_underscores_and_other_files(self):
+        """Should parse keys with underscores from the file names, skipping other files in the directory"""
+        StreamCache(self.directory).put('123_', 'heart_', self.hr_stream_df.rename(columns={'heartrate': 'heart_'}))
+        np.save(os.path.join(self.directory, 'other__file.npy'), np.arange(3))
+        np.save(os.path.join(self.directory, 'other.npy'), np.arange(3))
+
+        cache = StreamCache(self.directory)
+
+        self.assertEqual(1, len(cache))
+        self.assertIn(('123_', 'heart_'), cache)
+        self.assertEqual([100, 110, 120], list(cache.get('123_', 'heart_').heart_))
+
+    def test_lru_eviction(self):
+        """Should evict least recently used streams when exceeding the size budget"""
+        cache = StreamCache(self.directory)
+        cache.put(1, 'heartrate', self.hr_stream_df)
+        cache.max_bytes = 2 * cache.size_bytes
+        cache.put(2, 'heartrate', self.hr_stream_df)
+        cache.get(1, 'heartrate')
+
+        cache.put(3, 'heartrate', self.hr_stream_df)
+
+        self.assertEqual(1, cache.evictions)
+        self.assertIn((1, 'heartrate'), cache)
+        self.assertNotIn((2, 'heartrate'), cache)
+        self.assertIn((3, 'heartrate'), cache)
+        self.assertEqual(2, len(os.listdir(self.directory)))
+
+    def test_version_mismatch_invalidates(self):
+        """Should treat streams cached with another version as missing"""
+        cache = StreamCache(self.directory)
+        cache.put(123, 'heartrate', self.hr_stream_df, version='v1')
+
+        self.assertIsNotNone(cache.get(123, 'heartrate', version='v1'))
+        self.assertIsNone(cache.get(123, 'heartrate', version='v2'))
+        self.assertNotIn((123, 'heartrate'), cache)
+
+    def test_invalidate_activity(self):
+        """Should remove all streams of an activity"""
+        cache = StreamCache(self.directory)
+        cache.put(123, 'heartrate', self.hr_stream_df)
+        cache.put(123, 'latlng', self.latlng_stream_df)
+        cache.put(456, 'heartrate', self.hr_stream_df)
+
+        cache.invalidate(123)
+
+        self.assertEqual(1, len(cache))
+        self.assertIn((456, 'heartrate'), cache)
+
+    @patch('pymongo.MongoClient')
+    def test_load_stream_through_cache(self, mongo_mock):
+        """Should only load stream data from MongoDB on cache misses or changed source streams"""
+        mongo_mock.db.streams.aggregate.return_value = [{'_id': 'a', 'type': 'time', 'data_size': 3},
+                                                        {'_id': 'b', 'type': 'heartrate', 'data_size': 3}]
+        mongo_mock.db.streams.find_one.return_value = {'_id': 'a', 'activity_id': 456, 'data': [101, 102, 103]}
+        cache = StreamCache(self.directory)
+
+        first_result = load_stream(mongo_mock, 456, 'heartrate', cache=cache)
+        second_result = load_stream(mongo_mock, 456, 'heartrate', cache=cache)
+        self.assertEqual(2, mongo_mock.db.streams.find_one.call_count)
+        self.assertEqual(list(first_result.heartrate), list(second_result.heartrate))
+        self.assertEqual(1, cache.hits)
+
+        mongo_mock.db.streams.aggregate.return_value = [{'_id': 'a', 'type': 'time', 'data_size': 3},
+                                                        {'_id': 'c', 'type': 'heartrate', 'data_size': 3}]
+        load_stream(mongo_mock, 456, 'heartrate', cache=cache)
+        self.assertEqual(4, mongo_mock.db.streams.find_one.call_count)
+        self.assertEqual(2, cache.misses)
+
+    @patch('pymongo.MongoClient')
+    def test_load_stream_through_cache_data_changed(self, mongo_mock):
+        """Should reload a stream of which the data changed in place, detected by its length computed by MongoDB"""
+        mongo_mock.db.streams.aggregate.return_value = [{'_id': 'a', 'type': 'time', 'data_size': 3},
+                                                        {'_id': 'b', 'type': 'heartrate', 'data_size': 3}]
+        mongo_mock.db.streams.find_one.return_value = {'_id': 'a', 'activity_id': 456, 'data': [101, 102, 103]}
+        cache = StreamCache(self.directory)
+        load_stream(mongo_mock, 456, 'heartrate', cache=cache)
+
+        mongo_mock.db.streams.aggregate.return_value = [{'_id': 'a', 'type': 'time', 'data_size': 4},
+                                                        {'_id': 'b', 'type': 'heartrate', 'data_size': 4}]
+        mongo_mock.db.streams.find_one.return_value = {'_id': 'a', 'activity_id': 456, 'data': [101, 102, 103, 104]}
+        result = load_stream(mongo_mock, 456, 'heartrate', cache=cache)
+
+        self.assertEqual([101, 102, 103, 104], list(result.heartrate))
+        self.assertEqual(0, cache.hits)
+        pipeline = mongo_mock.db.streams.aggregate.call_args[0][0]
+        self.assertEqual({'$project': {'data': False}}, pipeline[-1])
@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from pysweat.compact import CompactStream
+
+try:
+    from pysweat.persistence.parquet import ParquetStorage
+except ImportError:
+    ParquetStorage = None
+
+
+@unittest.skipIf(ParquetStorage is None, 'pyarrow is not installed')
+class ParquetStorageTest(unittest.TestCase):
+    activities_df = pd.DataFrame({
+        'strava_id': [1, 2, 3, 4],
+        'athlete_id': [10, 10, 11, 11],
+        'type': ['Run', 'Ride', 'Run', 'Virtual Run'],
+        'start_date_local': pd.to_datetime(['2015-05-01', '2015-05-02', '2015-05-03', '2015-05-04']),
+        'average_speed': [3., 8., 3.5, 2.],
+        'flagged': [False, False, False, True]
+    })
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = ParquetStorage(self.directory)
+        self.storage.write_activities(self.activities_df)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_activities_partitioned_by_athlete_and_type(self):
+        """Should store activities in one file per athlete and type"""
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'activities', 'athlete_id=11', 'type=Virtual%20Run',
+                                                    'activities.parquet')))
+        result = self.storage.load_activities().sort_values('strava_id')
+
+        self.assertEqual([1, 2, 3, 4], list(result.strava_id))
+        self.assertEqual([10, 10, 11, 11], list(result.athlete_id))
+        self.assertEqual(list(self.activities_df.type), list(result.type))
+
+    def test_load_activities_query_and_fields(self):
+        """Should only load the given fields of activities matching the query"""
+        result = self.storage.load_activities(fields=['strava_id', 'average_speed', '_id'], type='Run',
+                                              start_date_local={'$gt': datetime(2015, 5, 1)},
+                                              suspicious={'$exists': False})
+
+        self.assertEqual(['strava_id', 'average_speed'], list(result.columns))
+        self.assertEqual([3], list(result.strava_id))
+
+    def test_load_activities_or_and_in(self):
+        """Should support $or and $in conditions"""
+        result = self.storage.load_activities(fields=['strava_id'], **{
+            '$or': [{'athlete_id': {'$in': [10]}, 'type': 'Ride'}, {'flagged': True}]})
+
+        self.assertCountEqual([2, 4], result.strava_id)
+
+    def test_load_activities_in_chunks(self):
+        """Should load activities as generator of dataframes with at most chunksize activities"""
+        result = list(self.storage.load_activities(chunksize=3, dtypes={'type': 'category'}))
+
+        self.assertEqual([3, 1], [len(chunk) for chunk in result])
+        self.assertEqual('category', result[0].type.dtype.name)
+
+    def test_save_activities(self):
+        """Should set non-NaN values of stored activities, add new activities and fail activities without partition"""
+        result = self.storage.save_activities(pd.DataFrame({
+            'strava_id': [1, 3, 5, 6],
+            'sum_of_turns': [1.5, np.nan, 2., 3.],
+            'athlete_id': [np.nan, np.nan, 12, np.nan],
+            'type': [np.nan, np.nan, 'Run', np.nan]
+        }))
+
+        self.assertEqual([{'matched': 1, 'modified': 1, 'upserted': 1, 'failed_ids': [6]}], result)
+        activities_df = self.storage.load_activities().set_index('strava_id')
+        self.assertEqual(1.5, activities_df.sum_of_turns[1])
+        self.assertTrue(np.isnan(activities_df.sum_of_turns[3]))
+        self.assertEqual(3.5, activities_df.average_speed[3])
+        self.assertEqual((12, 'Run'), (activities_df.athlete_id[5], activities_df.type[5]))
+
+    def test_save_activities_unchanged(self):
+        """Should count activities of which no value changed as matched, but not modified"""
+        self.storage.save_activities(pd.DataFrame({'strava_id': [1], 'average_speed': [4.]}))
+
+        result = self.storage.save_activities(pd.DataFrame({'strava_id': [1, 2], 'average_speed': [4., 9.]}))
+
+        self.assertEqual([{'matched': 2, 'modified': 1, 'upserted': 0, 'failed_ids': []}], result)
+
+    def test_get_first_activity_without_feature_for_type(self):
+        """Should return the first date per athlete of non-flagged activities of the type without the feature"""
+        self.storage.save_activities(pd.DataFrame({'strava_id': [1], 'sum_of_turns': [1.5]}))
+
+        self.assertEqual([{'_id': 11, 'first_date': datetime(2015, 5, 3)}],
+                         self.storage.get_first_activity_without_feature_for_type('sum_of_turns'))
+        self.assertEqual([{'_id': 10, 'first_date': datetime(2015, 5, 1)}],
+                         self.storage.get_first_activity_without_feature_for_type('max_heartrate_5min', athlete_id=10))
+        self.assertEqual(['Ride', 'Run', 'Virtual Run'], self.storage.get_activity_types())
+
+    def test_athletes(self):
+        """Should store and load athletes"""
+        self.storage.write_athletes(pd.DataFrame({'id': [10, 11], 'sex': ['M', 'F']}))
+        self.storage.write_athletes(pd.DataFrame({'id': [11], 'sex': ['M']}))
+
+        self.assertEqual(['M'], list(self.storage.load_athletes(id=11).sex))
+        self.assertCountEqual([10, 11], self.storage.get_athlete_ids())
+
+    def test_streams(self):
+        """Should store streams per activity and load single stream types as dataframe or CompactStream"""
+        stream_df = pd.DataFrame({'latlng': [[52.1, 5.3], [52.2, 5.4], None], 'heartrate': [100, 110, 120]},
+                                 index=[0, 1, 3])
+        self.storage.write_streams(7, stream_df[['latlng']])
+        self.storage.write_streams(7, stream_df[['heartrate']])
+
+        latlng_df = self.storage.load_stream(7, 'latlng')
+        self.assertEqual(['latlng'], list(latlng_df.columns))
+        self.assertEqual(stream_df.latlng.tolist(), latlng_df.latlng.tolist())
+        heartrate_stream = self.storage.load_stream(7, 'heartrate', compact=True)
+        self.assertIs(type(heartrate_stream), CompactStream)
+        self.assertEqual([100, 110, 120], list(heartrate_stream['heartrate']))
+        self.assertIsNone(self.storage.load_stream(7, 'watts'))
+        self.assertEqual([(8, None)], list(self.storage.load_streams([8], ['heartrate'])))
+
+    def test_streams_dtypes(self):
+        """Should load integer streams as stored, also after adding streams with other timestamps"""
+        self.storage.write_streams(7, pd.DataFrame({'heartrate': [100, 110, 120]}, index=[0, 1, 3]))
+        self.assertEqual(np.int64, self.storage.load_stream(7, 'heartrate').heartrate.dtype)
+
+        self.storage.write_streams(7, pd.DataFrame({'watts': [200, 210]}, index=[0, 2]))
+        self.storage.write_streams(7, pd.DataFrame({'cadence': [80, 85, 88, 90]}, index=[0, 1, 2, 3]))
+
+        self.assertEqual(np.int64, self.storage.load_stream(7, 'cadence').cadence.dtype)
+        np.testing.assert_array_equal([100, 110, np.nan, 120], self.storage.load_stream(7, 'heartrate').heartrate)
+        self.assertEqual([200, 210], list(self.storage.load_stream(7, 'watts', compact=True)['watts'][[0, 2]]))
+
+    def test_get_missing_feature_backlog(self):
+        """Should return the first date and count of activities without each feature per athlete and type"""
+        self.storage.save_activities(pd.DataFrame({'strava_id': [1, 3], 'sum_of_turns': [1.5, 2.5]}))
+
+        result = self.storage.get_missing_feature_backlog(['sum_of_turns', 'max_heartrate_5min'], ['Run', 'Ride'])
+
+        self.assertEqual([(10, 'Ride', 'max_heartrate_5min', pd.Timestamp('2015-05-02'), 1),
+                          (10, 'Run', 'max_heartrate_5min', pd.Timestamp('2015-05-01'), 1),
+                          (11, 'Run', 'max_heartrate_5min', pd.Timestamp('2015-05-03'), 1),
+                          (10, 'Ride', 'sum_of_turns', pd.Timestamp('2015-05-02'), 1)],
+                         [tuple(row) for row in result.itertuples(index=False)])
@@ -0,0 +1,116 @@
+import threading
+import time
+import unittest
+
+from pysweat.compact import CompactStream
+from pysweat.persistence.prefetch import prefetch_streams
+from pysweat.persistence.streams import load_streams
+
+
+class InProcessStreams(object):
+    """Minimal in-process stand-in for the streams collection, supporting the queries made by load_streams"""
+
+    def __init__(self, streams, latency=0., failing_activity_id=None):
+        self.streams = streams
+        self.latency = latency
+        self.failing_activity_id = failing_activity_id
+        self.queries = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def find(self, query, projection=None):
+        with self.lock:
+            self.queries.append(query)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.latency)
+            activity_ids = query['activity_id']['$in']
+            if self.failing_activity_id in activity_ids:
+                raise IOError('connection lost')
+            stream_types = query['type']['$in']
+            return InProcessCursor([dict(stream) for stream in self.streams
+                                    if stream['activity_id'] in activity_ids and stream['type'] in stream_types])
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class InProcessCursor(object):
+    def __init__(self, documents):
+        self.documents = documents
+
+    def batch_size(self, batch_size):
+        return iter(self.documents)
+
+
+class InProcessMongo(object):
+    def __init__(self, streams):
+        self.db = type('InProcessDatabase', (object,), {'streams': streams})()
+
+
+def _streams(activity_ids):
+    return [stream for activity_id in activity_ids for stream in [
+        {'activity_id': activity_id, 'type': 'time', 'data': [0, 1, 2]},
+        {'activity_id': activity_id, 'type': 'heartrate', 'data': [100, 110, 100 + activity_id]}
+    ]]
+
+
+class PrefetchStreamsTest(unittest.TestCase):
+
+    def test_prefetch_streams_in_order(self):
+        """Should yield the same streams as load_streams, in the order of the activity ids"""
+        mongo = InProcessMongo(InProcessStreams(_streams(range(20))))
+        activity_ids = [5, 3, 100] + list(range(10, 20))
+
+        result = list(prefetch_streams(mongo, iter(activity_ids), ['heartrate'], n_threads=3, chunk_size=2))
+        expected = list(load_streams(mongo, activity_ids, ['heartrate']))
+
+        self.assertEqual(activity_ids, [activity_id for activity_id, _ in result])
+        self.assertIsNone(result[2][1])
+        for (_, stream_df), (_, expected_stream_df) in zip(result[3:], expected[3:]):
+            self.assertTrue(stream_df.equals(expected_stream_df))
+
+    def test_prefetch_streams_concurrently(self):
+        """Should load several chunks at the same time"""
+        streams = InProcessStreams(_streams(range(12)), latency=0.05)
+
+        list(prefetch_streams(InProcessMongo(streams), range(12), ['heartrate'], n_threads=4, chunk_size=1))
+
+        self.assertEqual(12, len(streams.queries))
+        self.assertGreater(streams.max_running, 1)
+        self.assertLessEqual(streams.max_running, 4)
+
+    def test_prefetch_streams_backpressure(self):
+        """Should not request more chunks than the consumer has taken plus max_prefetched_chunks"""
+        streams = InProcessStreams(_streams(range(100)))
+
+        prefetched_streams = prefetch_streams(InProcessMongo(streams), range(100), ['heartrate'], n_threads=2,
+                                              chunk_size=5, max_prefetched_chunks=3)
+        next(prefetched_streams)
+        prefetched_streams.close()
+
+        self.assertLessEqual(len(streams.queries), 4)
+
+    def test_prefetch_streams_failing_load(self):
+        """Should raise loading errors in the consumer and stop all I/O threads"""
+        streams = InProcessStreams(_streams(range(20)), failing_activity_id=7)
+
+        result = []
+        with self.assertRaises(IOError):
+            for activity_id, _ in prefetch_streams(InProcessMongo(streams), range(20), ['heartrate'], n_threads=2,
+                                                   chunk_size=2):
+                result.append(activity_id)
+
+        self.assertEqual(list(range(6)), result)
+        self.assertFalse([thread for thread in threading.enumerate() if thread.name.startswith('pysweat-prefetch')])
+
+    def test_prefetch_compact_streams(self):
+        """Should yield CompactStreams if requested"""
+        mongo = InProcessMongo(InProcessStreams(_streams(range(2))))
+
+        result = list(prefetch_streams(mongo, [1], ['heartrate'], compact=True))
+
+        self.assertIs(type(result[0][1]), CompactStream)
+        self.assertEqual([100, 110, 101], list(result[0][1]['heartrate']))
@@ -0,0 +1,45 @@
+import unittest
+
+from mock import patch
+
+from pysweat.persistence.storage import MongoStorage, Storage
+
+
+class MongoStorageTest(unittest.TestCase):
+    @patch('pymongo.MongoClient')
+    def test_load_activities(self, mongo_mock):
+        """Should load activities with the query and projection of load_activities"""
+        mongo_mock.db.activities.find.return_value = [{'strava_id': 1, 'type': 'Run'}]
+
+        result = MongoStorage(mongo_mock).load_activities(fields=['strava_id', 'type'], type='Run')
+
+        mongo_mock.db.activities.find.assert_called_once_with({'type': 'Run'},
+                                                              {'_id': False, 'strava_id': True, 'type': True})
+        self.assertEqual([1], list(result.strava_id))
+
+    @patch('pymongo.MongoClient')
+    def test_load_stream(self, mongo_mock):
+        """Should load a single stream from the streams collection"""
+        mongo_mock.db.streams.find_one.return_value = {'activity_id': 456, 'data': [101, 102], 'type': 'heartrate'}
+
+        result = MongoStorage(mongo_mock).load_stream(456, 'heartrate')
+
+        self.assertEqual([101, 102], list(result.heartrate))
+
+    @patch('pymongo.MongoClient')
+    def test_get_first_activity_without_feature_for_type(self, mongo_mock):
+        """Should return the results of the aggregation as list"""
+        mongo_mock.db.activities.aggregate.return_value = iter([{'_id': 1, 'first_date': None}])
+
+        result = MongoStorage(mongo_mock).get_first_activity_without_feature_for_type('sum_of_turns')
+
+        self.assertEqual([{'_id': 1, 'first_date': None}], result)
+
+    def test_incomplete_backend(self):
+        """Should not instantiate a backend that does not implement all methods of the interface"""
+        class IncompleteStorage(Storage):
+            def load_activities(self, fields=None, dtypes=None, chunksize=None, **query):
+                return None
+
+        with self.assertRaises(TypeError):
+            IncompleteStorage()
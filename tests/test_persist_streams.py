@@ -1,7 +1,9 @@
 import unittest
 from mock import patch
+import numpy as np
 import pandas as pd
-from pysweat.persistence.streams import load_stream
+from pysweat.compact import CompactStream
+from pysweat.persistence.streams import load_stream, load_streams
 
 
 class StreamPersistenceTest(unittest.TestCase):
@@ -53,3 +55,85 @@ class StreamPersistenceTest(unittest.TestCase):
         result = load_stream(mongo_mock, activity_id=456, stream_type='velocity_smooth')
         self.assertEqual(len(result), 2)
         self.assertCountEqual(result.velocity_smooth, [101, 103])
+
+    @patch('pymongo.MongoClient')
+    def test_load_streams_multiple_activities_and_types(self, mongo_mock):
+        """Should load streams for multiple activities in one query, yielding one dataframe per activity"""
+        mongo_mock.db.streams.find.return_value.batch_size.return_value = iter([
+            {'activity_id': 1, 'type': 'time', 'data': [0, 1, 1]},
+            {'activity_id': 2, 'type': 'heartrate', 'data': [140, 150]},
+            {'activity_id': 1, 'type': 'heartrate', 'data': [100, 110, 120]},
+            {'activity_id': 1, 'type': 'watts', 'data': [200, 210, 220]},
+            {'activity_id': 2, 'type': 'time', 'data': [0, 2]},
+            {'activity_id': 2, 'type': 'watts', 'data': []}
+        ])
+
+        result = list(load_streams(mongo_mock, [2, 1, 3], ['heartrate', 'watts']))
+
+        mongo_mock.db.streams.find.assert_called_once_with(
+            {'activity_id': {'$in': [2, 1, 3]}, 'type': {'$in': ['time', 'heartrate', 'watts']}},
+            projection={'_id': False, 'activity_id': True, 'type': True, 'data': True})
+        self.assertEqual([2, 1, 3], [activity_id for activity_id, _ in result])
+        self.assertEqual(['heartrate'], list(result[0][1].columns))
+        self.assertEqual([0, 2], list(result[0][1].index))
+        self.assertEqual(['heartrate', 'watts'], list(result[1][1].columns))
+        self.assertEqual([0, 1], list(result[1][1].index))  # last observation for duplicate timestamps
+        self.assertEqual([120, 220], list(result[1][1].loc[1]))
+        self.assertIsNone(result[2][1])
+
+    @patch('pymongo.MongoClient')
+    def test_load_streams_in_chunks(self, mongo_mock):
+        """Should query streams per chunk of activities"""
+        mongo_mock.db.streams.find.return_value.batch_size.side_effect = lambda batch_size: iter([])
+
+        result = list(load_streams(mongo_mock, iter([1, 2, 3]), ['heartrate'], chunk_size=2))
+
+        self.assertEqual([(1, None), (2, None), (3, None)], result)
+        self.assertEqual(2, mongo_mock.db.streams.find.call_count)
+        self.assertEqual({'$in': [3]}, mongo_mock.db.streams.find.call_args[0][0]['activity_id'])
+
+    @patch('pymongo.MongoClient')
+    def test_load_streams_malformed(self, mongo_mock):
+        """Should yield None with a warning for activities with malformed streams, and load the other activities"""
+        for compact in (False, True):
+            mongo_mock.db.streams.find.return_value.batch_size.return_value = iter([
+                {'activity_id': 1, 'type': 'time', 'data': [0, 1, 2]},
+                {'activity_id': 1, 'type': 'heartrate', 'data': [100, 110]},
+                {'activity_id': 2, 'type': 'time', 'data': [0, 1]},
+                {'activity_id': 2, 'type': 'heartrate', 'data': [120, 130]}
+            ])
+
+            with self.assertLogs(level='WARNING'):
+                result = list(load_streams(mongo_mock, [1, 2], ['heartrate'], compact=compact))
+
+            self.assertIsNone(result[0][1])
+            self.assertEqual([120, 130], list(result[1][1]['heartrate']))
+
+    @patch('pymongo.MongoClient')
+    def test_load_stream_compact(self, mongo_mock):
+        """Should load single stream as CompactStream, keeping the last observation for duplicate timestamps"""
+        mongo_mock.db.streams.find_one.side_effect = [
+            {'activity_id': 456, 'type': 'time', 'data': [0, 1, 1, 2]},
+            {'activity_id': 456, 'type': 'latlng', 'data': [[52.1, 5.3], [52.2, 5.4], [52.3, 5.5], None]}
+        ]
+
+        result = load_stream(mongo_mock, activity_id=456, stream_type='latlng', compact=True)
+
+        self.assertIs(type(result), CompactStream)
+        self.assertEqual([0, 1, 2], list(result.time))
+        self.assertEqual([52.3, 5.5], list(result.latlng[1]))
+        self.assertTrue(np.isnan(result.latlng[2]).all())
+
+    @patch('pymongo.MongoClient')
+    def test_load_streams_compact(self, mongo_mock):
+        """Should yield CompactStreams with one channel per stream type"""
+        mongo_mock.db.streams.find.return_value.batch_size.return_value = iter([
+            {'activity_id': 1, 'type': 'time', 'data': [0, 2, 1]},
+            {'activity_id': 1, 'type': 'heartrate', 'data': [100, 120, 110]}
+        ])
+
+        result = list(load_streams(mongo_mock, [1], ['heartrate', 'watts'], compact=True))
+
+        self.assertEqual(['heartrate'], result[0][1].columns)
+        self.assertEqual([0, 1, 2], list(result[0][1].time))
+        self.assertEqual([100, 110, 120], list(result[0][1]['heartrate']))
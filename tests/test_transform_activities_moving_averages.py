@@ -96,3 +96,43 @@ class ActivityMovingAverageTransformationTest(unittest.TestCase):
                          list(compute_moving_averages(self.test_activities,
                                                       feature_name='test_var',
                                                       window_days=2).test_var_2))
+
+    def test_compute_moving_averages_per_athlete(self):
+        """Should only average activities of the same athlete"""
+        self.test_activities['athlete_id'] = [1, 2, 1]
+
+        self.assertEqual([1, 2, 3.5],
+                         list(compute_moving_averages(self.test_activities,
+                                                      feature_name='test_var',
+                                                      window_days=2).test_var_2))
+
+    def test_compute_moving_averages_missing_athlete(self):
+        """Should average activities without athlete as a separate group"""
+        self.test_activities['athlete_id'] = [np.nan, 2, np.nan]
+
+        self.assertEqual([1, 2, 3.5],
+                         list(compute_moving_averages(self.test_activities,
+                                                      feature_name='test_var',
+                                                      window_days=2).test_var_2))
+
+    def test_compute_moving_averages_multiple_features_and_windows(self):
+        """Should compute moving averages for all given features and windows, retaining existing moving averages"""
+        transform_result = compute_moving_averages(self.test_activities,
+                                                   feature_name=['test_var', 'average_speed'],
+                                                   window_days=[2, 28])
+
+        self.assertEqual(3, len(transform_result))
+        self.assertEqual([1, 1.5, 3], list(transform_result.test_var_2))
+        self.assertEqual([1, 1.5, 2.5], list(transform_result.test_var_28))
+        np.testing.assert_almost_equal([18, 20, 46 / 3], list(transform_result.average_speed_2))
+        self.assertEqual([18, 20, 16], list(transform_result.average_speed_28))
+
+    def test_compute_moving_averages_nan_in_window(self):
+        """Should return NaN for windows containing NaN values"""
+        self.test_activities.loc[1, 'test_var'] = np.nan
+
+        moving_averages = compute_moving_averages(self.test_activities, feature_name='test_var', window_days=2)
+
+        self.assertEqual(1, moving_averages.test_var_2[0])
+        self.assertTrue(np.isnan(moving_averages.test_var_2[1]))
+        self.assertTrue(np.isnan(moving_averages.test_var_2[2]))
@@ -41,3 +41,42 @@ class GPSTransformationTest(unittest.TestCase):
         foobar_df = pd.DataFrame({'foo': [1, 2, 3]}, index=[1, 2, 3])
 
         self.assertRaises(KeyError, gps.lat_long_to_x_y, foobar_df)
+
+    def test_latlong_to_x_y_separate_lat_long_columns(self):
+        """Should use separate latitude and longitude columns if provided"""
+        latlong_df = pd.DataFrame({'lat': [52.1, 52.2, np.nan, 52.3], 'lng': [5.3, 5.4, 5.6, 5.5]}, index=[1, 2, 3, 4])
+
+        transform_result = gps.lat_long_to_x_y(latlong_df, lat_colname='lat', lng_colname='lng')
+
+        self.assertEqual(list(transform_result.columns.values), ['lat', 'lng', 'x', 'y'])
+        self.assertEqual([1, 2, 4], list(transform_result.index.values))
+        np.testing.assert_almost_equal(list(transform_result.x.values), [0.057, 0.058, 0.059], 3)
+        np.testing.assert_almost_equal(list(transform_result.y.values), [0.909, 0.911, 0.913], 3)
+
+    def test_project_lat_long_array(self):
+        """Should project (n, 2) array of lat-long values to x and y arrays"""
+        x, y = gps.project_lat_long(np.array([[52.1, 5.3], [52.2, 5.4], [52.3, 5.5]]))
+
+        np.testing.assert_almost_equal(x, [0.057, 0.058, 0.059], 3)
+        np.testing.assert_almost_equal(y, [0.909, 0.911, 0.913], 3)
+
+    def test_haversine_distance(self):
+        """Should compute distance in meters to previous observation"""
+        latlong_df = pd.DataFrame({'latlng': [[52.0, 5.0], [52.001, 5.0], None, [52.001, 5.001]]}, index=[1, 2, 3, 5])
+
+        transform_result = gps.haversine_distance(latlong_df)
+
+        self.assertEqual(list(transform_result.columns.values), ['latlng', 'haversine_distance'])
+        self.assertEqual([1, 2, 5], list(transform_result.index.values))
+        self.assertTrue(np.isnan(transform_result.haversine_distance[1]))
+        self.assertAlmostEqual(111.2, transform_result.haversine_distance[2], 1)
+        self.assertAlmostEqual(68.5, transform_result.haversine_distance[5], 1)
+
+    def test_haversine_distance_with_speed(self):
+        """Should compute speed in meters per second using the index as number of seconds"""
+        latlong_df = pd.DataFrame({'latlng': [[52.0, 5.0], [52.001, 5.0], [52.002, 5.0]]}, index=[1, 2, 12])
+
+        transform_result = gps.haversine_distance(latlong_df, include_speed=True)
+
+        self.assertAlmostEqual(111.2, transform_result.haversine_speed[2], 1)
+        self.assertAlmostEqual(11.12, transform_result.haversine_speed[12], 2)
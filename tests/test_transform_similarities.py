@@ -1,8 +1,10 @@
 import unittest
 
+import numpy as np
 import pandas as pd
 
-from pysweat.transformation.similarities import cosine_similarity, cosine_to_deviation
+from pysweat.transformation.similarities import cosine_similarity, cosine_similarities, cosine_to_deviation, \
+    euclidean_distance, euclidean_distances, vectorized_similarity
 
 
 class SimilarityTransformationTest(unittest.TestCase):
@@ -48,6 +50,45 @@ class SimilarityTransformationTest(unittest.TestCase):
 
         self.assertAlmostEqual(cosine_similarity(v1, v2), 1, 9)
 
+    def test_cosine_similarities(self):
+        """Should compute cosine similarity per row, equal to the pairwise cosine similarity"""
+        vs1 = np.array([[1, 1], [1, 1], [1, 1], [1, 2]])
+        vs2 = np.array([[2, 2], [2, -2], [-2, -2], [3, 1]])
+
+        similarities = cosine_similarities(vs1, vs2)
+
+        self.assertEqual(4, len(similarities))
+        for i in range(len(vs1)):
+            self.assertAlmostEqual(cosine_similarity(vs1[i], vs2[i]), similarities[i], 12)
+
+    def test_cosine_similarities_clipping_and_nan(self):
+        """Should clip to [-1, 1] and return NaN for vectors without a direction"""
+        vs1 = np.array([[0.0000015006504264572506635033732891315594, 0.0000006050474740115774352489097509533167],
+                        [0, 0],
+                        [np.nan, 1]])
+        vs2 = np.array([[0.0000015006504264503117695994660607539117, 0.0000006050474739005551327863940969109535],
+                        [1, 1],
+                        [1, 1]])
+
+        similarities = cosine_similarities(vs1, vs2)
+
+        self.assertTrue(similarities[0] <= 1)
+        self.assertTrue(np.isnan(similarities[1]))
+        self.assertTrue(np.isnan(similarities[2]))
+
+    def test_euclidean_distances(self):
+        """Should compute euclidean distance per row, equal to the pairwise euclidean distance"""
+        vs1 = np.array([[0, 0], [1, 1]])
+        vs2 = np.array([[3, 4], [1, 1]])
+
+        self.assertListEqual([5, 0], euclidean_distances(vs1, vs2).tolist())
+        self.assertEqual(5, euclidean_distance(vs1[0], vs2[0]))
+
+    def test_vectorized_similarity(self):
+        """Should return row-wise equivalent of known similarity functions, None for other functions"""
+        self.assertIs(cosine_similarities, vectorized_similarity(cosine_similarity))
+        self.assertIsNone(vectorized_similarity(lambda v1, v2: 0))
+
     def test_cosine_to_deviation(self):
         """Should return normalized angle between vectors, given a cosine similarity"""
         test_df = pd.DataFrame({'cos': [1, 0, -1, 0.5]})
@@ -4,6 +4,7 @@ import arrow
 import numpy as np
 import pandas as pd
 import pysweat.transformation.streams as streams
+from pysweat.compact import CompactStream
 from pysweat.transformation.similarities import cosine_similarity
 
 
@@ -100,3 +101,87 @@ class StreamTransformationTest(unittest.TestCase):
         self.assertTrue(np.isnan(transform_result.cosine_similarity_dx_dt_dy_dt[0]))
         self.assertAlmostEqual(transform_result.cosine_similarity_dx_dt_dy_dt[1], 1.0, 9)
         self.assertAlmostEqual(transform_result.cosine_similarity_dx_dt_dy_dt[2], 0, 9)
+
+    def test_rolling_similarity_custom_similarity_function(self):
+        """Should apply similarity functions without vectorized equivalent per pair of vectors"""
+        def dot_product(v1, v2):
+            return np.dot(v1, v2)
+
+        test_df = pd.DataFrame({'dx_dt': [1, 1, 1], 'dy_dt': [1, 2, -1]})
+
+        transform_result = streams.rolling_similarity(test_df, dot_product, 'dx_dt', 'dy_dt')
+
+        self.assertTrue(np.isnan(transform_result.dot_product_dx_dt_dy_dt[0]))
+        self.assertEqual(3, transform_result.dot_product_dx_dt_dy_dt[1])
+        self.assertEqual(-1, transform_result.dot_product_dx_dt_dy_dt[2])
+
+    def test_resample(self):
+        """Should interpolate all columns onto a grid of integer seconds from the first to the last observation"""
+        test_df = pd.DataFrame({'x': [0, 10, 40], 'y': [1, np.nan, 4]}, index=[1, 2, 5])
+
+        resample_result = streams.resample(test_df)
+
+        self.assertEqual([1, 2, 3, 4, 5], list(resample_result.index))
+        self.assertEqual([0, 10, 20, 30, 40], list(resample_result.x))
+        self.assertEqual([1, 1.75, 2.5, 3.25, 4], list(resample_result.y))
+
+    def test_resample_methods(self):
+        """Should resample to the last observed or the nearest value for the respective methods"""
+        test_df = pd.DataFrame({'x': [0, 10, 40]}, index=[1, 2, 6])
+
+        self.assertEqual([0, 10, 10, 10, 10, 40], list(streams.resample(test_df, method='previous').x))
+        self.assertEqual([0, 10, 10, 10, 40, 40], list(streams.resample(test_df, method='nearest').x))
+        with self.assertRaises(ValueError):
+            streams.resample(test_df, method='cubic')
+
+    def test_resample_gaps(self):
+        """Should not resample values within gaps longer than max_gap, or mark them in a pause column if provided"""
+        test_df = pd.DataFrame({'x': [0, 10, 40, 50]}, index=[0, 2, 6, 7])
+
+        resample_result = streams.resample(test_df, max_gap=2)
+        pause_result = streams.resample(test_df, max_gap=2, pause_colname='paused')
+
+        np.testing.assert_array_equal([0, 5, 10, np.nan, np.nan, np.nan, 40, 50], resample_result.x.values)
+        self.assertEqual(['x', 'paused'], list(pause_result.columns))
+        self.assertEqual([0, 5, 10, 17.5, 25, 32.5, 40, 50], list(pause_result.x))
+        self.assertEqual([False, False, False, True, True, True, False, False], list(pause_result.paused))
+        with self.assertRaises(ValueError):
+            streams.resample(test_df, pause_colname='paused')
+
+    def test_resample_lat_long(self):
+        """Should interpolate lat-long values per coordinate and keep them as 2-element lists"""
+        test_df = pd.DataFrame({'latlng': [[52.0, 5.0], None, [52.2, 5.4]]}, index=[0, 1, 2])
+
+        resample_result = streams.resample(test_df, columns=['latlng'])
+
+        np.testing.assert_allclose([52.1, 5.2], resample_result.latlng[1])
+
+    def test_resample_compact_stream(self):
+        """Should resample compact streams to the same values as the equivalent dataframe"""
+        random = np.random.RandomState(42)
+        test_df = pd.DataFrame({'x': random.normal(size=100), 'latlng': random.normal(size=(100, 2)).tolist()},
+                               index=np.cumsum(random.choice([1, 2, 30], size=100)))
+
+        resample_result = streams.resample(CompactStream.from_df(test_df), max_gap=10).to_df(lat_long_colname='latlng')
+
+        pd.testing.assert_frame_equal(streams.resample(test_df, max_gap=10), resample_result, check_dtype=False)
+
+    def test_resample_compact_stream_columns_and_order(self):
+        """Should sort unsorted compact streams and only resample the given columns, including lat-long values"""
+        stream = CompactStream(np.array([0, 4, 2]), channels={'hr': np.array([100., 140., 120.])},
+                               latlng=np.array([[52.0, 5.0], [52.4, 5.4], [52.2, 5.2]]))
+
+        resample_result = streams.resample(stream, columns=['hr'])
+
+        self.assertEqual([100, 110, 120, 130, 140], list(resample_result['hr']))
+        self.assertEqual(['hr'], resample_result.columns)
+        np.testing.assert_allclose([52.1, 5.1], streams.resample(stream, columns=['latlng']).latlng[1])
+
+    def test_resample_then_smooth(self):
+        """Should allow fixed-size smoothing windows equivalent to time-based windows on the resampled stream"""
+        test_df = pd.DataFrame({'x': [1, 2, 4, 8]}, index=[0, 1, 3, 4])
+
+        resample_result = streams.smooth(streams.resample(test_df), window_size=2)
+
+        np.testing.assert_array_equal(streams.smooth(streams.resample(test_df), window_size=2, use_index=True)
+                                      .x_smooth.values[1:], resample_result.x_smooth.values[1:])
@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pysweat.transformation.training_load import daily_loads, training_load, training_load_state
+
+test_activities = pd.DataFrame({
+    'athlete_id': [1, 1, 1, 2, 2, 1],
+    'start_date_local': pd.to_datetime(['2015-05-01 08:00', '2015-05-01 18:00', '2015-05-03 09:00',
+                                        '2015-05-02 10:00', '2015-05-05 07:00', '2015-05-06 12:00']),
+    'suffer_score': [10, 20, 40, 70, np.nan, 14]
+})
+
+
+def _reference_training_load(activity_df, end_date, acute_days=7, chronic_days=42):
+    """Day-by-day computation of the training load of each athlete, starting at its first activity"""
+    rows = []
+    for athlete_id, athlete_activity_df in activity_df.groupby('athlete_id'):
+        loads = athlete_activity_df.groupby(athlete_activity_df.start_date_local.dt.normalize()).suffer_score.sum()
+        atl, ctl = 0., 0.
+        for date in pd.date_range(loads.index.min(), end_date):
+            load = loads.get(date, 0.)
+            tsb = ctl - atl
+            atl += (load - atl) / acute_days
+            ctl += (load - ctl) / chronic_days
+            rows.append((athlete_id, date, load, atl, ctl, tsb))
+    return pd.DataFrame(rows, columns=['athlete_id', 'date', 'load', 'atl', 'ctl', 'tsb'])
+
+
+class TrainingLoadTest(unittest.TestCase):
+    def test_daily_loads(self):
+        """Should sum the loads per athlete and day, with 0 for days without activities"""
+        daily_load_df = daily_loads(test_activities, 'suffer_score')
+
+        self.assertEqual(list(pd.date_range('2015-05-01', '2015-05-06')), list(daily_load_df.index))
+        self.assertEqual([30, 0, 40, 0, 0, 14], list(daily_load_df[1]))
+        self.assertEqual([0, 70, 0, 0, 0, 0], list(daily_load_df[2]))
+
+    def test_training_load(self):
+        """Should compute the same loads as a day-by-day computation per athlete, from the first activity onwards"""
+        training_load_df = training_load(test_activities, 'suffer_score')
+
+        pd.testing.assert_frame_equal(_reference_training_load(test_activities, '2015-05-06'), training_load_df)
+
+    def test_training_load_first_day(self):
+        """Should start from zero load before the first activity, with zero training stress balance"""
+        training_load_df = training_load(test_activities, 'suffer_score', acute_days=2, chronic_days=4)
+
+        first_day = training_load_df.iloc[0]
+        self.assertEqual((30 / 2., 30 / 4., 0), (first_day.atl, first_day.ctl, first_day.tsb))
+        self.assertEqual(30 / 4. - 30 / 2., training_load_df.tsb.iloc[1])
+
+    def test_training_load_end_date(self):
+        """Should decay the loads until the given end date"""
+        training_load_df = training_load(test_activities, 'suffer_score', end_date='2015-05-10')
+
+        pd.testing.assert_frame_equal(_reference_training_load(test_activities, '2015-05-10'), training_load_df)
+
+    def test_training_load_incremental(self):
+        """Should continue from the state of a previous computation, only using the activities after its date"""
+        previous_df = training_load(test_activities[:4], 'suffer_score', end_date='2015-05-03')
+        new_activities = pd.concat([test_activities, pd.DataFrame({
+            'athlete_id': [3], 'start_date_local': pd.to_datetime(['2015-05-05']), 'suffer_score': [50]
+        })], ignore_index=True)
+
+        training_load_df = training_load(new_activities, 'suffer_score', state_df=training_load_state(previous_df))
+
+        self.assertEqual('2015-05-04', str(training_load_df.date.min().date()))
+        pd.testing.assert_frame_equal(_reference_training_load(new_activities, '2015-05-06'),
+                                      pd.concat([previous_df, training_load_df])
+                                      .sort_values(['athlete_id', 'date'], ignore_index=True))
+
+    def test_training_load_state(self):
+        """Should return the date and loads of the last day per athlete"""
+        state_df = training_load_state(training_load(test_activities, 'suffer_score'))
+
+        self.assertEqual([1, 2], list(state_df.index))
+        self.assertEqual(['date', 'atl', 'ctl'], list(state_df.columns))
+        self.assertTrue((state_df.date == pd.Timestamp('2015-05-06')).all())
+
+    def test_training_load_up_to_date_state(self):
+        """Should return no rows if the state is as recent as the end date"""
+        state_df = training_load_state(training_load(test_activities, 'suffer_score'))
+
+        self.assertEqual(0, len(training_load(test_activities, 'suffer_score', state_df=state_df)))
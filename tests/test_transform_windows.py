@@ -1,5 +1,9 @@
 import unittest
-from pysweat.transformation.windows import subtract_n_minutes
+
+import numpy as np
+
+from pysweat.transformation.windows import subtract_n_minutes, sliding_minima, trailing_time_window_minima, \
+    time_rolling
 
 
 class WindowsTransformTest(unittest.TestCase):
@@ -18,3 +22,65 @@ class WindowsTransformTest(unittest.TestCase):
     def test_subtract_1_minute(self):
         """Should return result for a provided amount of minutes to be subtracted"""
         self.assertEqual(subtract_n_minutes(423, 1), 363)
+
+    def test_sliding_minima(self):
+        """Should return the minimum within each window given by its start and end positions"""
+        minima = sliding_minima([3, 1, 2, 5, 4], lefts=[[0, 0, 1, 2, 3]], rights=[1, 2, 3, 4, 5])
+
+        self.assertEqual((1, 5), minima.shape)
+        self.assertListEqual([3, 1, 1, 2, 4], minima[0].tolist())
+
+    def test_sliding_minima_ignores_nan(self):
+        """Should ignore NaN values, and return NaN for windows without valid values"""
+        minima = sliding_minima([np.nan, 2, np.nan, np.nan], lefts=[[0, 0, 2, 3]], rights=[1, 2, 3, 4])
+
+        self.assertTrue(np.isnan(minima[0, 0]))
+        self.assertEqual(2, minima[0, 1])
+        self.assertTrue(np.isnan(minima[0, 2]))
+        self.assertTrue(np.isnan(minima[0, 3]))
+
+    def test_trailing_time_window_minima_multiple_windows_and_columns(self):
+        """Should compute minima over closed trailing time windows for all windows and columns at once"""
+        values = np.array([[100, 200], [115, 190], [120, 220], [100, 210]])
+
+        minima = trailing_time_window_minima([0, 60, 120, 180], values, [60, 120])
+
+        self.assertEqual((2, 4, 2), minima.shape)
+        self.assertListEqual([100, 100, 115, 100], minima[0, :, 0].tolist())
+        self.assertListEqual([200, 190, 190, 210], minima[0, :, 1].tolist())
+        self.assertListEqual([100, 100, 100, 100], minima[1, :, 0].tolist())
+        self.assertListEqual([200, 190, 190, 190], minima[1, :, 1].tolist())
+
+    def test_time_rolling_mean_backward(self):
+        """Should compute mean over (t - window_size, t], based on the provided seconds"""
+        result = time_rolling([1, 4, 5, 7], [1, 2, 3, 4], window_size=2)
+
+        self.assertListEqual([1, 2, 2.5, 4], result.tolist())
+
+    def test_time_rolling_sum_forward(self):
+        """Should compute sum over [t, t + window_size)"""
+        result = time_rolling([1, 2, 5, 8, 9, 11, 12, 13], [1, 0, 1, 1, 2, 1, 0, 0], window_size=3, statistic='sum',
+                              direction='forward')
+
+        self.assertListEqual([1, 0, 1, 3, 3, 1, 0, 0], result.tolist())
+
+    def test_time_rolling_centered_min_max(self):
+        """Should compute minimum and maximum over (t - window_size / 2, t + window_size / 2]"""
+        seconds = [0, 1, 2, 3, 5]
+        values = [3, 1, 4, 1, 5]
+
+        self.assertListEqual([1, 1, 1, 1, 5], time_rolling(seconds, values, 2, 'min', 'centered').tolist())
+        self.assertListEqual([3, 4, 4, 1, 5], time_rolling(seconds, values, 2, 'max', 'centered').tolist())
+
+    def test_time_rolling_ignores_nan(self):
+        """Should ignore NaN values, and return NaN for windows without valid values"""
+        result = time_rolling([1, 2, 3, 10], [1, np.nan, 3, np.nan], window_size=2)
+
+        self.assertListEqual([1, 1, 3], result[:3].tolist())
+        self.assertTrue(np.isnan(result[3]))
+
+    def test_time_rolling_invalid_arguments(self):
+        """Should raise ValueError for unsorted seconds, unknown statistics and unknown directions"""
+        self.assertRaises(ValueError, time_rolling, [2, 1], [1, 2], 2)
+        self.assertRaises(ValueError, time_rolling, [1, 2], [1, 2], 2, statistic='median')
+        self.assertRaises(ValueError, time_rolling, [1, 2], [1, 2], 2, direction='sideways')